@@ -1,30 +1,167 @@
-from flask import Flask, request, jsonify
+import math
+import time
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
-from core.recommend import recommend_core, health_info
+from core import deadline, timing, tracelog
+from core.config import SERVER_TIMING, EXPORT_BATCH, HTTP_ETAG, DEADLINE_MS
+from core.export import export_stream, FORMATS
+from core.fragments import negotiate, render
+from core.recommend import health_info, ARTIFACT_ERRORS, ARTIFACT_WARNINGS
+from core.service import recommend, recommend_by_spec, meta_for, service_metrics, start_changefeed, etag_for, cache_control, touch
+from core.warmup import start_warmup, readiness, is_ready, WARMUP_STATE
 
 app = Flask(__name__)
 CORS(app)
+start_warmup()
+start_changefeed()
+tracelog.start()
+
+_BUDGETED = {"recommend_path", "recommend_query", "recommend_spec"}
+
+@app.before_request
+def _begin_timing():
+    if SERVER_TIMING or tracelog.ENABLED:
+        g.t0 = time.perf_counter()
+        timing.begin()
+    deadline.begin(DEADLINE_MS / 1e3 if request.endpoint in _BUDGETED else None)
+
+@app.after_request
+def _server_timing(resp):
+    d = timing.current()
+    if d is not None and "t0" in g:
+        d["total"] = time.perf_counter() - g.t0
+        if SERVER_TIMING:
+            resp.headers["Server-Timing"] = timing.header(d)
+        tracelog.record(request.endpoint, resp.status_code, d["total"], d, timing.notes(), deadline.reasons())
+    return resp
+
+@app.get("/livez")
+def livez():
+    """Process còn phục vụ được HTTP (không chạm DB / index)."""
+    return jsonify({"ok": True})
+
+@app.get("/readyz")
+def readyz():
+    """200 khi artifact hợp lệ, DB đã kết nối và warmup xong; 503 nếu chưa (orchestrator chưa route traffic)."""
+    checks = readiness()
+    ready = all(checks.values())
+    body = {"ready": ready, "checks": checks, "warmup": WARMUP_STATE}
+    if ARTIFACT_ERRORS or ARTIFACT_WARNINGS:
+        body["artifacts"] = {"errors": ARTIFACT_ERRORS, "warnings": ARTIFACT_WARNINGS}
+    return jsonify(body), 200 if ready else 503
 
 @app.get("/health")
 def health():
-    return jsonify(health_info())
+    return jsonify({**health_info(), "ready": is_ready(), "warmup": WARMUP_STATE})
 
-@app.get("/recommend/<int:variation_id>")
-def recommend_path(variation_id: int):
-    out, code = recommend_core(variation_id)
+@app.get("/metrics")
+def metrics():
+    return jsonify(service_metrics())
+
+def _render(out, code, fmt):
+    if code == 503:
+        return jsonify({"error": "variation lookup unavailable", "degraded": list(deadline.reasons())}), code, {"Retry-After": "1"}
     if out is None:
         return jsonify({"error": "variation_id not found"}), code
-    return jsonify(out), code
+    meta = meta_for if "meta" in request.args.get("include", "").split(",") else None
+    body, mimetype = render(out, fmt, meta)
+    return Response(body, status=code, mimetype=mimetype)
+
+def _serve(var_id: int):
+    """If-None-Match khớp ETag hiện tại -> 304, không chạy recommend_core."""
+    fmt = negotiate(request.args.get("format", ""), request.accept_mimetypes)
+    if fmt is None:
+        return jsonify({"error": "msgpack is not available"}), 406
+    if not HTTP_ETAG:
+        return _degraded(app.make_response(_render(*recommend(var_id), fmt)))
+    meta = "meta" if "meta" in request.args.get("include", "").split(",") else ""
+    tag = etag_for(var_id, f"{meta}:{fmt}" if fmt != "json" else meta)
+    if request.if_none_match.contains(tag):
+        touch(var_id)
+        resp = app.response_class(status=304)
+    else:
+        out, code = recommend(var_id)
+        resp = app.make_response(_render(out, code, fmt))
+        if code != 200 or deadline.reasons():
+            return _degraded(resp)
+    resp.set_etag(tag)
+    resp.headers["Cache-Control"] = cache_control()
+    resp.vary.add("Accept")
+    return resp
+
+def _degraded(resp):
+    """Kết quả thiếu nguồn do hết ngân sách: báo qua header, không để proxy / browser cache."""
+    reasons = deadline.reasons()
+    if reasons:
+        resp.headers["X-Recs-Degraded"] = ",".join(reasons)
+        resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.get("/recommend/<int:variation_id>")
+def recommend_path(variation_id: int):
+    return _serve(variation_id)
 
 @app.get("/recommend")
 def recommend_query():
     var_id = request.args.get("variation_id", type=int)
     if var_id is None:
         return jsonify({"error": "variation_id is required"}), 400
-    out, code = recommend_core(var_id)
-    if out is None:
-        return jsonify({"error": "variation_id not found"}), code
-    return jsonify(out), code
+    return _serve(var_id)
+
+_SPEC_FIELDS = (("processor", "cpu"), ("graphics_card", "gpu"), ("ram", None), ("storage", None))
+
+def _spec_args(body):
+    """Body JSON -> tuple tham số của recommend_spec, hoặc (None, lỗi)."""
+    if not isinstance(body, dict):
+        return None, "JSON object body is required"
+    price = body.get("price")
+    try:
+        if isinstance(price, bool) or not isinstance(price, (int, float, str)):   # float(true) == 1.0
+            raise TypeError
+        price = float(price)
+    except (TypeError, ValueError):
+        return None, "price is required"
+    if not (math.isfinite(price) and price > 0):        # NaN / Infinity / 1e400 làm hỏng scaler
+        return None, "price must be a finite number > 0"
+    fields = []
+    for name, alias in _SPEC_FIELDS:
+        v = body.get(name, body.get(alias) if alias else None)
+        if v is not None and not isinstance(v, (str, int, float)):
+            return None, f"{name} must be a string"
+        fields.append("" if v is None else str(v).strip())
+    exclude = body.get("exclude_product_id")
+    if exclude is not None and (isinstance(exclude, bool) or not isinstance(exclude, int)):
+        return None, "exclude_product_id must be an integer"
+    return (price, *fields, exclude), None
+
+@app.post("/recommend/by-spec")
+def recommend_spec():
+    """Gợi ý cho cấu hình chưa có trong DB: {"price", "processor"|"cpu", "graphics_card"|"gpu", "ram", "storage"}."""
+    fmt = negotiate(request.args.get("format", ""), request.accept_mimetypes)
+    if fmt is None:
+        return jsonify({"error": "msgpack is not available"}), 406
+    spec, err = _spec_args(request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err}), 400
+    out, scored = recommend_by_spec(spec)
+    meta = meta_for if "meta" in request.args.get("include", "").split(",") else None
+    body, mimetype = render(out, fmt, meta, extra={"spec": scored})
+    return _degraded(Response(body, mimetype=mimetype))
+
+@app.get("/export")
+def export():
+    """Stream gợi ý cho toàn catalog (hoặc một shard / khoảng id), xem core/export.py."""
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(FORMATS)}"}), 400
+    shards = request.args.get("shards", type=int)
+    shard = request.args.get("shard", 0, type=int)
+    if shards is not None and not (shards > 0 and 0 <= shard < shards):
+        return jsonify({"error": "require 0 <= shard < shards"}), 400
+    gen = export_stream(fmt, min_id=request.args.get("min_id", type=int),
+                        max_id=request.args.get("max_id", type=int), shard=shard, shards=shards,
+                        batch=request.args.get("batch", EXPORT_BATCH, type=int))
+    return Response(stream_with_context(gen), mimetype=FORMATS[fmt])
 
 if __name__ == "__main__":
     import os
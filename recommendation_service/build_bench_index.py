@@ -0,0 +1,31 @@
+"""
+Compile cpu/gpu_benchmark.json -> artifacts/bench_index.npz (xem core/bench.py).
+
+    python build_bench_index.py [--domain all|consumer]
+
+Artifact ghi digest của JSON nguồn + domain: JSON đổi mà chưa build lại thì
+bench.py tự bỏ qua artifact và đọc JSON như cũ.
+"""
+import argparse
+from core.config import CPU_JSON_PATH, GPU_JSON_PATH, BENCH_INDEX_PATH, BENCH_DOMAIN
+from core.bench import build_bench_index, save_bench_index
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cpu", default=CPU_JSON_PATH)
+    ap.add_argument("--gpu", default=GPU_JSON_PATH)
+    ap.add_argument("--out", default=BENCH_INDEX_PATH)
+    ap.add_argument("--domain", default=BENCH_DOMAIN, choices=["all", "consumer"])
+    args = ap.parse_args()
+
+    art = build_bench_index(args.cpu, args.gpu, args.domain)
+    save_bench_index(art, args.out)
+    cpu_lo, cpu_hi = art["cpu_bounds"].tolist()
+    gpu_lo, gpu_hi = art["gpu_bounds"].tolist()
+    print(f"Saved {args.out}: domain={args.domain} cpu={art['cpu_scores'].shape[0]} (P5/P95 {cpu_lo:.1f}/{cpu_hi:.1f}) "
+          f"gpu={art['gpu_scores'].shape[0]} (P5/P95 {gpu_lo:.1f}/{gpu_hi:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Build IVF artifact (knn_ivf.npz) từ knn_X_all.npy đã train.
+
+    python build_ivf.py [--nlist 0] [--seed 0]
+"""
+import argparse
+import os
+import numpy as np
+from core.config import XALL_PATH, IVF_PATH, IVF_NLIST
+from core.ivf import build_ivf, save_ivf
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--xall", default=XALL_PATH)
+    ap.add_argument("--out", default=IVF_PATH)
+    ap.add_argument("--nlist", type=int, default=IVF_NLIST, help="0 = auto (sqrt(N))")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    X = np.load(args.xall)
+    art = build_ivf(X, nlist=args.nlist, seed=args.seed)
+    save_ivf(art, args.out)
+    sizes = np.diff(art["offsets"])
+    print(f"Saved {args.out}: N={X.shape[0]} nlist={len(sizes)} "
+          f"cell size min/median/max={sizes.min()}/{int(np.median(sizes))}/{sizes.max()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Chia index đã train thành shard theo khoảng giá (artifacts/shards/, xem core/shards.py).
+
+    python build_shards.py [--shards 4] [--out artifacts/shards]
+"""
+import argparse
+import numpy as np
+from core.config import DF_PATH, XALL_PATH, VARIDS_PATH, SHARDS, SHARDS_DIR
+from core.catalog import load_catalog
+from core.shards import build_shards, save_shards
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", type=int, default=SHARDS)
+    ap.add_argument("--out", default=SHARDS_DIR)
+    args = ap.parse_args()
+
+    df = load_catalog(DF_PATH)
+    X = np.load(XALL_PATH)
+    var_ids = np.load(VARIDS_PATH)
+    manifest, shards = build_shards(X, var_ids, df["price"].to_numpy(), df["performance_score"].to_numpy(),
+                                    df["product_id"].to_numpy(), args.shards)
+    save_shards(manifest, shards, args.out)
+    for i, e in enumerate(manifest["shards"]):
+        print(f"shard {i}: {e['n']} items, price {e['price_min']:.0f} - {e['price_max']:.0f}")
+    print(f"Saved {args.out}/manifest.json ({manifest['n_shards']} shards)")
+
+
+if __name__ == "__main__":
+    main()
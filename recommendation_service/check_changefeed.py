@@ -0,0 +1,127 @@
+"""
+Kiểm tra change feed end-to-end trên Postgres thật (core/changefeed.py ->
+apply_variation_changes). Dữ liệu bị sửa được trả lại như cũ khi kết thúc.
+
+    DATABASE_URL=postgresql://... python check_changefeed.py [--variation-id 123] [--timeout 10]
+
+Các bước:
+    1. áp dụng migrations/001_recs_variation_notify.sql
+    2. chạy ChangeFeed(apply_variation_changes) trong process
+    3. UPDATE giá một biến thể có trong index: dòng cũ bị tombstone, bản mới vào
+       DELTA với giá mới, kết quả recommend của nó đổi
+    4. UPDATE tên product của biến thể đó: mọi biến thể của product bị tombstone
+       và vào DELTA với tên mới
+Exit 1 nếu có bước không đạt.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+MIGRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations", "001_recs_variation_notify.sql")
+SUFFIX = " [recs-check]"
+
+
+def _wait(cond, timeout: float) -> bool:
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return cond()
+
+
+def _ids(out):
+    return [int(x["variation_id"]) for x in out or []]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--variation-id", type=int, help="biến thể có trong index (mặc định: biến thể đầu tiên còn bán)")
+    ap.add_argument("--timeout", type=float, default=10.0, help="giây chờ mỗi thay đổi được áp dụng")
+    args = ap.parse_args()
+    if not os.getenv("DATABASE_URL"):
+        raise SystemExit("DATABASE_URL missing")
+
+    import psycopg2
+    from core import recommend as R
+    from core.changefeed import ChangeFeed, _dsn
+    from core.config import DB_URL
+
+    conn = psycopg2.connect(_dsn(DB_URL))
+    conn.autocommit = True
+    cur = conn.cursor()
+    with open(MIGRATION) as f:
+        cur.execute(f.read())
+    print(f"applied {os.path.basename(MIGRATION)}")
+
+    vid = args.variation_id
+    if vid is None:
+        cur.execute("SELECT variation_id FROM product_variations WHERE is_available AND variation_id = ANY(%s) "
+                    "ORDER BY variation_id LIMIT 1", (R.DF["variation_id"].tolist()[:1000],))
+        one = cur.fetchone()
+        if one is None:
+            raise SystemExit("không có biến thể nào của index còn bán trong DB")
+        vid = int(one[0])
+    row = R.ROW_OF.get(vid)
+    if row is None:
+        raise SystemExit(f"variation {vid} không có trong index")
+    pid = int(R.DF_PRODUCT_IDS[row])
+    cur.execute("SELECT price FROM product_variations WHERE variation_id = %s", (vid,))
+    old_price = cur.fetchone()[0]
+    cur.execute("SELECT product_name FROM products WHERE product_id = %s", (pid,))
+    old_name = cur.fetchone()[0]
+    # giá ở đầu kia của catalog (trong bounds scaler) -> láng giềng chắc chắn đổi
+    lo, mid, hi = np.quantile(R.DF_PRICES, [0.1, 0.5, 0.9])
+    new_price = float(hi if float(old_price) < mid else lo)
+
+    feed = ChangeFeed(R.apply_variation_changes)
+    feed.start()
+    if not _wait(lambda: feed.connected, args.timeout):
+        raise SystemExit(f"change feed không kết nối được: {feed.last_error}")
+
+    failed = []
+
+    def check(name, ok):
+        print(f"{'PASS' if ok else 'FAIL'} {name}")
+        if not ok:
+            failed.append(name)
+
+    try:
+        before, code = R.recommend_core(vid)
+        check(f"recommend {vid} trước khi sửa", code == 200)
+
+        cur.execute("UPDATE product_variations SET price = %s WHERE variation_id = %s", (new_price, vid))
+        check("tombstone dòng cũ", _wait(lambda: bool(R.KNN_INDEX.dead[row]), args.timeout))
+
+        def repriced():
+            d = R.DELTA.get(vid)
+            return d is not None and float(d["price"]) == new_price
+        check(f"delta có giá mới {new_price:.0f}", _wait(repriced, args.timeout))
+        after, code = R.recommend_core(vid)
+        check("kết quả recommend đổi", code == 200 and _ids(after) != _ids(before))
+
+        cur.execute("UPDATE products SET product_name = product_name || %s WHERE product_id = %s", (SUFFIX, pid))
+        vids = R.DF["variation_id"].to_numpy()[R.ROWS_OF_PRODUCT.rows_of([pid])].tolist()
+
+        def renamed():          # biến thể đã ngừng bán thì bị xoá khỏi delta thay vì đổi tên
+            d = R.DELTA.get(vid)
+            rs = [r for r in map(R.DELTA.get, vids) if r is not None]
+            return d is not None and all(str(r["product_name"]).endswith(SUFFIX) for r in rs + [d])
+        check(f"product {pid}: biến thể vào delta với tên mới", _wait(renamed, args.timeout))
+        check(f"product {pid}: dòng cũ bị tombstone",
+              bool(R.KNN_INDEX.dead[R.ROWS_OF_PRODUCT.rows_of([pid])].all()))
+    finally:
+        cur.execute("UPDATE product_variations SET price = %s WHERE variation_id = %s", (old_price, vid))
+        cur.execute("UPDATE products SET product_name = %s WHERE product_id = %s", (old_name, pid))
+        feed.stop()
+        conn.close()
+
+    print(f"changefeed: {feed.stats()}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-import re, json, math
+import os, re, json, math, threading
 import numpy as np
 from functools import lru_cache
 from .config import (
     USE_BENCH, BENCH_METHOD, BENCH_DOMAIN,
-    CPU_JSON_PATH, GPU_JSON_PATH
+    CPU_JSON_PATH, GPU_JSON_PATH, BENCH_INDEX_PATH
 )
+from .etag import digest
 
 VENDOR_STOPWORDS = [
     "nvidia","geforce","rtx","gtx","graphics","gpu",
@@ -49,12 +50,11 @@ def _build_bench_map(raw_list, domain="all"):
         m[name.lower()] = float(score)
     return m
 
-CPU_RAW = _load_json(CPU_JSON_PATH) if USE_BENCH else []
-GPU_RAW = _load_json(GPU_JSON_PATH) if USE_BENCH else []
-CPU_MAP = _build_bench_map(CPU_RAW, BENCH_DOMAIN) if USE_BENCH else {}
-GPU_MAP = _build_bench_map(GPU_RAW, BENCH_DOMAIN) if USE_BENCH else {}
-CPU_IDX = { _norm(k): v for k, v in CPU_MAP.items() } if USE_BENCH else {}
-GPU_IDX = { _norm(k): v for k, v in GPU_MAP.items() } if USE_BENCH else {}
+# ---- index đã compile (artifacts/bench_index.npz, build_bench_index.py)
+# CPU/GPU map, key chuẩn hoá, P5/P95 tính sẵn; nạp lười ở lần dùng đầu tiên.
+# Thiếu / lệch version / lệch JSON nguồn hoặc BENCH_DOMAIN thì build từ JSON như cũ.
+BENCH_FORMAT_VERSION = 1
+_DEFAULT_BOUNDS = {"cpu": (1000.0, 20000.0), "gpu": (1000.0, 30000.0)}    # (P5, P95 - P5) khi không có data
 
 def _percentile(arr, p):
     if not arr: return None
@@ -63,43 +63,148 @@ def _percentile(arr, p):
     f = math.floor(k); c = math.ceil(k)
     return arr[int(k)] if f == c else arr[f] + (arr[c] - arr[f]) * (k - f)
 
-CPU_P5  = _percentile(list(CPU_MAP.values()), 5)  if USE_BENCH else None
-CPU_P95 = _percentile(list(CPU_MAP.values()), 95) if USE_BENCH else None
-GPU_P5  = _percentile(list(GPU_MAP.values()), 5)  if USE_BENCH else None
-GPU_P95 = _percentile(list(GPU_MAP.values()), 95) if USE_BENCH else None
+def _source_digest(path) -> str:
+    try:
+        with open(path, "rb") as f:
+            return digest(f.read())
+    except OSError:
+        return digest("missing")
+
+def _pack_strs(strs, key: str) -> dict:
+    """list[str] -> blob utf-8 + offsets (nhỏ hơn nhiều so với mảng unicode độ rộng cố định)."""
+    enc = [x.encode("utf-8") for x in strs]
+    off = np.zeros(len(enc) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in enc], out=off[1:])
+    return {key + "_blob": np.frombuffer(b"".join(enc), dtype=np.uint8), key + "_off": off}
+
+def _unpack_strs(art: dict, key: str) -> list:
+    blob, off = art[key + "_blob"].tobytes(), art[key + "_off"].tolist()
+    return [blob[a:b].decode("utf-8") for a, b in zip(off, off[1:])]
+
+def compile_bench(kind: str, raw_list, domain: str = BENCH_DOMAIN) -> dict:
+    """Mảng của một loại ("cpu" / "gpu"): key (thứ tự dict), key chuẩn hoá, score, idx, P5/P95."""
+    m = _build_bench_map(raw_list, domain)
+    idx = {_norm(k): v for k, v in m.items()}
+    vals = list(m.values())
+    p5, p95 = _percentile(vals, 5), _percentile(vals, 95)
+    lo, span = _DEFAULT_BOUNDS[kind]
+    if p5 is None: p5 = lo
+    if p95 is None: p95 = p5 + span
+    return {
+        **_pack_strs(list(m), f"{kind}_keys"),
+        **_pack_strs([_norm(k) for k in m], f"{kind}_norm"),
+        f"{kind}_scores": np.array(vals, dtype=np.float64),
+        **_pack_strs(list(idx), f"{kind}_idx_keys"),
+        f"{kind}_idx_scores": np.array(list(idx.values()), dtype=np.float64),
+        f"{kind}_bounds": np.array([p5, p95], dtype=np.float64),
+    }
+
+def build_bench_index(cpu_path=CPU_JSON_PATH, gpu_path=GPU_JSON_PATH, domain: str = BENCH_DOMAIN) -> dict:
+    return {
+        "format_version": np.int64(BENCH_FORMAT_VERSION),
+        "domain": np.array(domain),
+        "cpu_source": np.array(_source_digest(cpu_path)),
+        "gpu_source": np.array(_source_digest(gpu_path)),
+        **compile_bench("cpu", _load_json(cpu_path), domain),
+        **compile_bench("gpu", _load_json(gpu_path), domain),
+    }
+
+def save_bench_index(art: dict, path: str = BENCH_INDEX_PATH):
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **art)
+    os.replace(tmp, path)
+
+def load_bench_index(path: str = BENCH_INDEX_PATH, cpu_path=CPU_JSON_PATH, gpu_path=GPU_JSON_PATH,
+                     domain: str = BENCH_DOMAIN):
+    """Artifact nếu còn khớp (version, domain, JSON nguồn), không thì None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        art = {k: z[k] for k in z.files}
+    if (int(art.get("format_version", 0)) != BENCH_FORMAT_VERSION or str(art["domain"]) != domain
+            or str(art["cpu_source"]) != _source_digest(cpu_path)
+            or str(art["gpu_source"]) != _source_digest(gpu_path)):
+        return None
+    return art
+
+class BenchTable:
+    """Bảng benchmark của một loại: map tên (lowercase) -> score, idx theo key chuẩn hoá, P5/P95."""
+    __slots__ = ("map", "idx", "norm_items", "p5", "p95")
+
+    def __init__(self, art: dict, kind: str):
+        scores = art[f"{kind}_scores"].tolist()
+        self.map = dict(zip(_unpack_strs(art, f"{kind}_keys"), scores))
+        self.idx = dict(zip(_unpack_strs(art, f"{kind}_idx_keys"), art[f"{kind}_idx_scores"].tolist()))
+        self.norm_items = list(zip(_unpack_strs(art, f"{kind}_norm"), scores))     # cho khớp "contains"
+        self.p5, self.p95 = art[f"{kind}_bounds"].tolist()
+
+    @classmethod
+    def empty(cls, kind: str):
+        return cls(compile_bench(kind, []), kind)
+
+_TABLES = None
+_TABLES_LOCK = threading.Lock()
+
+def tables():
+    """(cpu, gpu) BenchTable, nạp một lần."""
+    global _TABLES
+    if _TABLES is None:
+        with _TABLES_LOCK:
+            if _TABLES is None:
+                if not USE_BENCH:
+                    _TABLES = (BenchTable.empty("cpu"), BenchTable.empty("gpu"))
+                else:
+                    art = load_bench_index() or build_bench_index()
+                    _TABLES = (BenchTable(art, "cpu"), BenchTable(art, "gpu"))
+    return _TABLES
+
+def cpu_bounds():
+    t = tables()[0]
+    return t.p5, t.p95
 
-if CPU_P5  is None: CPU_P5  = 1000.0
-if CPU_P95 is None: CPU_P95 = CPU_P5 + 20000.0
-if GPU_P5  is None: GPU_P5  = 1000.0
-if GPU_P95 is None: GPU_P95 = GPU_P5 + 30000.0
+def gpu_bounds():
+    t = tables()[1]
+    return t.p5, t.p95
 
-def scale_0_100(x, lo=CPU_P5, hi=CPU_P95, method=BENCH_METHOD):
+_LEGACY = {
+    "CPU_MAP": lambda: tables()[0].map, "GPU_MAP": lambda: tables()[1].map,
+    "CPU_IDX": lambda: tables()[0].idx, "GPU_IDX": lambda: tables()[1].idx,
+    "CPU_P5": lambda: tables()[0].p5, "CPU_P95": lambda: tables()[0].p95,
+    "GPU_P5": lambda: tables()[1].p5, "GPU_P95": lambda: tables()[1].p95,
+}
+
+def __getattr__(name):
+    # tên cũ (CPU_MAP, CPU_P5, ...) vẫn đọc được, nhưng nạp bảng khi truy cập
+    if name in _LEGACY:
+        return _LEGACY[name]()
+    raise AttributeError(name)
+
+def scale_0_100(x, lo=None, hi=None, method=BENCH_METHOD):
     if x is None: return None
+    if lo is None or hi is None:
+        lo, hi = cpu_bounds()
     lo = max(lo, 1e-6); hi = max(hi, lo + 1e-6)
     if method == "logminmax":
         return float(min(1.0, max(0.0, (math.log(max(x,1e-6))-math.log(lo))/(math.log(hi)-math.log(lo))))) * 100.0
     return float(min(1.0, max(0.0, (x - lo) / (hi - lo)))) * 100.0
 
-@lru_cache(maxsize=8192)
-def lookup_cpu_raw(name: str):
-    if not (USE_BENCH and name): return (None, "none")
+def _lookup(t: BenchTable, name: str):
     key = name.strip().lower()
-    if key in CPU_MAP: return (CPU_MAP[key], "json-exact")
+    if key in t.map: return (t.map[key], "json-exact")
     nk = _norm(key)
-    if nk in CPU_IDX:  return (CPU_IDX[nk], "json-norm")
-    for k, v in CPU_MAP.items():
-        if nk and (nk in _norm(k) or _norm(k) in nk):
-            return (v, "json-contains")
+    if nk in t.idx:  return (t.idx[nk], "json-norm")
+    if nk:
+        for k, v in t.norm_items:
+            if nk in k or k in nk:
+                return (v, "json-contains")
     return (None, "none")
 
+@lru_cache(maxsize=8192)
+def lookup_cpu_raw(name: str):
+    if not (USE_BENCH and name): return (None, "none")
+    return _lookup(tables()[0], name)
+
 @lru_cache(maxsize=8192)
 def lookup_gpu_raw(name: str):
     if not (USE_BENCH and name): return (None, "none")
-    key = name.strip().lower()
-    if key in GPU_MAP: return (GPU_MAP[key], "json-exact")
-    nk = _norm(key)
-    if nk in GPU_IDX:  return (GPU_IDX[nk], "json-norm")
-    for k, v in GPU_MAP.items():
-        if nk and (nk in _norm(k) or _norm(k) in nk):
-            return (v, "json-contains")
-    return (None, "none")
+    return _lookup(tables()[1], name)
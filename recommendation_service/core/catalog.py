@@ -0,0 +1,68 @@
+"""
+Catalog DF gọn cho serving.
+
+Pickle của trainer giữ mọi cột trung gian (score raw / scaled, ram, storage, ...)
+dưới dạng object. API chỉ đọc vài cột: giữ đúng các cột đó, chuỗi lặp lại
+(tên sản phẩm, cpu/gpu source, tên CPU/GPU cho warmup) lưu dạng categorical.
+Lookup variation_id -> dòng dùng mảng đã sắp + searchsorted thay cho dict.
+"""
+import numpy as np
+import pandas as pd
+from .config import DF_PATH
+
+SERVING_COLUMNS = {
+    "variation_id": "int64",
+    "product_id": "int64",
+    "price": "float64",
+    "performance_score": "float64",
+    "product_name": "category",
+    "cpu_source": "category",
+    "gpu_source": "category",
+    "processor": "category",        # warmup bench lookups
+    "graphics_card": "category",
+}
+
+
+def lean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({c: df[c].astype(dt) for c, dt in SERVING_COLUMNS.items() if c in df.columns})
+
+
+def load_catalog(path: str = DF_PATH) -> pd.DataFrame:
+    return lean_frame(pd.read_pickle(path))
+
+
+def frame_bytes(df) -> int:
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class RowLookup:
+    """variation_id -> dòng DF / X_ALL (None nếu không có); id lặp (product_id) dùng rows_of."""
+
+    def __init__(self, variation_ids):
+        ids = np.asarray(variation_ids, dtype=np.int64)
+        self.order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.order]
+
+    def get(self, variation_id):
+        v = int(variation_id)
+        i = int(np.searchsorted(self.sorted_ids, v))
+        if i < self.sorted_ids.shape[0] and self.sorted_ids[i] == v:
+            return int(self.order[i])
+        return None
+
+    def rows_of(self, ids) -> np.ndarray:
+        """Mọi dòng có id thuộc ids (vd. product_id -> các biến thể), O(k log N)."""
+        keys = np.unique(np.fromiter((int(v) for v in ids), dtype=np.int64))
+        lo = np.searchsorted(self.sorted_ids, keys, side="left")
+        hi = np.searchsorted(self.sorted_ids, keys, side="right")
+        parts = [self.order[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.order.dtype)
+
+    def __contains__(self, variation_id):
+        return self.get(variation_id) is not None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.order.nbytes + self.sorted_ids.nbytes)
@@ -0,0 +1,189 @@
+"""
+Subscriber LISTEN/NOTIFY cho product_variations (trigger: migrations/001_recs_variation_notify.sql).
+
+Notification được gom trong RECS_CHANGEFEED_DEBOUNCE_MS rồi áp dụng theo lô qua
+`apply_variation_changes` (core/recommend.py): chỉ các dòng bị đổi được fetch
+và chấm điểm lại. Mất kết nối -> reconnect với backoff; lô lỗi DB được giữ lại
+để thử lại.
+
+Postgres không giữ NOTIFY cho listener đang mất kết nối: mỗi lần reconnect (trừ
+lần đầu) `catchup_fn(since)` trả các biến thể / product đổi từ lúc feed còn sống
+(giờ của DB, lùi RECS_CHANGEFEED_CATCHUP_MARGIN giây) và biến thể đã biến mất,
+rồi mới drain tiếp. Bắt kịp lỗi -> coi như chưa kết nối, thử lại.
+
+Kênh cố định "recs_variation_changes" (CHANGEFEED_CHANNEL) vì trigger trong
+migration NOTIFY trên đúng kênh đó.
+
+Chạy thử với Postgres local (in ra thay đổi nhận được, không cần service):
+
+    DATABASE_URL=postgresql://... python -m core.changefeed
+
+Kiểm tra end-to-end (migration, tombstone, delta, kết quả đổi): check_changefeed.py.
+"""
+import datetime
+import json
+import select
+import threading
+import time
+from .config import DB_URL, CHANGEFEED_CHANNEL, CHANGEFEED_DEBOUNCE_MS, CHANGEFEED_CATCHUP_MARGIN
+
+
+def _dsn(url: str) -> str:
+    # SQLAlchemy URL (postgresql+psycopg2://...) -> libpq DSN
+    scheme, rest = url.split("://", 1)
+    return scheme.split("+", 1)[0] + "://" + rest
+
+
+def parse_payload(payload: str):
+    """-> ("variation", id) | ("product", id) | None"""
+    try:
+        msg = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if msg.get("op") == "PRODUCT" and msg.get("product_id") is not None:
+        return ("product", int(msg["product_id"]))
+    if msg.get("variation_id") is not None:
+        return ("variation", int(msg["variation_id"]))
+    return None
+
+
+class ChangeFeed:
+    HEARTBEAT_SEC = 30
+
+    def __init__(self, apply_fn, catchup_fn=None, dsn: str = DB_URL, channel: str = CHANGEFEED_CHANNEL,
+                 debounce_ms: float = CHANGEFEED_DEBOUNCE_MS):
+        self.apply_fn = apply_fn
+        self.catchup_fn = catchup_fn
+        self.dsn = dsn
+        self.channel = channel
+        self.debounce = debounce_ms / 1000.0
+        self.connected = False
+        self.notifications = 0
+        self.batches = 0
+        self.upserts = 0
+        self.deletes = 0
+        self.last_error = None
+        self.last_applied_at = None
+        self.catchups = 0
+        self._alive_at = None             # now() của DB lần cuối chắc chắn còn kết nối
+        self._pending_v, self._pending_p = set(), set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(_dsn(self.dsn))
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel};")
+        return conn
+
+    @staticmethod
+    def _db_now(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT now()")
+            return cur.fetchone()[0]
+
+    def _catch_up(self):
+        """Reconnect: thay đổi trong lúc mất kết nối vào pending (sau LISTEN nên không hở)."""
+        if self._alive_at is None or self.catchup_fn is None:
+            return                        # lần kết nối đầu: index vừa load
+        res = self.catchup_fn(self._alive_at - datetime.timedelta(seconds=CHANGEFEED_CATCHUP_MARGIN))
+        if res is None:
+            raise RuntimeError("catch-up failed (DB)")
+        v, p = res
+        self._pending_v |= set(v)
+        self._pending_p |= set(p)
+        self.catchups += 1
+
+    def _drain(self, conn):
+        conn.poll()
+        while conn.notifies:
+            n = conn.notifies.pop(0)
+            self.notifications += 1
+            parsed = parse_payload(n.payload)
+            if parsed is None:
+                continue
+            kind, key = parsed
+            (self._pending_p if kind == "product" else self._pending_v).add(key)
+
+    def _flush(self):
+        if not (self._pending_v or self._pending_p):
+            return
+        v, p = self._pending_v, self._pending_p
+        res = self.apply_fn(variation_ids=v, product_ids=p)
+        if res is None:                   # lỗi DB -> giữ lại, lần sau thử lại
+            return
+        self._pending_v, self._pending_p = set(), set()
+        self.batches += 1
+        self.upserts += res.get("upserts", 0)
+        self.deletes += res.get("deletes", 0)
+        self.last_applied_at = time.time()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                now = self._db_now(conn)
+                self._catch_up()
+                self._alive_at, beat = now, time.monotonic()
+                self.connected, backoff = True, 1.0
+                while not self._stop.is_set():
+                    if time.monotonic() - beat >= self.HEARTBEAT_SEC:
+                        # heartbeat: phát hiện kết nối chết + mốc `since` cho lần bắt kịp sau
+                        self._alive_at, beat = self._db_now(conn), time.monotonic()
+                        self._drain(conn)
+                    if select.select([conn], [], [], 1.0)[0]:
+                        self._drain(conn)
+                        # gom thêm các notify đến liền sau (bulk update giá, ...)
+                        t_end = time.monotonic() + self.debounce
+                        while time.monotonic() < t_end:
+                            if select.select([conn], [], [], max(t_end - time.monotonic(), 0))[0]:
+                                self._drain(conn)
+                    self._flush()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def start(self):
+        if self._thread is None and self.dsn:
+            self._thread = threading.Thread(target=self.run, name="changefeed", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "channel": self.channel,
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "upserts": self.upserts,
+            "deletes": self.deletes,
+            "pending": len(self._pending_v) + len(self._pending_p),
+            "catchups": self.catchups,
+            "last_error": self.last_error,
+            "last_applied_at": self.last_applied_at,
+        }
+
+
+if __name__ == "__main__":
+    def _print(variation_ids=(), product_ids=()):
+        print(f"variations={sorted(variation_ids)} products={sorted(product_ids)}", flush=True)
+        return {"upserts": 0, "deletes": 0}
+
+    if not DB_URL:
+        raise SystemExit("DATABASE_URL missing")
+    print(f"LISTEN {CHANGEFEED_CHANNEL} ...", flush=True)
+    ChangeFeed(_print).run()
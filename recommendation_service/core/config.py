@@ -10,11 +10,69 @@ ALPHA = float(os.getenv("RECS_ALPHA_PRICE", 0.6))
 BETA  = float(os.getenv("RECS_BETA_PERF", 0.4))
 LAMBDA_PRICE_JUMP = float(os.getenv("RECS_PRICE_JUMP_LAMBDA", 0.6))
 
+# ---- kNN index
+INDEX_MODE = os.getenv("RECS_INDEX_MODE", "exact")                # exact|compact|ivf
+IVF_NLIST = int(os.getenv("RECS_IVF_NLIST", 0))                   # 0 = auto (sqrt(N))
+IVF_NPROBE = int(os.getenv("RECS_IVF_NPROBE", 8))
+# ---- shard theo khoảng giá (xem core/shards.py)
+SHARDS_MODE = os.getenv("RECS_SHARDS_MODE", "off")               # off|local|remote
+SHARDS = int(os.getenv("RECS_SHARDS", 4))                         # số shard khi build
+SHARD_URLS = [u.strip() for u in os.getenv("RECS_SHARD_URLS", "").split(",") if u.strip()]
+SHARD_TIMEOUT = float(os.getenv("RECS_SHARD_TIMEOUT", 2))
+KNN_MARGIN = int(os.getenv("RECS_KNN_MARGIN", 15))                # số product dư cho bước rerank
+
 # ---- fresh/recency
 FRESH_LIMIT = int(os.getenv("RECS_FRESH_LIMIT", 200))
 FRESH_WINDOW_DAYS = int(os.getenv("RECS_FRESH_WINDOW_DAYS", 60))
 RECENCY_GAMMA = float(os.getenv("RECS_RECENCY_GAMMA", 0.12))
 RECENCY_HALFLIFE = float(os.getenv("RECS_RECENCY_HALFLIFE", 21))
+FRESH_TTL_SEC = float(os.getenv("RECS_FRESH_TTL_SEC", 30))           # 0 = query DB mỗi request
+META_CACHE = os.getenv("RECS_META_CACHE", "true").lower() == "true"  # cache meta sản phẩm cho ?include=meta
+
+# ---- serving
+COALESCE = os.getenv("RECS_COALESCE", "true").lower() == "true"  # single-flight cho request trùng variation_id
+RESULT_CACHE_TTL = float(os.getenv("RECS_RESULT_CACHE_TTL", 60))    # giây, 0 = tắt
+RESULT_CACHE_SIZE = int(os.getenv("RECS_RESULT_CACHE_SIZE", 10000))
+LOOKUP_CACHE_TTL = float(os.getenv("RECS_LOOKUP_CACHE_TTL", 300))    # biến thể ngoài index đã chấm điểm, 0 = tắt
+LOOKUP_CACHE_SIZE = int(os.getenv("RECS_LOOKUP_CACHE_SIZE", 10000))
+MISS_CACHE_TTL = float(os.getenv("RECS_MISS_CACHE_TTL", 300))        # id không tồn tại (404), 0 = tắt
+MISS_CACHE_SIZE = int(os.getenv("RECS_MISS_CACHE_SIZE", 100000))
+HTTP_ETAG = os.getenv("RECS_HTTP_ETAG", "true").lower() == "true"     # ETag + 304 cho /recommend
+HTTP_MAX_AGE = int(os.getenv("RECS_HTTP_MAX_AGE", 30))             # giây, 0 = no-cache (luôn revalidate)
+HTTP_SWR = int(os.getenv("RECS_HTTP_SWR", 60))                     # stale-while-revalidate, giây
+DEADLINE_MS = float(os.getenv("RECS_DEADLINE_MS", 2000))          # ngân sách / request /recommend, 0 = tắt
+DEADLINE_DB_WORKERS = int(os.getenv("RECS_DEADLINE_DB_WORKERS", 4))
+DEADLINE_DB_QUEUE = int(os.getenv("RECS_DEADLINE_DB_QUEUE", 4))    # query chờ worker tối đa, đầy -> 503 ngay
+MICROBATCH = os.getenv("RECS_MICROBATCH", "false").lower() == "true"   # gom kNN của request đồng thời
+MICROBATCH_WINDOW_MS = float(os.getenv("RECS_MICROBATCH_WINDOW_MS", 2))
+MICROBATCH_MAX = int(os.getenv("RECS_MICROBATCH_MAX", 32))
+EXPORT_BATCH = int(os.getenv("RECS_EXPORT_BATCH", 512))            # số variation mỗi batch của /export
+JSON_ENCODER = os.getenv("RECS_JSON_ENCODER", "auto")           # auto|std|orjson (xem core/fragments.py)
+SERVER_TIMING = os.getenv("RECS_SERVER_TIMING", "true").lower() == "true"   # header Server-Timing theo stage
+
+# ---- trace log request chậm (xem core/tracelog.py)
+SLOW_LOG_MS = float(os.getenv("RECS_SLOW_LOG_MS", 250))            # ghi request chậm hơn ngưỡng, 0 = tắt
+SLOW_LOG_PATH = os.getenv("RECS_SLOW_LOG_PATH", os.path.join("logs", "recs_slow.jsonl"))
+SLOW_LOG_MAX_BYTES = int(os.getenv("RECS_SLOW_LOG_MAX_BYTES", 10 * 1024 * 1024))   # mỗi file, rồi rotate
+SLOW_LOG_BACKUPS = int(os.getenv("RECS_SLOW_LOG_BACKUPS", 5))
+SLOW_LOG_QUEUE = int(os.getenv("RECS_SLOW_LOG_QUEUE", 10000))     # queue đầy -> bỏ record (đếm "dropped")
+
+# ---- shared memory (xem core/shm.py, shm_loader.py)
+SHM_MODE = os.getenv("RECS_SHM_MODE", "off")                      # off|attach
+SHM_PREFIX = os.getenv("RECS_SHM_PREFIX", "recs")
+SHM_ATTACH_TIMEOUT = float(os.getenv("RECS_SHM_ATTACH_TIMEOUT", 60))
+
+# ---- change feed (LISTEN/NOTIFY, migrations/001_recs_variation_notify.sql)
+CHANGEFEED = os.getenv("RECS_CHANGEFEED", "false").lower() == "true"
+CHANGEFEED_CHANNEL = "recs_variation_changes"      # cố định: trigger trong migrations/001 NOTIFY trên kênh này
+CHANGEFEED_CATCHUP_MARGIN = float(os.getenv("RECS_CHANGEFEED_CATCHUP_MARGIN", 5))   # giây lùi thêm khi bắt kịp sau reconnect
+CHANGEFEED_DEBOUNCE_MS = float(os.getenv("RECS_CHANGEFEED_DEBOUNCE_MS", 200))
+
+# ---- warmup
+WARMUP = os.getenv("RECS_WARMUP", "true").lower() == "true"
+WARMUP_TOP_N = int(os.getenv("RECS_WARMUP_TOP_N", 200))
+READY_DB_RETRY_SEC = float(os.getenv("RECS_READY_DB_RETRY_SEC", 2))   # DB chưa lên lúc khởi động: thử lại sau
+ACCESS_FLUSH_SEC = float(os.getenv("RECS_ACCESS_FLUSH_SEC", 60))
 
 # ---- benchmark mapping
 USE_BENCH = os.getenv("USE_BENCH_IN_API", "true").lower() == "true"
@@ -28,9 +86,14 @@ DATA_DIR = os.getenv("DATA_DIR", "data")
 CPU_JSON_PATH = os.path.join(DATA_DIR, "cpu_benchmark.json")
 GPU_JSON_PATH = os.path.join(DATA_DIR, "gpu_benchmark.json")
 DF_PATH       = os.path.join(ARTIFACTS_DIR, "products_df_from_db.pkl")
-SCALER_PATH   = os.path.join(ARTIFACTS_DIR, "scaler.joblib")
+SCALER_PATH   = os.path.join(ARTIFACTS_DIR, "scaler.joblib")          # chỉ training / migrate
+SCALER_PARAMS_PATH = os.path.join(ARTIFACTS_DIR, "scaler_params.npz")
 XALL_PATH     = os.path.join(ARTIFACTS_DIR, "knn_X_all.npy")
 VARIDS_PATH   = os.path.join(ARTIFACTS_DIR, "knn_variation_ids.npy")
+IVF_PATH      = os.path.join(ARTIFACTS_DIR, "knn_ivf.npz")
+SHARDS_DIR    = os.getenv("RECS_SHARDS_DIR", os.path.join(ARTIFACTS_DIR, "shards"))
+BENCH_INDEX_PATH = os.path.join(ARTIFACTS_DIR, "bench_index.npz")     # build_bench_index.py
+ACCESS_FREQ_PATH = os.getenv("RECS_ACCESS_FREQ_PATH", os.path.join(ARTIFACTS_DIR, "access_freq.json"))
 
 # ---- DB
 DB_URL = os.getenv("DATABASE_URL")
@@ -1,7 +1,20 @@
 import pandas as pd
+from sqlalchemy import text
 from .config import ENGINE, FRESH_LIMIT, FRESH_WINDOW_DAYS
 
+def ping_db() -> bool:
+    """Mở (và trả về pool) một connection; False nếu không có DB hoặc lỗi."""
+    if ENGINE is None:
+        return False
+    try:
+        with ENGINE.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
 def fetch_one_variation_from_db(variation_id: int) -> pd.DataFrame:
+    """DataFrame rỗng nếu không có biến thể, None nếu lỗi DB."""
     if ENGINE is None:
         return pd.DataFrame()
     sql = """
@@ -21,9 +34,59 @@ def fetch_one_variation_from_db(variation_id: int) -> pd.DataFrame:
     try:
         return pd.read_sql(sql, con=ENGINE, params={"vid": variation_id})
     except Exception:
-        return pd.DataFrame()
+        return None
 
-def fetch_fresh_items_from_db(exclude_variation_ids=None) -> pd.DataFrame:
+def fetch_variations_from_db(variation_ids):
+    """
+    Các biến thể còn bán theo id (cho change feed). None nếu lỗi DB — khác với
+    DataFrame rỗng (= tất cả id đã bị xoá / ngừng bán).
+    """
+    if ENGINE is None:
+        return None
+    sql = """
+        SELECT
+            pv.variation_id,
+            pv.product_id,
+            p.product_name AS product_name,
+            pv.processor,
+            pv.ram,
+            pv.storage,
+            pv.graphics_card,
+            pv.price
+        FROM product_variations pv
+        JOIN products p ON p.product_id = pv.product_id
+        WHERE pv.is_available = true AND pv.variation_id = ANY(%(ids)s)
+    """
+    try:
+        return pd.read_sql(sql, con=ENGINE, params={"ids": [int(x) for x in variation_ids]})
+    except Exception:
+        return None
+
+def fetch_variation_changes_since(since):
+    """
+    Cho change feed bắt kịp sau khi mất kết nối (NOTIFY lúc đó bị mất):
+    (variation_id có updated_at / created_at >= since, product_id có updated_at >= since,
+    mọi variation_id còn bán). None nếu lỗi DB.
+    """
+    if ENGINE is None:
+        return None
+    try:
+        with ENGINE.connect() as conn:
+            changed = conn.execute(text(
+                "SELECT variation_id FROM product_variations WHERE GREATEST(updated_at, created_at) >= :since"
+            ), {"since": since}).scalars().all()
+            products = conn.execute(text(
+                "SELECT product_id FROM products WHERE updated_at >= :since"
+            ), {"since": since}).scalars().all()
+            available = conn.execute(text(
+                "SELECT variation_id FROM product_variations WHERE is_available = true"
+            )).scalars().all()
+    except Exception:
+        return None
+    return [int(v) for v in changed], [int(p) for p in products], [int(v) for v in available]
+
+def fetch_fresh_items_from_db(exclude_variation_ids=None, limit: int = FRESH_LIMIT) -> pd.DataFrame:
+    """DataFrame rỗng nếu không có biến thể mới, None nếu lỗi DB."""
     if ENGINE is None:
         return pd.DataFrame()
     exclude_variation_ids = exclude_variation_ids or []
@@ -40,10 +103,33 @@ def fetch_fresh_items_from_db(exclude_variation_ids=None) -> pd.DataFrame:
           AND GREATEST(pv.updated_at, pv.created_at) >= NOW() - INTERVAL '{FRESH_WINDOW_DAYS} days'
           {"AND pv.variation_id <> ALL(%(ex)s)" if exclude_variation_ids else ""}
         ORDER BY ts DESC
-        LIMIT {FRESH_LIMIT}
+        LIMIT {int(limit)}
     """
     try:
         params = {"ex": exclude_variation_ids} if exclude_variation_ids else {}
         return pd.read_sql(sql, con=ENGINE, params=params)
+    except Exception:
+        return None
+
+def fetch_product_meta_from_db(product_ids) -> pd.DataFrame:
+    """slug / thumbnail / ảnh primary / rating cho các product_id (giống fetchProductMeta phía Node)."""
+    if ENGINE is None or not len(product_ids):
+        return pd.DataFrame()
+    sql = """
+        SELECT
+            p.product_id,
+            p.product_name,
+            p.slug,
+            p.rating_average,
+            p.thumbnail_url,
+            (SELECT pi.image_url FROM product_images pi
+              WHERE pi.product_id = p.product_id
+              ORDER BY pi.is_primary DESC, pi.display_order ASC
+              LIMIT 1) AS image_url
+        FROM products p
+        WHERE p.product_id = ANY(%(ids)s)
+    """
+    try:
+        return pd.read_sql(sql, con=ENGINE, params={"ids": [int(x) for x in product_ids]})
     except Exception:
         return pd.DataFrame()
@@ -0,0 +1,87 @@
+"""
+Ngân sách thời gian của một request /recommend (RECS_DEADLINE_MS, 0 = tắt).
+
+app.py gọi `begin()` đầu request. Các chỗ có thể chờ Postgres dùng `remaining()`:
+    - fresh pool refresh (core/fresh.py): quá hạn -> trả kết quả chỉ từ index
+      (+ delta), đánh dấu degraded "fresh" (chưa có pool) / "fresh-stale" (pool cũ)
+    - lookup biến thể chưa có trong index (`call`): quá hạn, lỗi DB hoặc pool DB đã đầy
+      (RECS_DEADLINE_DB_WORKERS đang chạy + RECS_DEADLINE_DB_QUEUE đang chờ) -> 503,
+      degraded "db"
+Response degraded có header `X-Recs-Degraded` và không được cache.
+Ngoài request (warmup, export CLI) không có ngân sách: chờ như cũ.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as _FutureTimeout
+from contextvars import ContextVar
+from .config import DEADLINE_DB_WORKERS, DEADLINE_DB_QUEUE
+
+_BUDGET = ContextVar("recs_budget", default=None)
+# query DB của request chạy ở đây để request không bị treo theo query chậm;
+# giới hạn số worker để DB chậm không đẻ thêm thread vô hạn
+_DB_POOL = ThreadPoolExecutor(max_workers=DEADLINE_DB_WORKERS, thread_name_prefix="recs-db")
+# queue của executor không giới hạn: giữ chỗ trước khi submit, hết chỗ thì fail ngay
+_DB_SLOTS = threading.BoundedSemaphore(DEADLINE_DB_WORKERS + max(0, DEADLINE_DB_QUEUE))
+
+
+class Expired(Exception):
+    pass
+
+
+class DbUnavailable(Expired):
+    """Postgres lỗi (không phải 'không tồn tại'): cùng đường 503 + Retry-After như quá hạn."""
+
+
+class _Budget:
+    __slots__ = ("expires", "reasons")
+
+    def __init__(self, seconds):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.reasons = []
+
+
+def begin(seconds=None):
+    """Ngân sách mới cho request hiện tại (None / <= 0: không giới hạn)."""
+    _BUDGET.set(_Budget(seconds if seconds and seconds > 0 else None))
+
+
+def remaining():
+    """Giây còn lại (>= 0), None nếu không có ngân sách."""
+    b = _BUDGET.get()
+    if b is None or b.expires is None:
+        return None
+    return max(0.0, b.expires - time.monotonic())
+
+
+def degrade(*reasons):
+    b = _BUDGET.get()
+    if b is not None:
+        b.reasons.extend(r for r in reasons if r not in b.reasons)
+
+
+def reasons() -> tuple:
+    b = _BUDGET.get()
+    return tuple(b.reasons) if b is not None else ()
+
+
+def call(fn, *args):
+    """
+    fn(*args) trong thời gian còn lại; quá hạn -> Expired. Query chưa chạy thì
+    bị huỷ khỏi queue, đang chạy thì chạy xong ở pool nền. Pool đầy -> Expired ngay.
+    """
+    timeout = remaining()
+    if timeout is None:
+        return fn(*args)
+    if not _DB_SLOTS.acquire(blocking=False):
+        raise Expired()
+    try:
+        f = _DB_POOL.submit(fn, *args)
+    except BaseException:
+        _DB_SLOTS.release()
+        raise
+    f.add_done_callback(lambda _: _DB_SLOTS.release())     # cả khi bị cancel
+    try:
+        return f.result(timeout=timeout)
+    except _FutureTimeout:
+        f.cancel()
+        raise Expired() from None
@@ -0,0 +1,67 @@
+"""
+Delta overlay cho index đã train: các biến thể được upsert sau lần train gần
+nhất (từ change feed) nằm ở đây, dòng cũ trong X_ALL bị tombstone. Query quét
+brute-force phần delta (nhỏ, O(D)) cạnh index chính; train lại = compaction.
+"""
+import threading
+import pandas as pd
+
+DELTA_COLUMNS = ["variation_id", "product_id", "product_name", "processor", "ram", "storage",
+                 "graphics_card", "price", "performance_score", "cpu_source", "gpu_source"]
+
+
+class DeltaIndex:
+    def __init__(self):
+        self._rows = {}                  # variation_id -> dict (DELTA_COLUMNS)
+        self._frame = pd.DataFrame(columns=DELTA_COLUMNS)
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.upserts = 0
+        self.deletes = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, variation_id):
+        return int(variation_id) in self._rows
+
+    def apply(self, scored: pd.DataFrame, deleted_ids) -> None:
+        """O(số dòng thay đổi); frame dùng cho query được build lại lười ở lần đọc sau."""
+        records = scored[DELTA_COLUMNS].to_dict("records") if not scored.empty else []
+        with self._lock:
+            for r in records:
+                self._rows[int(r["variation_id"])] = r
+            for vid in deleted_ids:
+                self._rows.pop(int(vid), None)
+            self.upserts += len(records)
+            self.deletes += len(deleted_ids)
+            self._dirty = True
+            self.generation += 1
+
+    def product_variation_ids(self, product_ids) -> set:
+        pids = {int(p) for p in product_ids}
+        with self._lock:
+            return {vid for vid, r in self._rows.items() if int(r["product_id"]) in pids}
+
+    def frame(self) -> pd.DataFrame:
+        if self._dirty:
+            with self._lock:
+                if self._dirty:
+                    self._frame = pd.DataFrame(list(self._rows.values()), columns=DELTA_COLUMNS)
+                    self._dirty = False
+        return self._frame
+
+    def get(self, variation_id):
+        r = self._rows.get(int(variation_id))
+        return None if r is None else pd.Series(r)
+
+    def candidates_for(self, base_variation_id: int) -> pd.DataFrame:
+        df = self.frame()
+        if df.empty:
+            return df
+        return df.loc[df["variation_id"] != int(base_variation_id)].reset_index(drop=True)
+
+    def stats(self) -> dict:
+        return {"generation": self.generation, "items": len(self._rows),
+                "upserts": self.upserts, "deletes": self.deletes}
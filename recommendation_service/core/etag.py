@@ -0,0 +1,31 @@
+"""
+Tag nội dung ổn định giữa các process / replica (không dùng hash() của Python,
+vốn random theo process) cho ETag của /recommend.
+
+ETag = digest(artifact tag, fresh pool tag, index tag, variation_id, biến thể
+response). Hai replica cùng artifacts + cùng fresh pool + cùng delta cho cùng
+ETag nên nginx / browser revalidate được qua bất kỳ replica nào.
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def digest(*parts) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for p in parts:
+        if isinstance(p, np.ndarray):
+            p = np.ascontiguousarray(p).tobytes()
+        elif not isinstance(p, (bytes, bytearray, memoryview)):
+            p = str(p).encode("utf-8")
+        h.update(p)
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def frame_digest(df, sort_by: str = None) -> str:
+    if df is None or df.empty:
+        return digest("empty")
+    if sort_by is not None:
+        df = df.sort_values(sort_by, kind="stable")
+    return digest(pd.util.hash_pandas_object(df, index=False).to_numpy(), ",".join(map(str, df.columns)))
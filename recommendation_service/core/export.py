@@ -0,0 +1,121 @@
+"""
+Bulk export gợi ý cho toàn catalog (edge cache / search index).
+
+Duyệt các biến thể đang có trong index (DF còn sống + DELTA) theo variation_id
+tăng dần, từng batch: kNN batch (`kneighbors_products_batch`) rồi rerank như
+/recommend (`_rerank`), kết quả được encode và stream ra từng batch — không
+giữ toàn bộ kết quả trong bộ nhớ. Biến thể chỉ có trong DB (chưa train) vẫn
+được phục vụ trực tiếp qua /recommend.
+
+Định dạng:
+    ndjson : mỗi dòng {"variation_id": v, "items": [...]} (item giống /recommend)
+    bin    : header `<8sI` (b"RECSX001", TOPK), mỗi bản ghi `<qH` (variation_id, n)
+             + n x `<qqB` (variation_id, product_id, source: 0 indexed / 1 fresh)
+
+Shard theo khoảng id: danh sách id đã sắp được chia đều số lượng thành `shards`
+khoảng liên tiếp [lo, hi); mọi process tính ra cùng biên nên có thể chạy song song.
+Có cả min_id / max_id thì lấy phần giao của hai khoảng.
+"""
+import json
+import struct
+import numpy as np
+from . import recommend as R
+from . import timing
+from .config import TOPK, KNN_MARGIN, EXPORT_BATCH
+
+BIN_MAGIC = b"RECSX001"
+_BIN_HEADER = struct.Struct("<8sI")
+_BIN_RECORD = struct.Struct("<qH")
+_BIN_ITEM = struct.Struct("<qqB")
+FORMATS = {"ndjson": "application/x-ndjson", "bin": "application/octet-stream"}
+
+
+def base_table():
+    """(vids, product_ids, prices, perfs) của mọi biến thể trong index, sắp theo variation_id."""
+    alive = ~R.KNN_INDEX.dead
+    d = R.DELTA.frame()
+    vids = np.concatenate([R.DF["variation_id"].to_numpy(np.int64)[alive], d["variation_id"].to_numpy(np.int64)])
+    pids = np.concatenate([R.DF_PRODUCT_IDS[alive], d["product_id"].to_numpy(np.int64)])
+    prices = np.concatenate([R.DF_PRICES[alive], d["price"].to_numpy(np.float64)])
+    perfs = np.concatenate([R.DF["performance_score"].to_numpy(np.float64)[alive],
+                            d["performance_score"].to_numpy(np.float64)])
+    o = np.argsort(vids, kind="stable")
+    return vids[o], pids[o], prices[o], perfs[o]
+
+
+def shard_range(vids_sorted, shard: int, shards: int):
+    """[lo, hi) id của shard thứ `shard` (hi = None: tới hết)."""
+    n = vids_sorted.shape[0]
+    a, b = n * shard // shards, n * (shard + 1) // shards
+    lo = int(vids_sorted[a]) if a < n else None
+    hi = int(vids_sorted[b]) if b < n else None
+    return lo, hi
+
+
+def iter_recommendations(min_id=None, max_id=None, shard=None, shards=None, batch: int = EXPORT_BATCH):
+    """Yield từng batch list[(variation_id, items)] cho các id trong [min_id, max_id) ∩ shard."""
+    vids, pids, prices, perfs = base_table()
+    if shards:
+        lo, hi = shard_range(vids, shard or 0, shards)
+        if lo is None:
+            return
+        min_id = lo if min_id is None else max(int(min_id), lo)
+        if hi is not None:
+            max_id = hi if max_id is None else min(int(max_id), hi)
+    keep = np.ones(vids.shape[0], dtype=bool)
+    if min_id is not None:
+        keep &= vids >= int(min_id)
+    if max_id is not None:
+        keep &= vids < int(max_id)
+    vids, pids, prices, perfs = vids[keep], pids[keep], prices[keep], perfs[keep]
+
+    scaler, X_all, index = R._SCALED
+    t = timing.laps()
+    batch = max(1, int(batch))
+    kb = max(1, min(batch, (1 << 19) // max(X_all.shape[0], 1)))    # ma trận d2 (kb,N) ~4MB, vừa cache
+    n_products = int(TOPK) + KNN_MARGIN
+    for s in range(0, vids.shape[0], batch):
+        bv, bp, bprice = vids[s:s + batch], pids[s:s + batch], prices[s:s + batch]
+        Q = scaler.transform(np.column_stack([bprice, perfs[s:s + batch]]))
+        out = []
+        for k in range(0, Q.shape[0], kb):
+            nbrs = index.kneighbors_products_batch(Q[k:k + kb], n_products, bp[k:k + kb].tolist())
+            for j, (_, rows) in enumerate(nbrs, start=k):
+                items = R._rerank(scaler, X_all, Q[j], float(bprice[j]), int(bv[j]), int(bp[j]), rows, t)
+                out.append((int(bv[j]), items))
+        yield out
+
+
+def ndjson_chunks(batches):
+    for b in batches:
+        yield "".join(json.dumps({"variation_id": v, "items": items}, ensure_ascii=False) + "\n"
+                      for v, items in b).encode("utf-8")
+
+
+def bin_chunks(batches):
+    yield _BIN_HEADER.pack(BIN_MAGIC, int(TOPK))
+    for b in batches:
+        buf = bytearray()
+        for v, items in b:
+            buf += _BIN_RECORD.pack(v, len(items))
+            for it in items:
+                buf += _BIN_ITEM.pack(it["variation_id"], it["product_id"], 1 if it["source"] == "fresh" else 0)
+        yield bytes(buf)
+
+
+def read_bin(f):
+    """Đọc lại file bin -> yield (variation_id, [(variation_id, product_id, source)])."""
+    magic, _ = _BIN_HEADER.unpack(f.read(_BIN_HEADER.size))
+    if magic != BIN_MAGIC:
+        raise ValueError("không phải file export RECSX001")
+    while True:
+        head = f.read(_BIN_RECORD.size)
+        if not head:
+            return
+        v, n = _BIN_RECORD.unpack(head)
+        yield v, [_BIN_ITEM.unpack(f.read(_BIN_ITEM.size)) for _ in range(n)]
+
+
+def export_stream(fmt: str = "ndjson", **kw):
+    batches = iter_recommendations(**kw)
+    return bin_chunks(batches) if fmt == "bin" else ndjson_chunks(batches)
@@ -1,6 +1,10 @@
+import numpy as np
 import pandas as pd
-from .bench import lookup_cpu_raw, lookup_gpu_raw, scale_0_100, CPU_P5, CPU_P95, GPU_P5, GPU_P95
-from .rules import rule_cpu_100, rule_gpu_100, ram_100, sto_100
+from .bench import lookup_cpu_raw, lookup_gpu_raw, scale_0_100, cpu_bounds, gpu_bounds
+from .rules import (
+    rule_cpu_100, rule_gpu_100, ram_100, sto_100,
+    rule_cpu_100_batch, rule_gpu_100_batch, ram_100_batch, sto_100_batch
+)
 
 def calculate_perf_from_mapping_or_rule(row: pd.Series):
     """
@@ -12,8 +16,8 @@ def calculate_perf_from_mapping_or_rule(row: pd.Series):
     cpu_raw, cpu_src = lookup_cpu_raw(cpu_name)
     gpu_raw, gpu_src = lookup_gpu_raw(gpu_name)
 
-    cpu100 = scale_0_100(cpu_raw, CPU_P5, CPU_P95) if cpu_raw is not None else rule_cpu_100(cpu_name)
-    gpu100 = scale_0_100(gpu_raw, GPU_P5, GPU_P95) if gpu_raw is not None else rule_gpu_100(gpu_name)
+    cpu100 = scale_0_100(cpu_raw, *cpu_bounds()) if cpu_raw is not None else rule_cpu_100(cpu_name)
+    gpu100 = scale_0_100(gpu_raw, *gpu_bounds()) if gpu_raw is not None else rule_gpu_100(gpu_name)
 
     if cpu_raw is None: cpu_src = "rule"
     if gpu_raw is None: gpu_src = "rule"
@@ -23,3 +27,32 @@ def calculate_perf_from_mapping_or_rule(row: pd.Series):
 
     score = round(0.40 * cpu100 + 0.35 * gpu100 + 0.15 * ram100 + 0.10 * sto100, 2)
     return score, cpu_src, gpu_src, cpu100, gpu100
+
+def _bench_or_rule_batch(names: pd.Series, lookup, bounds, rule_batch):
+    """(score100, src) theo từng dòng; lookup + scale chỉ chạy trên tên unique."""
+    codes, uniq = pd.factorize(names, use_na_sentinel=False)
+    hits = [lookup(u) for u in uniq]
+    lo, hi = bounds()
+    raw = np.array([0.0 if h[0] is None else scale_0_100(h[0], lo, hi) for h in hits], dtype=float)[codes]
+    src = np.array(["rule" if h[0] is None else h[1] for h in hits], dtype=object)[codes]
+    miss = np.array([h[0] is None for h in hits], dtype=bool)[codes]
+    if miss.any():
+        raw[miss] = rule_batch(names[miss])
+    return raw, src
+
+def calculate_perf_batch(df: pd.DataFrame):
+    """
+    Bản theo cột của `calculate_perf_from_mapping_or_rule` (kết quả từng dòng y hệt).
+    Trả về: (score, cpu_src, gpu_src, cpu100, gpu100) dạng np.ndarray.
+    """
+    n = len(df)
+    col = lambda c: (df[c] if c in df.columns else pd.Series([""] * n, index=df.index)).astype(str)
+    cpu_names, gpu_names = col("processor").to_numpy(dtype=object), col("graphics_card").to_numpy(dtype=object)
+    cpu100, cpu_src = _bench_or_rule_batch(cpu_names, lookup_cpu_raw, cpu_bounds, rule_cpu_100_batch)
+    gpu100, gpu_src = _bench_or_rule_batch(gpu_names, lookup_gpu_raw, gpu_bounds, rule_gpu_100_batch)
+    ram100 = ram_100_batch(df["ram"] if "ram" in df.columns else [""] * n)
+    sto100 = sto_100_batch(df["storage"] if "storage" in df.columns else [""] * n)
+    # round() của Python từng phần tử (np.round có thể lệch ở các giá trị .xx5)
+    score = np.array([round(x, 2) for x in (0.40 * cpu100 + 0.35 * gpu100 + 0.15 * ram100 + 0.10 * sto100).tolist()],
+                     dtype=float)
+    return score, cpu_src, gpu_src, cpu100, gpu100
@@ -0,0 +1,140 @@
+"""
+Item response dựng sẵn + encoder cho /recommend.
+
+Mỗi dòng của catalog index có một `Item` dựng một lần lúc load: dict (cache,
+export, meta) kèm bytes JSON (và msgpack nếu có) đã encode sẵn. Response chỉ
+nối các fragment được chọn; item delta / fresh (ít, đổi theo pool) encode lúc trả.
+
+Encoder (RECS_JSON_ENCODER):
+    std    : json stdlib, cùng byte với jsonify của Flask (sort_keys, ensure_ascii, compact)
+    orjson : nhanh hơn, key vẫn sắp, chuỗi UTF-8 thô
+    auto   : orjson nếu đã cài, không thì std
+msgpack (Accept: application/msgpack hoặc ?format=msgpack) chỉ bật khi đã cài `msgpack`.
+
+?include=meta: "meta" được nối vào cuối mỗi item (sau các key đã sắp).
+"""
+import json
+from .config import JSON_ENCODER
+
+try:
+    import orjson
+except ImportError:             # optional
+    orjson = None
+try:
+    import msgpack
+except ImportError:             # optional
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+USE_ORJSON = orjson is not None and JSON_ENCODER in ("auto", "orjson")
+
+
+def dumps(obj) -> bytes:
+    if USE_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, ensure_ascii=True, separators=(",", ":")).encode("ascii")
+
+
+def packb(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+class Item(dict):
+    """Item không đổi sau khi dựng: dict + JSON / msgpack đã encode."""
+    __slots__ = ("json", "mp")
+
+    def __init__(self, d: dict):
+        super().__init__(d)
+        self.json = dumps(d)
+        self.mp = packb(d) if msgpack is not None else None
+
+
+def indexed_items(df) -> list:
+    """Item "indexed" cho mọi dòng DF (cùng field / giá trị với recommend._item)."""
+    def col(c, default):
+        return [str(v) for v in df[c].tolist()] if c in df.columns else [default] * len(df)
+    cpu, gpu = col("cpu_source", "unknown"), col("gpu_source", "unknown")
+    cpu_s, gpu_s = col("cpu_source", "?"), col("gpu_source", "?")
+    rows = zip(df["variation_id"].tolist(), df["product_id"].tolist(), col("product_name", ""),
+               df["price"].astype(float).tolist(), df["performance_score"].astype(float).tolist(),
+               cpu, gpu, cpu_s, gpu_s)
+    return [Item({
+        "variation_id": int(v),
+        "product_id": int(p),
+        "product_name": name,
+        "price": price,
+        "performance_score": perf,
+        "cpu_source": c,
+        "gpu_source": g,
+        "score_source": f"cpu:{cs},gpu:{gs}",
+        "source": "indexed",
+    }) for v, p, name, price, perf, c, g, cs, gs in rows]
+
+
+def items_nbytes(items) -> int:
+    """Bytes của phần đã encode (không tính dict)."""
+    return sum(len(it.json) + len(it.mp or b"") for it in items)
+
+
+def render_json(items, meta_for=None) -> bytes:
+    parts = []
+    for it in items:
+        raw = it.json if type(it) is Item else dumps(it)
+        if meta_for is not None:
+            raw = b"%s,\"meta\":%s}" % (raw[:-1], dumps(meta_for(it["product_id"])))
+        parts.append(raw)
+    return b"[" + b",".join(parts) + b"]\n"
+
+
+def _mp_header(n: int, fix: int, b16: bytes, b32: bytes) -> bytes:
+    if n < 16:
+        return bytes((fix | n,))
+    if n < 0x10000:
+        return b16 + n.to_bytes(2, "big")
+    return b32 + n.to_bytes(4, "big")
+
+
+def _mp_array(n: int) -> bytes:
+    return _mp_header(n, 0x90, b"\xdc", b"\xdd")
+
+
+def _mp_map(n: int) -> bytes:
+    return _mp_header(n, 0x80, b"\xde", b"\xdf")
+
+
+def render_msgpack(items, meta_for=None) -> bytes:
+    parts = [_mp_array(len(items))]
+    for it in items:
+        raw = it.mp if type(it) is Item and it.mp is not None else packb(dict(it))
+        if meta_for is not None:
+            meta = meta_for(it["product_id"])
+            if 0x80 <= raw[0] < 0x8f:           # fixmap: tăng số key rồi nối cặp "meta"
+                raw = bytes((raw[0] + 1,)) + raw[1:] + packb("meta") + packb(meta)
+            else:
+                raw = packb({**it, "meta": meta})
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def negotiate(fmt: str, accept) -> str:
+    """"msgpack" nếu client yêu cầu và đã cài msgpack, "json" nếu không; None: yêu cầu msgpack mà chưa cài."""
+    want = fmt == "msgpack" or (not fmt and accept.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE)
+    if not want:
+        return "json"
+    return "msgpack" if msgpack is not None else None
+
+
+def render(items, fmt: str = "json", meta_for=None, extra: dict = None):
+    """(body, mimetype). extra: trả object {"items": [...], **extra} thay vì list."""
+    if extra is None:
+        if fmt == "msgpack":
+            return render_msgpack(items, meta_for), MSGPACK_MIMETYPE
+        return render_json(items, meta_for), JSON_MIMETYPE
+    keys = sorted(extra)
+    if fmt == "msgpack":
+        body = b"".join([_mp_map(len(keys) + 1), packb("items"), render_msgpack(items, meta_for),
+                         *(packb(k) + packb(extra[k]) for k in keys)])
+        return body, MSGPACK_MIMETYPE
+    fields = [b'"items":' + render_json(items, meta_for)[:-1]] + [dumps(k) + b":" + dumps(extra[k]) for k in keys]
+    return b"{" + b",".join(fields) + b"}\n", JSON_MIMETYPE
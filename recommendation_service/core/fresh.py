@@ -0,0 +1,148 @@
+"""
+Fresh pool + product meta, cache trong bộ nhớ.
+
+Trước đây mỗi request query DB lấy fresh items và chấm điểm lại từng dòng.
+Giờ pool được fetch + chấm điểm (benchmark/rule) một lần mỗi RECS_FRESH_TTL_SEC,
+cùng lúc refresh meta sản phẩm (slug, thumbnail, rating) cho ?include=meta.
+`version` tăng mỗi khi nội dung pool / meta thay đổi.
+"""
+import threading
+import time
+import numpy as np
+import pandas as pd
+from . import deadline
+from .config import FRESH_LIMIT, FRESH_TTL_SEC, META_CACHE
+from .db import fetch_fresh_items_from_db, fetch_product_meta_from_db
+from .etag import digest, frame_digest
+from .features import calculate_perf_batch
+
+
+def score_variations(fresh_df: pd.DataFrame) -> pd.DataFrame:
+    """performance_score + cpu/gpu/score_source cho các dòng product_variations lấy từ DB."""
+    fresh_df = fresh_df.reset_index(drop=True)
+    perf, cpu_srcs, gpu_srcs, _, _ = calculate_perf_batch(fresh_df)
+    fresh_df["performance_score"] = perf
+    fresh_df["cpu_source"] = cpu_srcs
+    fresh_df["gpu_source"] = gpu_srcs
+    fresh_df["score_source"] = np.where(
+        (fresh_df["cpu_source"] != "rule") | (fresh_df["gpu_source"] != "rule"),
+        "fresh:benchmark", "fresh:rule"
+    )
+    return fresh_df
+
+
+def score_fresh_pool(fresh_df: pd.DataFrame, indexed_ids) -> pd.DataFrame:
+    if fresh_df is None or fresh_df.empty:
+        return pd.DataFrame()
+    mask_new = ~fresh_df["variation_id"].isin(indexed_ids)
+    return score_variations(fresh_df.loc[mask_new])
+
+
+def _meta_record(r) -> dict:
+    def _s(v):
+        return None if v is None or (isinstance(v, float) and np.isnan(v)) else v
+    thumb = _s(r.get("thumbnail_url"))
+    rating = _s(r.get("rating_average"))
+    return {
+        "product_name": _s(r.get("product_name")),
+        "slug": _s(r.get("slug")),
+        "thumbnail_url": thumb or None,
+        "image": thumb or _s(r.get("image_url")) or None,
+        "rating_average": float(rating) if rating is not None else None,
+    }
+
+
+class FreshPool:
+    def __init__(self, indexed_ids, indexed_product_ids, ttl: float = FRESH_TTL_SEC):
+        self.indexed_ids = set(int(x) for x in indexed_ids)
+        self.indexed_product_ids = np.unique(np.asarray(indexed_product_ids, dtype=np.int64))
+        self.ttl = float(ttl)
+        self.df = pd.DataFrame()
+        self.meta = {}
+        self.version = 0
+        self.refreshed_at = None            # time.monotonic()
+        self.refreshes = 0
+        self.errors = 0
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._job = None                    # threading.Event của lần refresh đang chạy
+
+    def _stale(self) -> bool:
+        return self.refreshed_at is None or self.ttl <= 0 or time.monotonic() - self.refreshed_at >= self.ttl
+
+    def refresh(self):
+        # +1 để sau khi bỏ variation gốc của request vẫn còn đủ FRESH_LIMIT
+        raw = fetch_fresh_items_from_db(limit=FRESH_LIMIT + 1)
+        if raw is None:                   # lỗi DB: giữ pool cũ (như meta), thử lại sau TTL
+            self.errors += 1
+            df = self.df
+        else:
+            df = score_fresh_pool(raw, self.indexed_ids)
+        meta = self.meta
+        if META_CACHE:
+            pids = self.indexed_product_ids
+            if not df.empty:
+                pids = np.union1d(pids, df["product_id"].to_numpy(np.int64))
+            mdf = fetch_product_meta_from_db(pids)
+            if not mdf.empty:
+                meta = {int(r["product_id"]): _meta_record(r) for _, r in mdf.iterrows()}
+
+        fp = digest(frame_digest(df), repr(sorted(meta.items())))
+        if fp != self._fingerprint:
+            self.df, self.meta = df, meta
+            self._fingerprint = fp
+            self.version += 1
+        self.refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    def get(self) -> pd.DataFrame:
+        """
+        Pool đã chấm điểm; hết TTL thì refresh ở thread nền. Request kích hoạt refresh
+        (và mọi request khi chưa có pool) chờ trong ngân sách còn lại của request
+        (core/deadline.py; ngoài request: chờ tới khi xong), thread khác dùng pool cũ.
+        """
+        if self._stale():
+            with self._lock:
+                job = self._job
+                started = job is None and self._stale()
+                if started:
+                    job = self._job = threading.Event()
+                    threading.Thread(target=self._run_refresh, args=(job,), name="recs-fresh", daemon=True).start()
+            if job is not None and (started or self.refreshed_at is None):
+                if not job.wait(deadline.remaining()):
+                    deadline.degrade("fresh" if self.refreshed_at is None else "fresh-stale")
+        return self.df
+
+    def _run_refresh(self, job):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._job = None
+            job.set()
+
+    def candidates_for(self, base_variation_id: int) -> pd.DataFrame:
+        df = self.get()
+        if df.empty:
+            return df
+        df = df.loc[df["variation_id"] != int(base_variation_id)]
+        return df.iloc[:FRESH_LIMIT].reset_index(drop=True)
+
+    @property
+    def tag(self) -> str:
+        """Tag nội dung pool + meta, giống nhau giữa các replica (dùng cho ETag)."""
+        return self._fingerprint or digest("empty")
+
+    def meta_for(self, product_id: int):
+        return self.meta.get(int(product_id))
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "items": int(self.df.shape[0]),
+            "meta_products": len(self.meta),
+            "ttl_sec": self.ttl,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "age_sec": None if self.refreshed_at is None else round(time.monotonic() - self.refreshed_at, 1),
+        }
@@ -0,0 +1,297 @@
+"""
+kNN index engines dùng chung interface `kneighbors(q_scaled, n_neighbors)`
+-> (dists (1,n), idxs (1,n)), giống `knn_kneighbors_numpy`.
+
+- exact   : float64 brute force trên X_ALL (mặc định, hành vi cũ).
+- compact : float32 structure-of-arrays, buffer tái sử dụng theo thread,
+            so sánh bằng khoảng cách bình phương (không sqrt khi xếp hạng).
+- ivf     : ANN xấp xỉ (xem core/ivf.py), nprobe cấu hình qua RECS_IVF_NPROBE.
+
+Sai số của compact so với float64
+---------------------------------
+Với toạ độ đã scale trong [0, 1] (mọi dòng của X_ALL) và ALPHA + BETA <= 1,
+mỗi phép làm tròn float32 có sai số tương đối u = 2^-24. Lỗi lưu trữ của x, q
+và phép trừ cho |err(dp)| <= 3u; bình phương + nhân trọng số + cộng cho
+
+    |d2_f32 - d2_f64| <= 10u ~= 6e-7
+
+Do đó hai item có d2 (float64) chênh nhau > 1.2e-6 luôn giữ nguyên thứ tự;
+tập láng giềng chỉ có thể khác bản float64 ở các item gần-hoà với khoảng cách
+thứ k (|d2 - d2_k| <= 1.2e-6). Query nằm ngoài [0, 1] (hàng fresh vượt min/max
+của scaler) nới bound theo hệ số max(1, |q|)^2.
+"""
+import threading
+import numpy as np
+from .config import ALPHA, BETA, INDEX_MODE
+from .knn_numpy import knn_kneighbors_numpy
+
+
+class ExactIndex:
+    mode = "exact"
+
+    def __init__(self, X_all: np.ndarray):
+        self.X = X_all
+
+    def __len__(self):
+        return int(self.X.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.X.nbytes)
+
+    def kneighbors(self, q_scaled, n_neighbors: int):
+        return knn_kneighbors_numpy(self.X, q_scaled, n_neighbors)
+
+    def candidate_sq_dists(self, q_scaled, n_needed: int = 0, nprobe: int = None):
+        q = np.asarray(q_scaled, dtype=np.float64).reshape(-1)
+        dp = self.X[:, 0] - q[0]
+        df = self.X[:, 1] - q[1]
+        return None, ALPHA * dp * dp + BETA * df * df
+
+    def permuted(self, order):
+        return ExactIndex(self.X[order])
+
+    def sq_dists_batch(self, Q) -> np.ndarray:
+        """(B,N) d2 cho B query, cùng phép tính với candidate_sq_dists."""
+        Q = np.asarray(Q, dtype=np.float64).reshape(-1, 2)
+        dp = self.X[None, :, 0] - Q[:, 0:1]
+        df = self.X[None, :, 1] - Q[:, 1:2]
+        return ALPHA * dp * dp + BETA * df * df
+
+
+class CompactIndex:
+    mode = "compact"
+
+    def __init__(self, X_all: np.ndarray, alpha: float = ALPHA, beta: float = BETA):
+        X = np.asarray(X_all)
+        self.price = np.ascontiguousarray(X[:, 0], dtype=np.float32)
+        self.perf = np.ascontiguousarray(X[:, 1], dtype=np.float32)
+        self.alpha = np.float32(alpha)
+        self.beta = np.float32(beta)
+        self._tls = threading.local()
+
+    def __len__(self):
+        return int(self.price.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.price.nbytes + self.perf.nbytes)
+
+    def _buffers(self):
+        n = self.price.shape[0]
+        bufs = getattr(self._tls, "bufs", None)
+        if bufs is None or bufs[0].shape[0] != n:
+            bufs = (np.empty(n, np.float32), np.empty(n, np.float32), np.empty(n, np.bool_))
+            self._tls.bufs = bufs
+        return bufs
+
+    def sq_dists(self, q_scaled) -> np.ndarray:
+        """d2 = ALPHA*dp^2 + BETA*df^2 vào buffer của thread hiện tại (không cấp phát)."""
+        q = np.asarray(q_scaled, dtype=np.float32).reshape(-1)
+        d2, tmp, _ = self._buffers()
+        np.subtract(self.price, q[0], out=tmp)
+        np.multiply(tmp, tmp, out=tmp)
+        np.multiply(tmp, self.alpha, out=d2)
+        np.subtract(self.perf, q[1], out=tmp)
+        np.multiply(tmp, tmp, out=tmp)
+        np.multiply(tmp, self.beta, out=tmp)
+        np.add(d2, tmp, out=d2)
+        return d2
+
+    def candidate_sq_dists(self, q_scaled, n_needed: int = 0, nprobe: int = None):
+        return None, self.sq_dists(q_scaled)
+
+    def permuted(self, order):
+        idx = CompactIndex.__new__(CompactIndex)
+        idx.price, idx.perf = self.price[order], self.perf[order]
+        idx.alpha, idx.beta, idx._tls = self.alpha, self.beta, threading.local()
+        return idx
+
+    def sq_dists_batch(self, Q) -> np.ndarray:
+        Q = np.asarray(Q, dtype=np.float32).reshape(-1, 2)
+        tmp = self.price[None, :] - Q[:, 0:1]
+        d2 = tmp * tmp * self.alpha
+        tmp = self.perf[None, :] - Q[:, 1:2]
+        return d2 + tmp * tmp * self.beta
+
+    def kneighbors(self, q_scaled, n_neighbors: int):
+        N = self.price.shape[0]
+        n = min(int(n_neighbors), N)
+        if n <= 0:
+            return np.empty((1, 0)), np.empty((1, 0), dtype=np.int64)
+        d2 = self.sq_dists(q_scaled)
+        _, tmp, mask = self._buffers()
+
+        # ngưỡng d2 thứ n: partition tại chỗ trên bản sao trong buffer
+        np.copyto(tmp, d2)
+        tmp.partition(n - 1)
+        kth = tmp[n - 1]
+        np.less_equal(d2, kth, out=mask)
+        cand = np.flatnonzero(mask)
+
+        order = np.argsort(d2[cand], kind="stable")[:n]
+        idx_sorted = cand[order]
+        d_sorted = np.sqrt(d2[idx_sorted].astype(np.float64))
+        return d_sorted.reshape(1, -1), idx_sorted.reshape(1, -1)
+
+
+class ProductGroupedIndex:
+    """
+    Top-n sản phẩm *khác nhau* trong một lượt: mỗi product đại diện bởi biến thể
+    gần query nhất, nên dedup theo product_id ở bước rerank không bao giờ làm
+    thiếu TOPK (miễn catalog còn đủ product).
+
+    Engine full-scan (exact/compact): min theo product bằng `np.minimum.reduceat`
+    trên các dòng đã gom theo product -> O(N + P). Engine IVF: gom trên tập ứng
+    viên của các cell được probe, tự nhân đôi nprobe khi chưa đủ product.
+    """
+
+    def __init__(self, engine, product_ids: np.ndarray):
+        self.engine = engine
+        pids = np.asarray(product_ids, dtype=np.int64)
+        self.product_ids, self.codes = np.unique(pids, return_inverse=True)
+        self.order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes, minlength=self.product_ids.shape[0])
+        self.starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        self.ends = self.starts + counts
+        self.dead = np.zeros(len(engine), dtype=bool)     # tombstone (change feed)
+        self._dead_rows = np.empty(0, dtype=np.int64)
+        self._tls = threading.local()
+        self._grouped = None              # (engine đã sắp theo product, vị trí của từng dòng) cho batch
+
+    def __len__(self):
+        return int(self.product_ids.shape[0])
+
+    @property
+    def mode(self):
+        return self.engine.mode
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.engine.nbytes + self.codes.nbytes + self.order.nbytes + self.dead.nbytes
+                   + self.starts.nbytes + self.ends.nbytes + self.product_ids.nbytes)
+
+    def kneighbors(self, q_scaled, n_neighbors: int):
+        return self.engine.kneighbors(q_scaled, n_neighbors)
+
+    def set_dead(self, rows):
+        """Đánh dấu dòng đã xoá / bị thay thế; query bỏ qua chúng (O(#dead) mỗi query)."""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if rows.size:
+            self.dead[rows] = True
+            self._dead_rows = np.flatnonzero(self.dead)
+
+    def _code_of(self, product_id):
+        if product_id is None:
+            return -1
+        c = int(np.searchsorted(self.product_ids, int(product_id)))
+        return c if c < self.product_ids.shape[0] and self.product_ids[c] == int(product_id) else -1
+
+    def _gather(self, d2):
+        buf = getattr(self._tls, "buf", None)
+        if buf is None or buf.shape[0] != d2.shape[0] or buf.dtype != d2.dtype:
+            buf = np.empty_like(d2)
+            self._tls.buf = buf
+        return np.take(d2, self.order, out=buf)
+
+    @staticmethod
+    def _select(mins, n, ex_code):
+        """n product có min d2 nhỏ nhất (mins bị sửa tại chỗ)."""
+        if ex_code >= 0:
+            mins[ex_code] = np.inf
+        n = min(n, mins.shape[0] - (1 if ex_code >= 0 else 0))
+        if n <= 0:
+            return np.empty(0, np.int64)
+        top = np.argpartition(mins, n - 1)[:n]
+        top = top[np.argsort(mins[top], kind="stable")]
+        return top[np.isfinite(mins[top])]
+
+    def _top_full(self, d2, n, ex_code):
+        dead = self._dead_rows
+        if dead.size:
+            d2[dead] = np.inf             # d2 là mảng tạm / buffer của thread
+        mins = np.minimum.reduceat(self._gather(d2), self.starts)
+        top = self._select(mins, n, ex_code)
+        if not top.shape[0]:
+            return np.empty(0, np.int64), np.empty(0)
+        n = top.shape[0]
+        rows = np.empty(n, dtype=np.int64)
+        for j, c in enumerate(top):
+            grp = self.order[self.starts[c]:self.ends[c]]
+            rows[j] = grp[np.argmin(d2[grp])]
+        return rows, mins[top]
+
+    def _top_subset(self, rows, d2, n, ex_code):
+        codes = self.codes[rows]
+        keep = (codes != ex_code) & ~self.dead[rows]
+        rows, d2, codes = rows[keep], d2[keep], codes[keep]
+        o = np.lexsort((d2, codes))                       # theo product, rồi theo khoảng cách
+        first = np.ones(o.shape[0], dtype=bool)
+        first[1:] = codes[o][1:] != codes[o][:-1]
+        best = o[first]                                   # biến thể gần nhất của từng product
+        sel = best[np.argsort(d2[best], kind="stable")[:n]]
+        return rows[sel], d2[sel]
+
+    def kneighbors_products(self, q_scaled, n_products: int, exclude_product=None):
+        """
+        return (dists[[...]], idxs[[...]]) — idxs là dòng X_ALL của biến thể đại diện,
+        tối đa n_products product khác nhau (không tính exclude_product).
+        """
+        ex_code = self._code_of(exclude_product)
+        avail = len(self) - (1 if ex_code >= 0 else 0)
+        n = min(int(n_products), avail)
+        nprobe = None
+        while True:
+            rows, d2 = self.engine.candidate_sq_dists(q_scaled, n_needed=n, nprobe=nprobe)
+            if rows is None:
+                sel, sd2 = self._top_full(d2, n, ex_code)
+                break
+            sel, sd2 = self._top_subset(rows, d2, n, ex_code)
+            if sel.shape[0] >= n or rows.shape[0] >= len(self.engine):
+                break
+            nprobe = min(2 * (nprobe or self.engine.nprobe), self.engine.nlist)
+        d = np.sqrt(np.asarray(sd2, dtype=np.float64))
+        return d.reshape(1, -1), sel.reshape(1, -1)
+
+    def kneighbors_products_batch(self, Q, n_products: int, exclude_products):
+        """
+        Bản batch của kneighbors_products cho B query -> list[(dists (n,), rows (n,))],
+        kết quả giống hệt gọi từng query. Engine full-scan: quét một bản sao engine
+        đã sắp theo product (tạo lần đầu gọi, không cần gather mỗi query), ma trận
+        d2 (B,N) + `np.minimum.reduceat` trên trục 1. IVF: lặp từng query.
+        """
+        Q = np.asarray(Q, dtype=np.float64).reshape(-1, 2)
+        if not hasattr(self.engine, "permuted"):
+            return [tuple(a[0] for a in self.kneighbors_products(q, n_products, ex))
+                    for q, ex in zip(Q, exclude_products)]
+        if self._grouped is None:
+            pos = np.empty_like(self.order)
+            pos[self.order] = np.arange(self.order.shape[0])
+            self._grouped = (self.engine.permuted(self.order), pos)
+        engine, pos = self._grouped
+        D2 = engine.sq_dists_batch(Q)
+        if self._dead_rows.size:
+            D2[:, pos[self._dead_rows]] = np.inf
+        mins = np.minimum.reduceat(D2, self.starts, axis=1)
+        out = []
+        for b, ex in enumerate(exclude_products):
+            ex_code = self._code_of(ex)
+            n = min(int(n_products), len(self) - (1 if ex_code >= 0 else 0))
+            row_mins = mins[b].copy()
+            top = self._select(row_mins, n, ex_code)
+            d2 = D2[b]
+            rows = np.array([self.order[s + np.argmin(d2[s:e])]
+                             for s, e in zip(self.starts[top].tolist(), self.ends[top].tolist())], dtype=np.int64)
+            out.append((np.sqrt(np.asarray(row_mins[top], dtype=np.float64)), rows))
+        return out
+
+
+def build_knn_index(X_all: np.ndarray, mode: str = INDEX_MODE):
+    if mode == "compact":
+        return CompactIndex(X_all)
+    if mode == "ivf":
+        from .ivf import load_ivf_index
+        return load_ivf_index(X_all)
+    if mode == "exact":
+        return ExactIndex(X_all)
+    raise ValueError(f"Unknown RECS_INDEX_MODE: {mode}")
@@ -0,0 +1,169 @@
+"""
+IVF (inverted file) ANN engine, NumPy thuần.
+
+Coarse quantizer = k-means trên không gian đã nhân trọng số
+(sqrt(ALPHA), sqrt(BETA)) nên khoảng cách Euclid ở đó bằng đúng
+khoảng cách có trọng số của `knn_kneighbors_numpy`. Mỗi query chỉ quét
+`nprobe` cell gần nhất; nprobe = nlist cho kết quả bằng exact (trừ thứ tự
+các item hoà khoảng cách).
+
+Artifact `knn_ivf.npz` (do train_recommend.py / build_ivf.py tạo):
+    centroids (nlist,2) trong không gian đã scale (chưa nhân trọng số),
+    order (N,)  : chỉ số dòng X_ALL sắp theo cell,
+    offsets (nlist+1,), n_items, x_sum (checksum để khớp với X_ALL).
+"""
+import os
+import numpy as np
+from .config import ALPHA, BETA, IVF_NLIST, IVF_NPROBE, IVF_PATH
+
+IVF_FORMAT_VERSION = 1
+
+
+def _weights(alpha=ALPHA, beta=BETA):
+    return np.sqrt(np.array([alpha, beta], dtype=np.float64))
+
+
+def default_nlist(n_items: int) -> int:
+    return max(1, min(n_items, int(np.sqrt(max(n_items, 1)))))
+
+
+def kmeans(Xw: np.ndarray, k: int, n_iter: int = 20, seed: int = 0, sample: int = 256 * 1024):
+    """Lloyd k-means (khởi tạo k-means++ trên mẫu con)."""
+    rng = np.random.default_rng(seed)
+    N = Xw.shape[0]
+    S = Xw[rng.choice(N, size=min(N, sample), replace=False)] if N > sample else Xw
+    k = min(k, S.shape[0])
+
+    I = S[rng.choice(S.shape[0], size=min(S.shape[0], 16 * k), replace=False)]
+    C = np.empty((k, Xw.shape[1]), dtype=np.float64)
+    C[0] = I[rng.integers(I.shape[0])]
+    d2 = ((I - C[0]) ** 2).sum(1)
+    for j in range(1, k):
+        tot = d2.sum()
+        i = rng.choice(I.shape[0], p=d2 / tot) if tot > 0 else rng.integers(I.shape[0])
+        C[j] = I[i]
+        d2 = np.minimum(d2, ((I - C[j]) ** 2).sum(1))
+
+    for _ in range(n_iter):
+        assign = assign_cells(S, C)
+        cnt = np.bincount(assign, minlength=k)
+        new = np.zeros_like(C)
+        for dim in range(C.shape[1]):
+            new[:, dim] = np.bincount(assign, weights=S[:, dim], minlength=k)
+        empty = cnt == 0
+        new[~empty] /= cnt[~empty, None]
+        new[empty] = C[empty]
+        if np.allclose(new, C):
+            C = new
+            break
+        C = new
+    return C
+
+
+def assign_cells(Xw: np.ndarray, C: np.ndarray) -> np.ndarray:
+    out = np.empty(Xw.shape[0], dtype=np.int64)
+    cc = (C * C).sum(1)
+    chunk = max(1024, (1 << 22) // max(C.shape[0], 1))     # ~32MB ma trận tạm mỗi block
+    for s in range(0, Xw.shape[0], chunk):
+        blk = Xw[s:s + chunk]
+        d2 = cc[None, :] - 2.0 * blk @ C.T
+        out[s:s + chunk] = np.argmin(d2, axis=1)
+    return out
+
+
+def build_ivf(X_all: np.ndarray, nlist: int = IVF_NLIST, alpha=ALPHA, beta=BETA, seed: int = 0) -> dict:
+    X = np.asarray(X_all, dtype=np.float64)
+    N = X.shape[0]
+    nlist = int(nlist) if int(nlist) > 0 else default_nlist(N)
+    w = _weights(alpha, beta)
+    Xw = X * w
+    Cw = kmeans(Xw, nlist, seed=seed)
+    assign = assign_cells(Xw, Cw)
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    counts = np.bincount(assign, minlength=Cw.shape[0])
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return {
+        "format_version": np.int64(IVF_FORMAT_VERSION),
+        "centroids": Cw / w,
+        "order": order,
+        "offsets": offsets,
+        "n_items": np.int64(N),
+        "x_sum": np.float64(X.sum()),
+    }
+
+
+def save_ivf(art: dict, path: str = IVF_PATH):
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **art)
+    os.replace(tmp, path)
+
+
+def load_ivf(path: str = IVF_PATH):
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        return {k: z[k] for k in z.files}
+
+
+class IVFIndex:
+    mode = "ivf"
+
+    def __init__(self, X_all: np.ndarray, art: dict, nprobe: int = IVF_NPROBE, alpha=ALPHA, beta=BETA):
+        X = np.asarray(X_all, dtype=np.float64)
+        if int(art["n_items"]) != X.shape[0] or not np.isclose(float(art["x_sum"]), float(X.sum())):
+            raise ValueError("IVF artifact không khớp với X_ALL (hãy build lại)")
+        w = _weights(alpha, beta)
+        self.order = art["order"]
+        self.offsets = art["offsets"]
+        self.centroids = art["centroids"] * w
+        self.Xw = np.ascontiguousarray(X[self.order] * w)     # dòng sắp theo cell
+        self.nlist = int(self.centroids.shape[0])
+        self.nprobe = max(1, min(int(nprobe), self.nlist))
+        self._w = w
+
+    def __len__(self):
+        return int(self.Xw.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.Xw.nbytes + self.order.nbytes + self.offsets.nbytes + self.centroids.nbytes)
+
+    def _probe_ranges(self, qw, n_needed: int, nprobe: int):
+        dc = ((self.centroids - qw) ** 2).sum(1)
+        cells = np.argsort(dc)
+        sizes = self.offsets[cells + 1] - self.offsets[cells]
+        # luôn quét đủ nprobe cell, mở rộng thêm nếu chưa đủ n ứng viên
+        covered = np.cumsum(sizes)
+        need = int(np.searchsorted(covered, n_needed)) + 1
+        take = max(min(nprobe, self.nlist), min(need, self.nlist))
+        return [(int(self.offsets[c]), int(self.offsets[c + 1])) for c in cells[:take]]
+
+    def candidate_sq_dists(self, q_scaled, n_needed: int = 0, nprobe: int = None):
+        """(rows, d2) cho các dòng trong những cell được probe."""
+        q = np.asarray(q_scaled, dtype=np.float64).reshape(-1)
+        qw = q * self._w
+        ranges = self._probe_ranges(qw, n_needed, nprobe or self.nprobe)
+        pos = np.concatenate([np.arange(a, b) for a, b in ranges if b > a]) if ranges else np.empty(0, np.int64)
+        diff = self.Xw[pos] - qw
+        return self.order[pos], (diff * diff).sum(1)
+
+    def kneighbors(self, q_scaled, n_neighbors: int, nprobe: int = None):
+        n = min(int(n_neighbors), len(self))
+        if n <= 0:
+            return np.empty((1, 0)), np.empty((1, 0), dtype=np.int64)
+        rows, d2 = self.candidate_sq_dists(q_scaled, n, nprobe)
+        k = min(n, d2.shape[0])
+        part = np.argpartition(d2, k - 1)[:k] if k < d2.shape[0] else np.arange(d2.shape[0])
+        part = part[np.argsort(d2[part], kind="stable")]
+        return np.sqrt(d2[part]).reshape(1, -1), rows[part].reshape(1, -1)
+
+
+def load_ivf_index(X_all: np.ndarray, path: str = IVF_PATH, nprobe: int = IVF_NPROBE):
+    """Nạp artifact IVF; thiếu / lệch version / lệch X_ALL thì build lại trong bộ nhớ."""
+    art = load_ivf(path)
+    if art is not None and int(art.get("format_version", 0)) == IVF_FORMAT_VERSION:
+        try:
+            return IVFIndex(X_all, art, nprobe=nprobe)
+        except ValueError:
+            pass
+    return IVFIndex(X_all, build_ivf(X_all), nprobe=nprobe)
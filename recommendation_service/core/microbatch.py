@@ -0,0 +1,157 @@
+"""
+Micro-batching kNN cho các request /recommend đồng thời (RECS_MICROBATCH, mặc định tắt).
+
+Query đầu tiên mở một batch và chờ tối đa RECS_MICROBATCH_WINDOW_MS; các query
+đến trong lúc đó vào cùng batch. Batch chạy sớm khi đủ RECS_MICROBATCH_MAX query
+hoặc khi mọi request đang chạy recommend_core (`in_flight()`) đã vào batch — tải
+thấp (một request) thì không phải chờ. Query mở batch (leader) tính kNN cho cả
+batch bằng `kneighbors_products_batch` — một phép tính ma trận (B,N) trên X_ALL,
+NumPy nhả GIL trong lúc tính — rồi trả kết quả cho từng request. Kết quả giống hệt gọi `kneighbors_products`
+từng query.
+
+Engine IVF không có bản batch thật nên luôn đi thẳng, không chờ.
+"""
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class _Batch:
+    __slots__ = ("index", "n", "queries", "excludes", "arrivals", "full", "done", "results", "error")
+
+    def __init__(self, index, n):
+        self.index = index
+        self.n = n
+        self.queries, self.excludes, self.arrivals = [], [], []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    def __init__(self, window_ms: float, max_batch: int, block_elems: int = 1 << 19):
+        self.window = max(0.0, float(window_ms)) / 1e3
+        self.max_batch = max(1, int(max_batch))
+        self.block_elems = block_elems        # ma trận d2 mỗi lần tính ~4MB
+        self._lock = threading.Lock()
+        self._open = None
+        self.inflight = 0
+        self.batches = 0
+        self.queries = 0
+        self.direct = 0
+        self.window_wait = 0.0                # leader chờ gom batch
+        self.queue_wait = 0.0                 # tổng (bắt đầu tính - lúc đến) của mọi query
+        self.batched_compute = 0.0            # batch >= 2 query
+        self.batched_queries = 0
+        self.single_compute = 0.0             # batch chỉ có 1 query (tính như không batch)
+        self.single_batches = 0
+        self.max_seen = 0
+
+    @contextmanager
+    def in_flight(self):
+        """Bao quanh một request: batch không chờ request không còn tới."""
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.inflight -= 1
+                b = self._open
+                if b is not None and len(b.queries) >= self.inflight:
+                    self._open = None
+                    b.full.set()
+
+    def kneighbors_products(self, index, q_scaled, n_products: int, exclude_product=None):
+        """Cùng chữ ký / kết quả với index.kneighbors_products."""
+        if not hasattr(index.engine, "permuted"):
+            return index.kneighbors_products(q_scaled, n_products, exclude_product=exclude_product)
+        now = time.perf_counter()
+        with self._lock:
+            b = self._open
+            if b is None:
+                b = self._open = _Batch(index, n_products)
+                leader = True
+            elif b.index is index and b.n == n_products:
+                leader = False
+            else:
+                b = None                       # batch đang mở thuộc index cũ (vừa rescale)
+            if b is not None:
+                slot = len(b.queries)
+                b.queries.append(np.asarray(q_scaled, dtype=np.float64).reshape(2))
+                b.excludes.append(exclude_product)
+                b.arrivals.append(now)
+                if len(b.queries) >= min(self.max_batch, max(self.inflight, 1)):
+                    self._open = None
+                    b.full.set()
+        if b is None:
+            with self._lock:
+                self.direct += 1
+            return index.kneighbors_products(q_scaled, n_products, exclude_product=exclude_product)
+
+        if leader:
+            b.full.wait(self.window)
+            with self._lock:
+                if self._open is b:
+                    self._open = None
+            self._run(b, now)
+        else:
+            b.done.wait()
+        if b.error is not None:
+            raise b.error
+        d, rows = b.results[slot]
+        return d.reshape(1, -1), rows.reshape(1, -1)
+
+    def _run(self, b: _Batch, opened: float):
+        start = time.perf_counter()
+        n = len(b.queries)
+        try:
+            if n == 1:
+                d, rows = b.index.kneighbors_products(b.queries[0], b.n, exclude_product=b.excludes[0])
+                b.results = [(d[0], rows[0])]
+            else:
+                Q = np.vstack(b.queries)
+                kb = max(1, self.block_elems // max(len(b.index.engine), 1))
+                b.results = []
+                for k in range(0, n, kb):
+                    b.results += b.index.kneighbors_products_batch(Q[k:k + kb], b.n, b.excludes[k:k + kb])
+        except BaseException as e:
+            b.error = e
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.queries += n
+                self.max_seen = max(self.max_seen, n)
+                self.window_wait += start - opened
+                self.queue_wait += sum(start - a for a in b.arrivals)
+                if n == 1:
+                    self.single_batches += 1
+                    self.single_compute += end - start
+                else:
+                    self.batched_queries += n
+                    self.batched_compute += end - start
+            b.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            per_q = self.batched_compute / self.batched_queries if self.batched_queries else None
+            single = self.single_compute / self.single_batches if self.single_batches else None
+            return {
+                "window_ms": self.window * 1e3,
+                "in_flight": self.inflight,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "queries": self.queries,
+                "direct": self.direct,
+                "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_seen,
+                "avg_window_wait_ms": round(self.window_wait / self.batches * 1e3, 3) if self.batches else 0.0,
+                "avg_queue_wait_ms": round(self.queue_wait / self.queries * 1e3, 3) if self.queries else 0.0,
+                "single_query_ms": None if single is None else round(single * 1e3, 4),
+                "batched_per_query_ms": None if per_q is None else round(per_q * 1e3, 4),
+                # thời gian kNN / query: batch 1 query chia cho batch nhiều query
+                "compute_speedup": round(single / per_q, 2) if single and per_q else None,
+            }
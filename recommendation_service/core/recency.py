@@ -8,32 +8,36 @@ def recency_boost(sim: float, age_days: float) -> float:
     recency = np.exp(-float(age_days) / max(RECENCY_HALFLIFE, 1e-6))
     return sim * (1.0 + RECENCY_GAMMA * recency)
 
-def score_fresh_candidates(SCALER, q_scaled, q_base_price, fresh_df):
+def candidate_sims(q_scaled, q_base_price, X, prices, ages=None) -> np.ndarray:
+    """
+    Vector hoá công thức sim của rerank cho cả mảng ứng viên:
+    1 / (1e-6 + d * (1 + phạt nhảy giá)), nhân recency boost nếu có tuổi.
+    Cùng thứ tự phép tính với bản từng dòng nên cho kết quả y hệt.
+    """
+    X = np.asarray(X, dtype=np.float64).reshape(-1, 2)
+    prices = np.asarray(prices, dtype=np.float64)
+    dp = q_scaled[0] - X[:, 0]
+    df = q_scaled[1] - X[:, 1]
+    d = np.sqrt(ALPHA * dp * dp + BETA * df * df)
+    pen = np.zeros_like(prices)
+    if q_base_price > 0:
+        up = prices > q_base_price
+        pen[up] = LAMBDA_PRICE_JUMP * ((prices[up] - q_base_price) / q_base_price)
+    sim = 1.0 / (1e-6 + d * (1.0 + pen))
+    if ages is not None and RECENCY_GAMMA > 0:
+        recency = np.exp(-np.asarray(ages, dtype=np.float64) / max(RECENCY_HALFLIFE, 1e-6))
+        sim = sim * (1.0 + RECENCY_GAMMA * recency)
+    return sim
+
+def fresh_sims(SCALER, q_scaled, q_base_price, fresh_df) -> np.ndarray:
     if fresh_df is None or fresh_df.empty:
-        return []
-
+        return np.empty(0)
     X_fresh = SCALER.transform(fresh_df[["price", "performance_score"]].values)
-    out = []
-
     ages = None
     if "ts" in fresh_df.columns:
         ages = (pd.Timestamp.utcnow() - pd.to_datetime(fresh_df["ts"], utc=True)).dt.total_seconds() / (3600 * 24)
-        ages = np.clip(ages, 0, 3650)
-
-    for i in range(X_fresh.shape[0]):
-        x = X_fresh[i]
-        dp = q_scaled[0] - x[0]
-        df = q_scaled[1] - x[1]
-        d = np.sqrt(ALPHA * dp * dp + BETA * df * df)
+        ages = np.clip(ages.to_numpy(dtype=np.float64), 0, 3650)
+    return candidate_sims(q_scaled, q_base_price, X_fresh, fresh_df["price"].to_numpy(), ages)
 
-        p_i = float(fresh_df.iloc[i]["price"])
-        price_jump_pen = 0.0
-        if p_i > q_base_price and q_base_price > 0:
-            price_jump_pen = LAMBDA_PRICE_JUMP * ((p_i - q_base_price) / q_base_price)
-        sim = 1.0 / (1e-6 + d * (1.0 + price_jump_pen))
-
-        if ages is not None:
-            sim = recency_boost(sim, float(ages.iloc[i]))
-
-        out.append((i, sim))
-    return out
+def score_fresh_candidates(SCALER, q_scaled, q_base_price, fresh_df):
+    return list(enumerate(fresh_sims(SCALER, q_scaled, q_base_price, fresh_df).tolist()))
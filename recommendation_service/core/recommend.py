@@ -1,144 +1,374 @@
+import heapq
+import itertools
+import threading
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 from .config import (
-    TOPK, LAMBDA_PRICE_JUMP,
-    DF_PATH, SCALER_PATH, XALL_PATH, VARIDS_PATH
+    TOPK, KNN_MARGIN, SHM_MODE, SHARDS_MODE, MICROBATCH, MICROBATCH_WINDOW_MS, MICROBATCH_MAX,
+    LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL, MISS_CACHE_SIZE, MISS_CACHE_TTL,
+    DF_PATH, XALL_PATH, VARIDS_PATH
 )
-from .db import fetch_one_variation_from_db, fetch_fresh_items_from_db
+from .db import fetch_one_variation_from_db, fetch_variations_from_db, fetch_variation_changes_since
+from . import deadline, timing
+from .cache import TTLCache
+from .catalog import load_catalog, frame_bytes, RowLookup
+from .etag import digest, frame_digest
+from .delta import DeltaIndex
+from .fresh import FreshPool, score_variations
 from .features import calculate_perf_from_mapping_or_rule
-from .knn_numpy import knn_kneighbors_numpy, euclid_weighted
-from .recency import score_fresh_candidates
-import joblib
+from .fragments import indexed_items, items_nbytes
+from .index import build_knn_index, ProductGroupedIndex
+from .microbatch import MicroBatcher
+from .recency import candidate_sims, fresh_sims
+from .scaler import load_scaler
 
 # ---- load artifacts tại import-time
-DF = pd.read_pickle(DF_PATH)
-SCALER = joblib.load(SCALER_PATH)
-X_ALL = np.load(XALL_PATH)                 # (N,2)
-VAR_IDS = np.load(VARIDS_PATH)             # (N,)
+SCALER = load_scaler()
+if SHM_MODE == "attach":
+    # index + fresh pool do shm_loader.py publish; worker chỉ attach read-only
+    from .shm import attach_index, ShmFreshPool
+    DF, X_ALL, VAR_IDS, _INDEX_SNAPSHOT = attach_index()
+    FRESH_POOL = ShmFreshPool()
+else:
+    DF = load_catalog(DF_PATH)
+    X_ALL = np.load(XALL_PATH)             # (N,2)
+    VAR_IDS = np.load(VARIDS_PATH)         # (N,)
+    FRESH_POOL = FreshPool(DF["variation_id"].to_numpy(), DF["product_id"].to_numpy())
+def _build_index(scaler, X):
+    if SHARDS_MODE == "off":
+        return ProductGroupedIndex(build_knn_index(X), DF["product_id"].to_numpy())
+    from .shards import build_sharded_index
+    return build_sharded_index(X, VAR_IDS, DF["price"].to_numpy(), DF["performance_score"].to_numpy(),
+                               DF["product_id"].to_numpy(), scaler, SHARDS_MODE)
+
+KNN_INDEX = _build_index(SCALER, X_ALL)
+ROW_OF = RowLookup(DF["variation_id"].to_numpy())     # variation_id -> dòng DF/X_ALL
+DF_PRICES = DF["price"].to_numpy(dtype=np.float64)
+DF_PRODUCT_IDS = DF["product_id"].to_numpy(dtype=np.int64)
+ROWS_OF_PRODUCT = RowLookup(DF_PRODUCT_IDS)          # product_id -> các dòng DF (change feed theo product)
+DF_ITEMS = indexed_items(DF)          # item response dựng + encode sẵn cho từng dòng DF
+DELTA = DeltaIndex()
+RESCALES = 0
+# đọc một lần mỗi request để scaler / X_ALL / index luôn khớp nhau khi change feed rescale
+_SCALED = (SCALER, X_ALL, KNN_INDEX)
+_APPLY_LOCK = threading.Lock()
+BATCHER = MicroBatcher(MICROBATCH_WINDOW_MS, MICROBATCH_MAX) if MICROBATCH else None
+# biến thể ngoài index: đã chấm điểm / không tồn tại (xem _lookup_out_of_index)
+LOOKUP_CACHE = TTLCache(maxsize=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL)
+MISS_CACHE = TTLCache(maxsize=MISS_CACHE_SIZE, ttl=MISS_CACHE_TTL)
+_LOOKUP_GEN = None
+
+def index_version() -> tuple:
+    """Đổi khi change feed áp dụng thay đổi lên index (dùng làm khoá cache)."""
+    return (DELTA.generation, RESCALES)
+
+def validate_artifacts():
+    """
+    (errors, warnings) về nhất quán giữa các artifact đã load. errors: /readyz
+    không ready. warnings: chỉ báo — X_ALL lệch scaler (train ở lần khác) vẫn
+    phục vụ được, chỉ là query vector và X_ALL không cùng thang.
+    """
+    errors, warnings = [], []
+    n = int(DF.shape[0])
+    if n == 0:
+        errors.append("catalog is empty")
+    if X_ALL.shape != (n, 2):
+        errors.append(f"knn_X_all shape {list(X_ALL.shape)} != ({n}, 2)")
+    elif not np.isfinite(X_ALL).all():
+        errors.append("knn_X_all has non-finite values")
+    elif n:
+        err = np.abs(SCALER.transform(DF[["price", "performance_score"]].values) - X_ALL).max()
+        if err > 1e-6:
+            warnings.append(f"knn_X_all differs from scaler(price, performance_score) by up to {err:.4g}")
+    if VAR_IDS.shape != (n,) or not np.array_equal(VAR_IDS, DF["variation_id"].to_numpy()):
+        errors.append("knn_variation_ids do not match catalog variation_id")
+    return errors, warnings
+
+ARTIFACT_ERRORS, ARTIFACT_WARNINGS = validate_artifacts()
+
+# artifacts đang phục vụ (X_ALL, id, catalog, scaler) -> một phần của ETag
+ARTIFACT_TAG = digest(X_ALL, VAR_IDS, frame_digest(DF), SCALER.scale_, SCALER.min_)
+_INDEX_TAG = (None, None)
+
+def index_tag() -> str:
+    """Tag nội dung của delta + tombstone (không phụ thuộc thứ tự áp dụng), cache theo index_version."""
+    global _INDEX_TAG
+    v = index_version()
+    if _INDEX_TAG[0] != v:
+        _INDEX_TAG = (v, digest(frame_digest(DELTA.frame(), sort_by="variation_id"), KNN_INDEX._dead_rows))
+    return _INDEX_TAG[1]
+
+def _rescale(new_scaler):
+    """Bounds của scaler đổi: tính lại X_ALL, build lại index (giữ tombstone)."""
+    global SCALER, X_ALL, KNN_INDEX, _SCALED, RESCALES
+    X = new_scaler.transform(DF[["price", "performance_score"]].values)
+    if SHARDS_MODE == "off":
+        idx = ProductGroupedIndex(build_knn_index(X), DF["product_id"].to_numpy())
+    else:
+        idx = KNN_INDEX.rescaled(new_scaler)      # shard tự tính lại X của mình
+    idx.set_dead(np.flatnonzero(KNN_INDEX.dead))
+    SCALER, X_ALL, KNN_INDEX = new_scaler, X, idx
+    _SCALED = (new_scaler, X, idx)
+    RESCALES += 1
+
+def apply_variation_changes(variation_ids=(), product_ids=()):
+    """
+    Áp dụng thay đổi của product_variations (từ change feed) lên index trong bộ nhớ:
+    chỉ fetch + chấm điểm lại các dòng bị đổi; dòng cũ trong X_ALL bị tombstone,
+    bản mới vào DELTA. Scaler chỉ được fit lại khi giá / điểm vượt bounds hiện tại.
+    """
+    ids = {int(v) for v in variation_ids}
+    if product_ids:
+        pids = {int(p) for p in product_ids}
+        ids |= set(DF["variation_id"].to_numpy()[ROWS_OF_PRODUCT.rows_of(pids)].tolist())
+        ids |= DELTA.product_variation_ids(pids)
+    if not ids:
+        return {"upserts": 0, "deletes": 0}
+    rows = fetch_variations_from_db(sorted(ids))
+    if rows is None:
+        return None                    # lỗi DB: caller thử lại
+    scored = score_variations(rows) if not rows.empty else rows
+    found = {int(v) for v in scored["variation_id"].tolist()}
+    deleted = ids - found
+
+    with _APPLY_LOCK:
+        scaler = _SCALED[0]
+        if not scored.empty:
+            vals = scored[["price", "performance_score"]].to_numpy(dtype=float)
+            if not scaler.covers(vals):
+                _rescale(scaler.widened(vals))
+        KNN_INDEX.set_dead(r for r in map(ROW_OF.get, ids) if r is not None)
+        DELTA.apply(scored, deleted)
+    return {"upserts": len(found), "deletes": len(deleted)}
+
+def missed_variation_changes(since):
+    """
+    (variation_ids, product_ids) cần áp dụng lại sau khi change feed mất kết nối:
+    dòng / product đổi từ `since`, cộng các biến thể đang serve (DF chưa tombstone
+    + DELTA) không còn bán trong DB (DELETE không để lại updated_at). None nếu lỗi DB.
+    """
+    res = fetch_variation_changes_since(since)
+    if res is None:
+        return None
+    changed, products, available = res
+    served = set(DF["variation_id"].to_numpy()[~KNN_INDEX.dead].tolist())
+    served |= {int(v) for v in DELTA.frame()["variation_id"].tolist()}
+    return set(changed) | (served - set(available)), set(products)
 
 def health_info():
     return {
         "ok": True,
         "items": int(DF.shape[0]),
-        "x_all_shape": list(X_ALL.shape)
+        "x_all_shape": list(X_ALL.shape),
+        "index_mode": KNN_INDEX.mode,
+        "shm_mode": SHM_MODE,
+        "fresh_pool": FRESH_POOL.stats(),
+        "delta": {**DELTA.stats(), "tombstones": int(KNN_INDEX._dead_rows.size), "rescales": RESCALES},
+        **({"shards": KNN_INDEX.stats()} if SHARDS_MODE != "off" else {}),
+        "memory": memory_info(),
+    }
+
+def memory_info() -> dict:
+    """Bytes resident theo cấu trúc (shared=True: DF / X_ALL / VAR_IDS nằm trên shm, dùng chung)."""
+    return {
+        "shared": SHM_MODE == "attach",
+        "df": frame_bytes(DF),
+        "x_all": int(X_ALL.nbytes),
+        "var_ids": int(VAR_IDS.nbytes),
+        "row_lookup": ROW_OF.nbytes + ROWS_OF_PRODUCT.nbytes,
+        "knn_index": int(KNN_INDEX.nbytes),          # engine exact dùng chung X_ALL
+        "rerank_arrays": int(DF_PRICES.nbytes + DF_PRODUCT_IDS.nbytes),
+        "item_fragments": items_nbytes(DF_ITEMS),
+        "fresh_pool": frame_bytes(FRESH_POOL.df),
+        "delta": frame_bytes(DELTA.frame()),
+    }
+
+def _neg_sim(t):
+    return t[0]
+
+def _stream(src, sims, pids, fdf, rows=None):
+    """Ứng viên của một nguồn, sắp giảm dần theo sim (stable: hoà thì giữ thứ tự gốc)."""
+    order = np.argsort(-sims, kind="stable")
+    neg = (-sims[order]).tolist()
+    pids = pids[order].tolist()
+    rows = (order if rows is None else rows[order]).tolist()
+    return zip(neg, itertools.repeat(src), rows, pids, itertools.repeat(fdf))
+
+def _item(src, r):
+    if src == "indexed":
+        return {
+            "variation_id": int(r["variation_id"]),
+            "product_id": int(r["product_id"]),
+            "product_name": str(r["product_name"]),
+            "price": float(r["price"]),
+            "performance_score": float(r["performance_score"]),
+            "cpu_source": str(r.get("cpu_source", "unknown")),
+            "gpu_source": str(r.get("gpu_source", "unknown")),
+            "score_source": f"cpu:{r.get('cpu_source','?')},gpu:{r.get('gpu_source','?')}",
+            "source": "indexed"
+        }
+    return {
+        "variation_id": int(r["variation_id"]),
+        "product_id": int(r["product_id"]),
+        "product_name": str(r["product_name"]),
+        "price": float(r["price"]),
+        "performance_score": float(r["performance_score"]),
+        "cpu_source": str(r.get("cpu_source", "rule")),
+        "gpu_source": str(r.get("gpu_source", "rule")),
+        "score_source": str(r.get("score_source", "fresh:rule")),
+        "source": "fresh"
     }
 
+def _lookup_generation():
+    """Cache lookup ngoài index hết hiệu lực khi fresh pool / index đổi (biến thể mới / bị sửa)."""
+    global _LOOKUP_GEN
+    gen = (FRESH_POOL.version, index_version())
+    if gen != _LOOKUP_GEN:
+        _LOOKUP_GEN = gen
+        LOOKUP_CACHE.clear()
+        MISS_CACHE.clear()
+    return gen
+
+def _lookup_out_of_index(var_id: int):
+    """
+    (variation_id, product_id, price, performance_score) của biến thể chưa có trong
+    index (fetch DB + chấm điểm), None nếu không tồn tại. Cả hai kết quả được cache
+    theo generation -> id không tồn tại lặp lại (crawler, link cũ) không chạm Postgres.
+    Lỗi DB không được cache và ném deadline.DbUnavailable; quá ngân sách -> deadline.Expired.
+    """
+    key = (var_id, _lookup_generation())
+    if MISS_CACHE.get(key):
+        return None
+    hit = LOOKUP_CACHE.get(key)
+    if hit is not None:
+        return hit
+    df = deadline.call(fetch_one_variation_from_db, var_id)
+    if df is None:
+        raise deadline.DbUnavailable()    # không phải 404: client thử lại được
+    if df.empty:
+        MISS_CACHE.set(key, True)
+        return None
+    r = df.iloc[0]
+    perf, _, _, _, _ = calculate_perf_from_mapping_or_rule(r)
+    base = (int(r["variation_id"]), int(r["product_id"]), float(r["price"]), float(perf))
+    LOOKUP_CACHE.set(key, base)
+    return base
+
 def recommend_core(var_id: int):
-    df_ids = set(DF["variation_id"].tolist())
+    if BATCHER is None:
+        return _recommend_core(var_id)
+    with BATCHER.in_flight():
+        return _recommend_core(var_id)
+
+def _recommend_core(var_id: int):
+    SCALER, X_ALL, KNN_INDEX = _SCALED
+    t = timing.laps()
+    row = ROW_OF.get(int(var_id))
+    delta_base = DELTA.get(var_id)
 
     # 1) chuẩn bị query vector
     base_product_id = None # <-- Biến mới để lưu product_id gốc
 
-    if var_id in df_ids:
-        base = DF.loc[DF["variation_id"] == var_id].iloc[0]
+    if delta_base is not None or (row is not None and not KNN_INDEX.dead[row]):
+        base = delta_base if delta_base is not None else DF.iloc[row]
         q_price = float(base["price"]); q_perf = float(base["performance_score"])
         q_scaled = SCALER.transform(np.array([[q_price, q_perf]], dtype=float))[0]
         base_row = base
         base_product_id = int(base["product_id"]) # <-- Lấy product_id gốc
+        timing.note(path="delta" if delta_base is not None else "indexed")
+        t.lap("base")
     else:
-        fresh_one = fetch_one_variation_from_db(var_id)
-        if fresh_one is None or fresh_one.empty:
+        timing.note(path="db-miss")
+        try:
+            fresh_one = _lookup_out_of_index(int(var_id))
+        except deadline.Expired:          # gồm DbUnavailable
+            t.lap("db")
+            deadline.degrade("db")
+            return None, 503              # chưa biết biến thể -> không có query vector cho kNN
+        t.lap("db")
+        if fresh_one is None:
             return None, 404
-        fresh_one = fresh_one.iloc[0].copy()
-        perf, cpu_src, gpu_src, _, _ = calculate_perf_from_mapping_or_rule(fresh_one)
-        fresh_one["performance_score"] = perf
-        q_price = float(fresh_one["price"]); q_perf = float(fresh_one["performance_score"])
+        vid, base_product_id, q_price, q_perf = fresh_one   # base_product_id: product gốc
         q_scaled = SCALER.transform(np.array([[q_price, q_perf]], dtype=float))[0]
-        base_row = pd.Series({"variation_id": int(fresh_one["variation_id"]), "price": q_price, "performance_score": q_perf})
-        base_product_id = int(fresh_one["product_id"]) # <-- Lấy product_id gốc
-
-    # 2) ứng viên từ index
-    n_neighbors = min(int(TOPK) + 15, len(DF))
-    dists, idxs = knn_kneighbors_numpy(X_ALL, q_scaled, n_neighbors=n_neighbors)
-    idxs = [i for i in idxs[0].tolist()
-            if int(DF.iloc[i]["variation_id"]) != int(base_row["variation_id"])]
-    base_price = float(q_price)
-    cand_knn = []
-    for i in idxs:
-        p_i = float(DF.iloc[i]["price"])
-        d = euclid_weighted(q_scaled, X_ALL[i])
-        price_jump_pen = LAMBDA_PRICE_JUMP * ((p_i - base_price) / base_price) if (p_i > base_price and base_price > 0) else 0.0
-        sim = 1.0 / (1e-6 + d * (1.0 + price_jump_pen))
-        cand_knn.append(("indexed", i, sim, None))
-
-    # 3) ứng viên từ fresh pool
-    fresh_df = fetch_fresh_items_from_db(exclude_variation_ids=[int(base_row["variation_id"])])
-    cand_fresh = []
+        base_row = pd.Series({"variation_id": vid, "price": q_price, "performance_score": q_perf})
+        t.lap("base")
+
+    # 2) ứng viên từ index: TOPK + KNN_MARGIN product khác nhau (không tính product gốc),
+    #    mỗi product lấy biến thể gần nhất -> dedup ở bước 5 không làm thiếu TOPK
+    idxs = _knn(KNN_INDEX, q_scaled, base_product_id)
+    out = _rerank(SCALER, X_ALL, q_scaled, q_price, int(base_row["variation_id"]), base_product_id, idxs[0], t)
+    return out, 200
+
+def _knn(index, q_scaled, exclude_product):
+    n = int(TOPK) + KNN_MARGIN
+    if BATCHER is not None:
+        return BATCHER.kneighbors_products(index, q_scaled, n, exclude_product=exclude_product)[1]
+    return index.kneighbors_products(q_scaled, n, exclude_product=exclude_product)[1]
+
+@lru_cache(maxsize=4096)
+def _spec_perf(processor: str, graphics_card: str, ram: str, storage: str):
+    """(performance_score, cpu_source, gpu_source) của một cấu hình (benchmark / rule như biến thể DB)."""
+    perf, cpu_src, gpu_src, _, _ = calculate_perf_from_mapping_or_rule(
+        {"processor": processor, "graphics_card": graphics_card, "ram": ram, "storage": storage})
+    return float(perf), cpu_src, gpu_src
+
+def recommend_spec(price: float, processor: str = "", graphics_card: str = "", ram: str = "",
+                   storage: str = "", exclude_product=None):
+    """
+    Gợi ý cho cấu hình giả định (chưa có dòng product_variations): chấm điểm trong
+    bộ nhớ rồi chạy cùng kNN + rerank với /recommend. exclude_product: bỏ product
+    đang sửa (form admin). Trả (items, spec đã chấm điểm).
+    """
+    if BATCHER is None:
+        return _recommend_spec(price, processor, graphics_card, ram, storage, exclude_product)
+    with BATCHER.in_flight():
+        return _recommend_spec(price, processor, graphics_card, ram, storage, exclude_product)
+
+def _recommend_spec(price, processor, graphics_card, ram, storage, exclude_product):
+    SCALER, X_ALL, KNN_INDEX = _SCALED
+    t = timing.laps()
+    perf, cpu_src, gpu_src = _spec_perf(processor, graphics_card, ram, storage)
+    q_price = float(price)
+    q_scaled = SCALER.transform(np.array([[q_price, perf]], dtype=float))[0]
+    timing.note(path="spec")
+    t.lap("base")
+    idxs = _knn(KNN_INDEX, q_scaled, exclude_product)
+    out = _rerank(SCALER, X_ALL, q_scaled, q_price, -1, exclude_product, idxs[0], t)
+    return out, {"price": q_price, "performance_score": perf, "cpu_source": cpu_src, "gpu_source": gpu_src}
+
+def _rerank(SCALER, X_ALL, q_scaled, q_price, base_vid, base_product_id, idxs, t):
+    """Bước 2-5 sau kNN: sim cho ứng viên index / delta / fresh, merge + dedup, TOPK item."""
+    streams = [_stream("indexed", candidate_sims(q_scaled, q_price, X_ALL[idxs], DF_PRICES[idxs]),
+                       DF_PRODUCT_IDS[idxs], None, idxs)]
+    t.lap("knn")
+
+    # 2b) biến thể đã đổi sau lần train (change feed), cùng công thức sim như index
+    delta_df = DELTA.candidates_for(base_vid)
+    if not delta_df.empty:
+        streams.append(_stream("indexed", fresh_sims(SCALER, q_scaled, q_price, delta_df),
+                               delta_df["product_id"].to_numpy(), delta_df))
+    t.lap("delta")
+
+    # 3) ứng viên từ fresh pool (đã fetch + chấm điểm sẵn, xem core/fresh.py)
+    fresh_df = FRESH_POOL.candidates_for(base_vid)
     if fresh_df is not None and not fresh_df.empty:
-        mask_new = ~fresh_df["variation_id"].isin(df_ids)
-        fresh_df = fresh_df.loc[mask_new].reset_index(drop=True)
-        perf_list, cpu_srcs, gpu_srcs = [], [], []
-        for _, r in fresh_df.iterrows():
-            score, cpu_src, gpu_src, _, _ = calculate_perf_from_mapping_or_rule(r)
-            perf_list.append(score); cpu_srcs.append(cpu_src); gpu_srcs.append(gpu_src)
-        fresh_df["performance_score"] = perf_list
-        fresh_df["cpu_source"] = cpu_srcs
-        fresh_df["gpu_source"] = gpu_srcs
-        fresh_df["score_source"] = np.where(
-            (fresh_df["cpu_source"] != "rule") | (fresh_df["gpu_source"] != "rule"),
-            "fresh:benchmark", "fresh:rule"
-        )
-        scored = score_fresh_candidates(SCALER, q_scaled, q_price, fresh_df)
-        for i, sim in scored:
-            cand_fresh.append(("fresh", i, sim, fresh_df))
-
-
-    # 4) gộp & rerank
-    pool = cand_knn + cand_fresh
-    pool.sort(key=lambda t: t[2], reverse=True)
-
-    # 5) response 
+        streams.append(_stream("fresh", fresh_sims(SCALER, q_scaled, q_price, fresh_df),
+                               fresh_df["product_id"].to_numpy(), fresh_df))
+    t.lap("fresh")
+
+    # 4) + 5) merge các stream đã sắp theo sim, dedup theo product_id (bỏ product gốc),
+    #         dừng ngay khi đủ TOPK; dòng DF dùng Item dựng sẵn, delta / fresh mới build dict
     out = []
-    
-    # Thêm product_id GỐC vào danh sách đã thấy
     seen_product_ids = {base_product_id}
-
-    for src, i, _, fdf in pool:
-        current_product_id = None
-        current_variation_id = None
-        r = None # Khai báo r
-
-        if src == "indexed":
-            r = DF.iloc[i]
-            current_product_id = int(r["product_id"])
-            current_variation_id = int(r["variation_id"])
-        else: # src == "fresh"
-            r = fdf.iloc[i]
-            current_product_id = int(r["product_id"])
-            current_variation_id = int(r["variation_id"])
-            
-        # Kiểm tra trùng lặp
-        if current_product_id not in seen_product_ids:
-            seen_product_ids.add(current_product_id)
-            
-            # Build object
-            if src == "indexed":
-                out.append({
-                    "variation_id": current_variation_id,
-                    "product_id": current_product_id,
-                    "product_name": str(r["product_name"]),
-                    "price": float(r["price"]),
-                    "performance_score": float(r["performance_score"]),
-                    "cpu_source": str(r.get("cpu_source", "unknown")),
-                    "gpu_source": str(r.get("gpu_source", "unknown")),
-                    "score_source": f"cpu:{r.get('cpu_source','?')},gpu:{r.get('gpu_source','?')}",
-                    "source": "indexed"
-                })
-            else:
-                out.append({
-                    "variation_id": current_variation_id,
-                    "product_id": current_product_id,
-                    "product_name": str(r["product_name"]),
-                    "price": float(r["price"]),
-                    "performance_score": float(r["performance_score"]),
-                    "cpu_source": str(r.get("cpu_source", "rule")),
-                    "gpu_source": str(r.get("gpu_source", "rule")),
-                    "score_source": str(r.get("score_source", "fresh:rule")),
-                    "source": "fresh"
-                })
-
-        # Dừng khi đủ TOPK
+    for _, src, i, pid, fdf in heapq.merge(*streams, key=_neg_sim):
+        if pid in seen_product_ids:
+            continue
+        seen_product_ids.add(pid)
+        out.append(DF_ITEMS[i] if fdf is None else _item(src, fdf.iloc[i]))
         if len(out) >= TOPK:
             break
-            
-    return out, 200
+    t.lap("merge")
+    timing.note(fresh_pool=int(FRESH_POOL.df.shape[0]), returned=len(out), candidates={
+        "knn": len(idxs), "delta": int(delta_df.shape[0]), "fresh": 0 if fresh_df is None else int(fresh_df.shape[0])})
+    return out
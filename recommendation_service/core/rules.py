@@ -1,24 +1,62 @@
 import re
+import numpy as np
+import pandas as pd
+
+def tier_table(tiers):
+    """[(score, [substring, ...]), ...] -> [(score, regex alternation đã compile), ...] (ưu tiên theo thứ tự)."""
+    return [(score, re.compile("|".join(re.escape(k) for k in keys))) for score, keys in tiers]
+
+CPU_TIERS = tier_table([
+    (100.0, ["m3 max","m4 max","i9","ryzen 9","ultra 9"]),
+    (80.0,  ["m3 pro","m4 pro","i7","ryzen 7","ultra 7"]),
+    (60.0,  ["m3 ","m4 ","i5","ryzen 5","ultra 5"]),
+])
+GPU_TIERS = tier_table([
+    (100.0, ["4080","4090","5070","5080","5090","30-core","40-core"]),
+    (90.0,  ["4070"]),
+    (85.0,  ["4060"]),
+    (75.0,  ["4050"]),
+    (60.0,  ["3050","2050"]),
+    (40.0,  ["arc","14-core","16-core","18-core"]),
+])
+STO_TIERS = tier_table([
+    (100.0, ["4tb"]),
+    (90.0,  ["2tb"]),
+    (80.0,  ["1tb"]),
+    (60.0,  ["512"]),
+])
+_RAM_RE = re.compile(r"(\d+)")
+
+def _lower(v) -> str:
+    return v.lower() if isinstance(v, str) else ""
+
+def classify(s: str, tiers, default):
+    for score, pat in tiers:
+        if pat.search(s): return score
+    return default
+
+def map_unique(values, fn) -> np.ndarray:
+    """
+    fn chỉ chạy trên các giá trị unique rồi broadcast về từng dòng
+    (catalog lặp lại rất nhiều tên CPU/GPU/RAM/SSD giống nhau).
+    """
+    codes, uniq = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    if not len(uniq):
+        return np.empty(0)
+    return np.array([fn(None if pd.isna(u) else u) for u in uniq])[codes]     # factorize gộp None/NaN
+
+def classify_batch(values, tiers, default, prep=_lower) -> np.ndarray:
+    """Bản theo cột của `classify`."""
+    return map_unique(values, lambda u: classify(prep(u), tiers, default))
 
 def rule_cpu_100(cpu: str) -> float:
-    s = (cpu or "").lower()
-    if any(x in s for x in ["m3 max","m4 max","i9","ryzen 9","ultra 9"]): return 100.0
-    if any(x in s for x in ["m3 pro","m4 pro","i7","ryzen 7","ultra 7"]): return 80.0
-    if any(x in s for x in ["m3 ","m4 ","i5","ryzen 5","ultra 5"]):       return 60.0
-    return 40.0
+    return classify(_lower(cpu), CPU_TIERS, 40.0)
 
 def rule_gpu_100(gpu: str) -> float:
-    g = (gpu or "").lower()
-    if any(x in g for x in ["4080","4090","5070","5080","5090","30-core","40-core"]): return 100.0
-    if "4070" in g: return 90.0
-    if "4060" in g: return 85.0
-    if "4050" in g: return 75.0
-    if any(x in g for x in ["3050","2050"]): return 60.0
-    if any(x in g for x in ["arc","14-core","16-core","18-core"]): return 40.0
-    return 20.0
+    return classify(_lower(gpu), GPU_TIERS, 20.0)
 
 def extract_ram_gb(ram_str: str) -> int:
-    m = re.search(r"(\d+)", str(ram_str) or "")
+    m = _RAM_RE.search(str(ram_str) or "")
     return int(m.group(1)) if m else 8
 
 def ram_100(ram: str) -> float:
@@ -29,9 +67,17 @@ def ram_100(ram: str) -> float:
     return 40.0
 
 def sto_100(storage: str) -> float:
-    s = (storage or "").lower()
-    if "4tb" in s:   return 100.0
-    if "2tb" in s:   return 90.0
-    if "1tb" in s:   return 80.0
-    if "512" in s:   return 60.0
-    return 40.0
+    return classify(_lower(storage), STO_TIERS, 40.0)
+
+# ---- batch: nhận một cột (Series / list), trả np.ndarray float theo từng dòng
+def rule_cpu_100_batch(cpus) -> np.ndarray:
+    return classify_batch(cpus, CPU_TIERS, 40.0)
+
+def rule_gpu_100_batch(gpus) -> np.ndarray:
+    return classify_batch(gpus, GPU_TIERS, 20.0)
+
+def ram_100_batch(rams) -> np.ndarray:
+    return map_unique(rams, ram_100)
+
+def sto_100_batch(storages) -> np.ndarray:
+    return classify_batch(storages, STO_TIERS, 40.0)
@@ -0,0 +1,70 @@
+"""
+MinMaxScaler thuần NumPy cho serving.
+
+Training lưu `data_min_`, `data_max_`, `scale_`, `min_` của sklearn MinMaxScaler
+ra scaler_params.npz; transform ở đây dùng đúng công thức của sklearn
+(X * scale_ + min_, cùng thứ tự phép tính, float64) nên kết quả giống hệt.
+sklearn / joblib chỉ còn là dependency của training.
+
+Chuyển artifact cũ:  python -m core.scaler  (đọc scaler.joblib -> scaler_params.npz)
+"""
+import os
+import numpy as np
+from .config import SCALER_PATH, SCALER_PARAMS_PATH
+
+
+class MinMaxParams:
+    def __init__(self, data_min, data_max, scale, min_):
+        self.data_min_ = np.asarray(data_min, dtype=np.float64)
+        self.data_max_ = np.asarray(data_max, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.min_ = np.asarray(min_, dtype=np.float64)
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        return cls(scaler.data_min_, scaler.data_max_, scaler.scale_, scaler.min_)
+
+    @classmethod
+    def from_bounds(cls, data_min, data_max):
+        """Như MinMaxScaler.fit với feature_range=(0, 1) trên dữ liệu có min/max này."""
+        data_min = np.asarray(data_min, dtype=np.float64)
+        data_max = np.asarray(data_max, dtype=np.float64)
+        rng = data_max - data_min
+        rng[rng == 0.0] = 1.0
+        scale = 1.0 / rng
+        return cls(data_min, data_max, scale, -data_min * scale)
+
+    def covers(self, X) -> bool:
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.data_min_.shape[0])
+        return bool((X >= self.data_min_).all() and (X <= self.data_max_).all())
+
+    def widened(self, X) -> "MinMaxParams":
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.data_min_.shape[0])
+        return MinMaxParams.from_bounds(np.minimum(self.data_min_, X.min(0)),
+                                        np.maximum(self.data_max_, X.max(0)))
+
+    def transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)       # copy, như check_array(copy=True)
+        X *= self.scale_
+        X += self.min_
+        return X
+
+    def save(self, path: str = SCALER_PARAMS_PATH):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, data_min=self.data_min_, data_max=self.data_max_, scale=self.scale_, min=self.min_)
+        os.replace(tmp, path)
+
+
+def load_scaler(params_path: str = SCALER_PARAMS_PATH, joblib_path: str = SCALER_PATH) -> MinMaxParams:
+    if os.path.exists(params_path):
+        with np.load(params_path, allow_pickle=False) as z:
+            return MinMaxParams(z["data_min"], z["data_max"], z["scale"], z["min"])
+    # artifact cũ chưa có params: cần sklearn/joblib (requirements-train.txt)
+    import joblib
+    return MinMaxParams.from_sklearn(joblib.load(joblib_path))
+
+
+if __name__ == "__main__":
+    import joblib
+    MinMaxParams.from_sklearn(joblib.load(SCALER_PATH)).save(SCALER_PARAMS_PATH)
+    print(f"Saved {SCALER_PARAMS_PATH}")
@@ -0,0 +1,102 @@
+from . import deadline, timing, tracelog
+from .cache import TTLCache
+from .changefeed import ChangeFeed
+from .config import COALESCE, RESULT_CACHE_TTL, RESULT_CACHE_SIZE, CHANGEFEED, HTTP_MAX_AGE, HTTP_SWR
+from .etag import digest
+from .recommend import recommend_core, recommend_spec, apply_variation_changes, missed_variation_changes, index_version, index_tag, FRESH_POOL, ARTIFACT_TAG, BATCHER, LOOKUP_CACHE, MISS_CACHE
+from .singleflight import SingleFlight
+from .warmup import ACCESS_LOG
+
+RECS_FLIGHT = SingleFlight()
+RESULT_CACHE = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+CHANGE_FEED = ChangeFeed(apply_variation_changes, missed_variation_changes)
+
+
+def start_changefeed():
+    if CHANGEFEED:
+        CHANGE_FEED.start()
+
+
+def _compute(key):
+    out, code = recommend_core(key[0])
+    degraded = deadline.reasons()
+    if code == 200 and not degraded:
+        RESULT_CACHE.set(key, (out, code))
+    return out, code, degraded
+
+
+def recommend(var_id: int, track: bool = True):
+    """
+    result cache -> single-flight -> recommend_core. Các request đồng thời cùng
+    variation_id chờ một lần tính đang chạy và dùng chung (out, code).
+    track=False: không tính vào access log (dùng cho warmup).
+    """
+    var_id = int(var_id)
+    if track:
+        ACCESS_LOG.record(var_id)
+    # fresh pool / index đổi -> key mới, entry cũ tự hết hạn
+    key = (var_id, FRESH_POOL.version, index_version())
+    timing.note(variation_id=var_id)
+    hit = RESULT_CACHE.get(key)
+    if hit is not None:
+        timing.mark("cache")
+        timing.note(path="cache")
+        return hit
+    out, code, degraded = _compute(key) if not COALESCE else RECS_FLIGHT.do(key, _compute, key)
+    timing.note_default("path", "coalesced")        # recommend_core đã chạy ở request khác
+    deadline.degrade(*degraded)        # request chờ chung kết quả cũng nhận cờ degraded
+    return out, code
+
+
+def recommend_by_spec(spec: tuple):
+    """recommend_spec(*spec) qua result cache (cùng khoá version như /recommend)."""
+    key = ("spec", spec, FRESH_POOL.version, index_version())
+    hit = RESULT_CACHE.get(key)
+    if hit is not None:
+        timing.mark("cache")
+        timing.note(path="cache")
+        return hit
+    result = recommend_spec(*spec)
+    if not deadline.reasons():
+        RESULT_CACHE.set(key, result)
+    return result
+
+
+def etag_for(var_id: int, variant: str = "") -> str:
+    """
+    ETag mạnh của response /recommend cho var_id, không chạy recommend_core.
+    get() trước để pool hết TTL vẫn được refresh khi mọi request đều là 304;
+    thời gian chờ refresh (tới hết ngân sách) ghi vào stage "fresh_wait".
+    """
+    t = timing.laps()
+    FRESH_POOL.get()
+    t.lap("fresh_wait")
+    return digest(ARTIFACT_TAG, FRESH_POOL.tag, index_tag(), int(var_id), variant)
+
+
+def cache_control() -> str:
+    if HTTP_MAX_AGE <= 0:
+        return "no-cache"
+    return f"public, max-age={HTTP_MAX_AGE}, stale-while-revalidate={HTTP_SWR}"
+
+
+def touch(var_id: int):
+    """Request được trả 304: vẫn tính vào access log (popularity cho warmup)."""
+    ACCESS_LOG.record(int(var_id))
+
+
+def meta_for(product_id: int):
+    """Meta (slug, thumbnail, rating) từ cache cho ?include=meta."""
+    return FRESH_POOL.meta_for(product_id)
+
+
+def service_metrics() -> dict:
+    return {
+        "coalescing": {"enabled": COALESCE, **RECS_FLIGHT.stats()},
+        "result_cache": RESULT_CACHE.stats(),
+        "lookup_cache": {"scored": LOOKUP_CACHE.stats(), "missing": MISS_CACHE.stats()},
+        "fresh_pool": FRESH_POOL.stats(),
+        "changefeed": {"enabled": CHANGEFEED, **CHANGE_FEED.stats()},
+        "microbatch": {"enabled": False} if BATCHER is None else {"enabled": True, **BATCHER.stats()},
+        "slow_log": tracelog.stats(),
+    }
@@ -0,0 +1,477 @@
+"""
+Index chia shard theo khoảng giá + coordinator scatter-gather (RECS_SHARDS_MODE).
+
+Với ALPHA=0.6 giá chiếm phần lớn khoảng cách, nên mỗi shard giữ một khoảng giá
+liên tiếp (chia đều số dòng theo giá). Với query q và shard có cột giá của X
+(chính các dòng shard dùng để tính khoảng cách, không suy từ scaler(giá): X_ALL
+có thể lệch scaler) trong [lo, hi], mọi dòng của shard cách q ít nhất
+
+    lb = sqrt(ALPHA) * max(0, lo - q_price, q_price - hi)
+
+Coordinator hỏi shard chứa q trước, rồi chỉ hỏi (song song) các shard có
+lb < khoảng cách của product thứ n hiện có; shard còn lại không thể chứa
+product nào lọt top-n. Mỗi shard trả top-n product của nó (biến thể gần nhất
+mỗi product); product trải nhiều shard lấy min qua các shard. Kết quả giống
+ProductGroupedIndex trên toàn X_ALL (trừ thứ tự các product hoà khoảng cách).
+
+Chế độ:
+    off    : một ProductGroupedIndex như cũ
+    local  : các shard nằm trong process (mỗi shard một ProductGroupedIndex)
+    remote : mỗi shard là một process / node `shard_server.py`, RECS_SHARD_URLS
+             liệt kê URL theo thứ tự shard trong manifest
+
+Artifact (train_recommend.py / build_shards.py): artifacts/shards/manifest.json
++ shard_XXX.npz (rows: dòng X_ALL, X, price, performance_score, product_id).
+Manifest ghi digest của X_ALL + VAR_IDS; lệch thì local build lại trong bộ
+nhớ, remote báo lỗi. Shard lỗi / timeout khi query -> bỏ qua shard đó, request
+được đánh dấu degraded "shard".
+
+Tombstone và rescale chỉ nằm trong bộ nhớ shard_server, nên shard restart sẽ
+quay về X của artifact. Mỗi response /knn, /health kèm state của shard (digest
+scaler + số tombstone); coordinator so với state đã push: lệch scaler -> bỏ kết
+quả shard đó (degraded), lệch tombstone -> vẫn dùng; cả hai đều push lại toàn
+bộ state qua /reset ở thread nền. Coordinator luôn bỏ dòng đã tombstone khi
+merge và hỏi shard remote n + số tombstone của shard để bù.
+"""
+import http.client
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import numpy as np
+from . import deadline
+from .config import ALPHA, INDEX_MODE, SHARDS, SHARDS_DIR, SHARD_URLS, SHARD_TIMEOUT
+from .etag import digest
+from .index import build_knn_index, ProductGroupedIndex
+from .scaler import MinMaxParams
+
+SHARD_FORMAT_VERSION = 2           # 2: manifest có x_min/x_max
+
+
+def x_digest(X_all, var_ids) -> str:
+    return digest(np.asarray(X_all, dtype=np.float64), np.asarray(var_ids, dtype=np.int64))
+
+
+def scaler_version(scaler) -> str:
+    """Scaler đang dùng cho X của shard (None = X của artifact)."""
+    return "artifact" if scaler is None else digest(scaler.scale_, scaler.min_)
+
+
+def scaler_payload(scaler):
+    if scaler is None:
+        return None
+    return {"data_min": scaler.data_min_.tolist(), "data_max": scaler.data_max_.tolist(),
+            "scale": scaler.scale_.tolist(), "min": scaler.min_.tolist()}
+
+
+def scaler_from_payload(body):
+    if not body:
+        return None
+    return MinMaxParams(body["data_min"], body["data_max"], body["scale"], body["min"])
+
+
+def partition(prices, n_shards: int) -> list:
+    """Dòng của từng shard: sắp theo giá, chia đều số dòng (khoảng giá các shard nối tiếp nhau)."""
+    order = np.argsort(np.asarray(prices, dtype=np.float64), kind="stable")
+    n_shards = max(1, min(int(n_shards), order.shape[0]))
+    return [np.sort(part) for part in np.array_split(order, n_shards)]
+
+
+def build_shards(X_all, var_ids, prices, perfs, product_ids, n_shards: int = SHARDS):
+    """(manifest, [arrays của từng shard])."""
+    X_all = np.asarray(X_all, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    perfs = np.asarray(perfs, dtype=np.float64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    shards, entries = [], []
+    for i, rows in enumerate(partition(prices, n_shards)):
+        shards.append({
+            "format_version": np.int64(SHARD_FORMAT_VERSION),
+            "shard": np.int64(i),
+            "rows": rows.astype(np.int64),
+            "X": X_all[rows],
+            "price": prices[rows],
+            "performance_score": perfs[rows],
+            "product_id": product_ids[rows],
+        })
+        entries.append({"file": f"shard_{i:03d}.npz", "n": int(rows.shape[0]),
+                        "price_min": float(prices[rows].min()), "price_max": float(prices[rows].max()),
+                        "x_min": float(X_all[rows, 0].min()), "x_max": float(X_all[rows, 0].max())})
+    manifest = {
+        "format_version": SHARD_FORMAT_VERSION,
+        "n_shards": len(shards),
+        "n_items": int(X_all.shape[0]),
+        "x_digest": x_digest(X_all, var_ids),
+        "shards": entries,
+    }
+    return manifest, shards
+
+
+def save_shards(manifest: dict, shards: list, out_dir: str = SHARDS_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    for entry, arrays in zip(manifest["shards"], shards):
+        path = os.path.join(out_dir, entry["file"])
+        np.savez(path + ".tmp.npz", **arrays)
+        os.replace(path + ".tmp.npz", path)
+    tmp = os.path.join(out_dir, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, "manifest.json"))
+
+
+def load_manifest(shards_dir: str = SHARDS_DIR):
+    path = os.path.join(shards_dir, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        m = json.load(f)
+    return m if int(m.get("format_version", 0)) == SHARD_FORMAT_VERSION else None
+
+
+def load_shard(i: int, shards_dir: str = SHARDS_DIR, manifest: dict = None) -> dict:
+    manifest = manifest or load_manifest(shards_dir)
+    with np.load(os.path.join(shards_dir, manifest["shards"][i]["file"]), allow_pickle=False) as z:
+        return {k: z[k] for k in z.files}
+
+
+class ShardIndex:
+    """Một shard: ProductGroupedIndex trên các dòng của shard, nhận / trả dòng X_ALL toàn cục."""
+
+    def __init__(self, arrays: dict, X=None, mode: str = INDEX_MODE):
+        self.arrays = arrays
+        self.rows = arrays["rows"]
+        self.X = arrays["X"] if X is None else X
+        self.index = ProductGroupedIndex(build_knn_index(self.X, mode), arrays["product_id"])
+        self._pos = {int(r): j for j, r in enumerate(self.rows.tolist())}
+        self.scaler = None                      # None: X của artifact
+
+    def __len__(self):
+        return int(self.rows.shape[0])
+
+    @property
+    def x_bounds(self) -> tuple:
+        """(min, max) cột giá của X của shard: biên cho lower bound của coordinator."""
+        return float(self.X[:, 0].min()), float(self.X[:, 0].max())
+
+    @property
+    def state(self) -> dict:
+        return {"scaler": scaler_version(self.scaler), "tombstones": int(self.index._dead_rows.size)}
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.index.nbytes + self.rows.nbytes)
+
+    def query(self, q_scaled, n_products: int, exclude_product=None, timeout=None):
+        d, local = self.index.kneighbors_products(q_scaled, n_products, exclude_product=exclude_product)
+        return d[0], self.rows[local[0]]
+
+    def set_dead(self, rows):
+        self.index.set_dead(self._pos[r] for r in map(int, rows) if r in self._pos)
+
+    def rescaled(self, scaler: MinMaxParams) -> "ShardIndex":
+        X = scaler.transform(np.column_stack([self.arrays["price"], self.arrays["performance_score"]]))
+        out = ShardIndex(self.arrays, X, self.index.mode)
+        out.scaler = scaler
+        out.index.set_dead(self.index._dead_rows)
+        return out
+
+    def reset(self, scaler, rows) -> "ShardIndex":
+        """Shard mới từ artifact với đúng scaler + tập tombstone của coordinator."""
+        out = ShardIndex(self.arrays, mode=self.index.mode)
+        if scaler is not None:
+            out = out.rescaled(scaler)
+        out.set_dead(rows)
+        return out
+
+
+class StaleShard(RuntimeError):
+    """Shard trả kết quả theo scaler khác scaler coordinator đã push (vd. vừa restart)."""
+
+
+class RemoteShard:
+    """Client HTTP của một shard_server.py (connection keep-alive theo thread)."""
+
+    def __init__(self, url: str, x_bounds: tuple, timeout: float = SHARD_TIMEOUT):
+        u = urlsplit(url)
+        self.url = url
+        self.x_bounds = tuple(x_bounds)         # từ manifest; /rescale trả biên mới
+        self.host, self.port = u.hostname, u.port or 80
+        self.timeout = timeout
+        self._tls = threading.local()
+        # state coordinator đã push; shard restart thì mất, /knn + /health báo lại để so
+        self.scaler = None
+        self.dead = set()
+        self._lock = threading.Lock()           # push / resync tuần tự
+        self._resync_pending = False
+        self.stale = 0
+        self.resyncs = 0
+        self.failures = 0                       # /dead, resync lỗi (shard tự resync ở query sau)
+        self.last_error = None
+
+    def _post(self, path: str, payload, timeout: float = None):
+        body = json.dumps(payload).encode()
+        for attempt in (0, 1):                  # connection keep-alive có thể đã bị server đóng
+            conn = getattr(self._tls, "conn", None)
+            if conn is None:
+                conn = self._tls.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                conn.timeout = timeout or self.timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(conn.timeout)
+                conn.request("POST" if payload is not None else "GET", path, body if payload is not None else None,
+                             {"Content-Type": "application/json"})
+                r = conn.getresponse()
+                data = r.read()
+                if r.status != 200:
+                    raise RuntimeError(f"shard {self.url}{path}: HTTP {r.status}")
+                return json.loads(data)
+            except TimeoutError:
+                conn.close()
+                self._tls.conn = None
+                raise
+            except (http.client.HTTPException, ConnectionError, OSError):
+                conn.close()
+                self._tls.conn = None
+                if attempt:
+                    raise
+
+    def health(self) -> dict:
+        return self._post("/health", None)
+
+    def in_sync(self, state: dict) -> bool:
+        return state.get("scaler") == scaler_version(self.scaler) and \
+            int(state.get("tombstones", -1)) == len(self.dead)
+
+    def query(self, q_scaled, n_products: int, exclude_product=None, timeout=None):
+        """timeout: ngân sách còn lại của request (tính ở thread của request)."""
+        r = self._post("/knn", {"q": [float(x) for x in q_scaled], "n": int(n_products),
+                                "exclude": None if exclude_product is None else int(exclude_product)},
+                       timeout=None if timeout is None else max(min(self.timeout, timeout), 1e-3))
+        if not self.in_sync(r):
+            self.resync_later()
+            if r.get("scaler") != scaler_version(self.scaler):
+                self.stale += 1
+                raise StaleShard(f"shard {self.url}: scaler {r.get('scaler')}")
+        return np.asarray(r["d"], dtype=np.float64), np.asarray(r["rows"], dtype=np.int64)
+
+    def set_dead(self, rows):
+        rows = [int(r) for r in rows]
+        with self._lock:
+            self.dead.update(rows)
+            try:
+                self._post("/dead", {"rows": rows})
+            except Exception as e:              # query sau thấy lệch tombstone -> resync
+                self._failed("/dead", e)
+
+    def rescaled(self, scaler: MinMaxParams) -> "RemoteShard":
+        with self._lock:
+            r = self._post("/rescale", scaler_payload(scaler))
+            self.scaler = scaler
+            self.x_bounds = (float(r["x_min"]), float(r["x_max"]))
+        return self
+
+    def resync(self) -> bool:
+        """Push lại scaler + toàn bộ tombstone nếu state shard báo trong /health lệch."""
+        try:
+            with self._lock:
+                if self.in_sync(self.health()):
+                    return True
+                r = self._post("/reset", {"scaler": scaler_payload(self.scaler), "rows": sorted(self.dead)})
+                self.x_bounds = (float(r["x_min"]), float(r["x_max"]))
+                self.resyncs += 1
+                return True
+        except Exception as e:
+            self._failed("resync", e)
+            return False
+        finally:
+            self._resync_pending = False
+
+    def _failed(self, what: str, e: Exception):
+        self.failures += 1
+        self.last_error = f"{what}: {type(e).__name__}: {e}"
+
+    def resync_later(self):
+        if self._resync_pending:
+            return
+        self._resync_pending = True
+        threading.Thread(target=self.resync, name="recs-shard-resync", daemon=True).start()
+
+
+class ShardedIndex:
+    """Cùng interface với ProductGroupedIndex (kneighbors_products, set_dead, dead, ...)."""
+    engine = None                       # không có engine full-scan chung -> microbatch đi thẳng
+
+    def __init__(self, shards: list, price_bounds, shard_of_row, product_ids, scaler: MinMaxParams, kind: str):
+        self.shards = shards
+        self.price_bounds = np.asarray(price_bounds, dtype=np.float64)      # (S, 2) giá gốc (stats)
+        self.shard_of_row = shard_of_row
+        self.product_ids = product_ids
+        self.n_products = int(np.unique(product_ids).shape[0])
+        self.scaler = scaler
+        self.kind = kind
+        lo_hi = np.array([s.x_bounds for s in shards], dtype=np.float64)   # (S, 2) cột giá của X
+        self.lo, self.hi = lo_hi[:, 0], lo_hi[:, 1]
+        self.dead = np.zeros(shard_of_row.shape[0], dtype=bool)
+        self._dead_rows = np.empty(0, dtype=np.int64)
+        self._extra = np.zeros(len(shards), dtype=np.int64)    # remote: hỏi thêm số tombstone mỗi shard
+        self._pool = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="recs-shard") \
+            if kind == "remote" and len(shards) > 1 else None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.shard_queries = np.zeros(len(shards), dtype=np.int64)
+        self.errors = 0
+
+    def __len__(self):
+        return self.n_products
+
+    @property
+    def mode(self):
+        return f"sharded-{self.kind}"
+
+    @property
+    def nbytes(self) -> int:
+        own = self.shard_of_row.nbytes + self.dead.nbytes + self.product_ids.nbytes
+        return int(own + sum(s.nbytes for s in self.shards if isinstance(s, ShardIndex)))
+
+    def set_dead(self, rows):
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if not rows.size:
+            return
+        self.dead[rows] = True
+        self._dead_rows = np.flatnonzero(self.dead)
+        if self.kind == "remote":
+            self._extra = np.bincount(self.shard_of_row[self._dead_rows], minlength=len(self.shards))
+        owner = self.shard_of_row[rows]
+        for s in np.unique(owner).tolist():
+            self.shards[s].set_dead(rows[owner == s])
+
+    def lower_bounds(self, q_scaled) -> np.ndarray:
+        gap = np.maximum(0.0, np.maximum(self.lo - q_scaled[0], q_scaled[0] - self.hi))
+        return np.sqrt(ALPHA * gap * gap)
+
+    def _scatter(self, shard_ids, q, n, exclude):
+        left = deadline.remaining()
+        call = lambda s: self.shards[s].query(q, n + int(self._extra[s]), exclude, left)
+        if self._pool is not None and len(shard_ids) > 1:
+            futures = [(s, self._pool.submit(call, s)) for s in shard_ids]
+            results = []
+            for s, f in futures:
+                try:
+                    results.append((s, f.result()))
+                except Exception:
+                    results.append((s, None))
+            return results
+        results = []
+        for s in shard_ids:
+            try:
+                results.append((s, call(s)))
+            except Exception:
+                if self.kind != "remote":
+                    raise
+                results.append((s, None))
+        return results
+
+    def kneighbors_products(self, q_scaled, n_products: int, exclude_product=None):
+        q = np.asarray(q_scaled, dtype=np.float64).reshape(2)
+        lb = self.lower_bounds(q)
+        pending = np.argsort(lb, kind="stable").tolist()
+        best = {}                                   # product_id -> (d, row)
+        n = int(n_products)
+        asked = []
+        while pending:
+            if not asked:
+                batch = pending[:1]                 # shard chứa q (lb nhỏ nhất)
+            else:
+                ds = sorted(v[0] for v in best.values())
+                kth = ds[n - 1] if len(ds) >= n else np.inf
+                batch = [s for s in pending if lb[s] < kth]
+                if not batch:
+                    break
+            pending = [s for s in pending if s not in batch]
+            asked += batch
+            for s, res in self._scatter(batch, q, n, exclude_product):
+                if res is None:
+                    with self._lock:
+                        self.errors += 1
+                    deadline.degrade("shard")
+                    continue
+                for d, r in zip(res[0].tolist(), res[1].tolist()):
+                    if self.dead[r]:                # shard chưa nhận tombstone (restart)
+                        continue
+                    pid = int(self.product_ids[r])
+                    cur = best.get(pid)
+                    if cur is None or (d, r) < cur:
+                        best[pid] = (d, r)
+        with self._lock:
+            self.queries += 1
+            self.shard_queries[asked] += 1
+        top = sorted(((d, pid, r) for pid, (d, r) in best.items()))[:n]
+        d = np.array([t[0] for t in top], dtype=np.float64)
+        rows = np.array([t[2] for t in top], dtype=np.int64)
+        return d.reshape(1, -1), rows.reshape(1, -1)
+
+    def kneighbors_products_batch(self, Q, n_products: int, exclude_products):
+        Q = np.asarray(Q, dtype=np.float64).reshape(-1, 2)
+        return [tuple(a[0] for a in self.kneighbors_products(q, n_products, ex))
+                for q, ex in zip(Q, exclude_products)]
+
+    def rescaled(self, scaler: MinMaxParams) -> "ShardedIndex":
+        shards = [s.rescaled(scaler) for s in self.shards]
+        return ShardedIndex(shards, self.price_bounds, self.shard_of_row, self.product_ids, scaler, self.kind)
+
+    def stats(self) -> dict:
+        with self._lock:
+            q = self.queries
+            per = self.shard_queries.tolist()
+        return {
+            "mode": self.kind,
+            "n_shards": len(self.shards),
+            "price_bounds": self.price_bounds.tolist(),
+            "x_bounds": np.column_stack([self.lo, self.hi]).tolist(),
+            "queries": q,
+            "shard_queries": per,
+            "avg_shards_per_query": round(sum(per) / q, 3) if q else 0.0,
+            "errors": self.errors,
+            **({"stale": [s.stale for s in self.shards], "resyncs": [s.resyncs for s in self.shards],
+                "failures": [s.failures for s in self.shards], "last_error": [s.last_error for s in self.shards]}
+               if self.kind == "remote" else {}),
+        }
+
+
+def _shard_rows(i: int, shards_dir: str, manifest: dict) -> np.ndarray:
+    with np.load(os.path.join(shards_dir, manifest["shards"][i]["file"]), allow_pickle=False) as z:
+        return z["rows"]
+
+
+def build_sharded_index(X_all, var_ids, prices, perfs, product_ids, scaler: MinMaxParams, kind: str,
+                        shards_dir: str = SHARDS_DIR, urls=SHARD_URLS, n_shards: int = SHARDS):
+    X_all = np.asarray(X_all, dtype=np.float64)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    manifest = load_manifest(shards_dir)
+    stale = manifest is None or manifest["x_digest"] != x_digest(X_all, var_ids)
+    if kind == "remote":
+        if stale:
+            raise ValueError("shard manifest thiếu hoặc không khớp X_ALL (chạy build_shards.py)")
+        if len(urls) != manifest["n_shards"]:
+            raise ValueError(f"RECS_SHARD_URLS có {len(urls)} URL, manifest có {manifest['n_shards']} shard")
+        shards = [RemoteShard(u, (e["x_min"], e["x_max"])) for u, e in zip(urls, manifest["shards"])]
+        for i, s in enumerate(shards):
+            h = s.health()
+            if h.get("x_digest") != manifest["x_digest"] or int(h.get("shard", -1)) != i:
+                raise ValueError(f"shard {i} ({s.url}) phục vụ artifact khác manifest")
+            if not s.in_sync(h):                # còn state của coordinator trước
+                s.resync()
+        row_sets = [_shard_rows(i, shards_dir, manifest) for i in range(len(shards))]
+    else:
+        if stale:
+            manifest, arrays = build_shards(X_all, var_ids, prices, perfs, product_ids, n_shards)
+        else:
+            arrays = [load_shard(i, shards_dir, manifest) for i in range(manifest["n_shards"])]
+        shards = [ShardIndex(a) for a in arrays]
+        row_sets = [a["rows"] for a in arrays]
+    shard_of_row = np.empty(X_all.shape[0], dtype=np.int32)
+    for i, rows in enumerate(row_sets):
+        shard_of_row[rows] = i
+    bounds = [(e["price_min"], e["price_max"]) for e in manifest["shards"]]
+    return ShardedIndex(shards, bounds, shard_of_row, product_ids, scaler, kind)
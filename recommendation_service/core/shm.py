@@ -0,0 +1,343 @@
+"""
+Chia sẻ index + fresh pool giữa các worker qua multiprocessing.shared_memory.
+
+Một process loader (shm_loader.py) đọc artifacts, refresh fresh pool từ DB và
+publish; các worker (RECS_SHM_MODE=attach) chỉ attach read-only, nên bộ nhớ
+index trả một lần mỗi host và DB chỉ bị query bởi loader.
+
+Mỗi channel ("index", "fresh") gồm:
+  - segment điều khiển  <prefix>_<channel>      : magic | generation | tên segment data
+    (publisher ghi tên trước rồi mới ghi generation; worker đọc kiểu seqlock: gen,
+    tên, gen lại, và tên phải đúng <prefix>_<channel>_<gen> -> không bao giờ ghép
+    generation mới với tên cũ / ghi dở)
+  - segment dữ liệu     <prefix>_<channel>_<gen>: magic | len(header) | header JSON | buffers
+
+Header JSON ghi format_version, generation, created_at và vị trí/dtype/shape của
+từng mảng. Cột chuỗi của DataFrame lưu thành blob UTF-8 + offsets + null mask;
+cột datetime lưu int64 ns (UTC).
+"""
+import json
+import struct
+import threading
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from .config import SHM_PREFIX, SHM_ATTACH_TIMEOUT, FRESH_LIMIT
+
+SHM_FORMAT_VERSION = 1
+MAGIC = b"RECSHM01"
+_ALIGN = 64
+_CTL_FMT = "<8sQ48s"                    # magic, generation, data segment name
+_CTL_SIZE = struct.calcsize(_CTL_FMT)
+_CTL_GEN_OFF = 8
+_CTL_NAME_OFF = 16
+_CTL_RETRIES = 100                      # lần đọc control bị xé (publisher đang ghi)
+_ATTACH_RETRIES = 3                     # segment vừa bị unlink -> đọc lại control
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    # worker chỉ đọc: không để resource_tracker unlink segment khi worker thoát
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ---------- frame <-> arrays ----------
+def _str_arrays(vals, key: str, arrays: dict):
+    null = np.array([v is None or (isinstance(v, float) and np.isnan(v)) for v in vals], dtype=np.uint8)
+    enc = [b"" if n else str(v).encode("utf-8") for v, n in zip(vals, null)]
+    offsets = np.zeros(len(enc) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in enc], out=offsets[1:])
+    arrays[key + ".blob"] = np.frombuffer(b"".join(enc), dtype=np.uint8)
+    arrays[key + ".off"] = offsets
+    arrays[key + ".null"] = null
+
+
+def _str_values(arrays: dict, key: str, n: int) -> list:
+    blob = arrays[key + ".blob"].tobytes()
+    off = arrays[key + ".off"]; null = arrays[key + ".null"]
+    return [None if null[i] else blob[off[i]:off[i + 1]].decode("utf-8") for i in range(n)]
+
+
+def frame_to_arrays(df: pd.DataFrame, prefix: str):
+    arrays, cols = {}, []
+    for c in df.columns:
+        s = df[c]
+        key = f"{prefix}.{c}"
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # codes + bảng categories (chuỗi lặp lại chỉ lưu một lần)
+            arrays[key + ".codes"] = s.cat.codes.to_numpy()
+            _str_arrays(s.cat.categories.tolist(), key + ".cat", arrays)
+            cols.append({"name": c, "kind": "category", "key": key, "n_categories": len(s.cat.categories)})
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            arrays[key] = pd.to_datetime(s, utc=True).astype("int64").to_numpy()
+            cols.append({"name": c, "kind": "datetime", "key": key})
+        elif pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            arrays[key] = s.to_numpy()
+            cols.append({"name": c, "kind": "numeric", "key": key})
+        else:
+            _str_arrays(s.tolist(), key, arrays)
+            cols.append({"name": c, "kind": "str", "key": key})
+    return arrays, {"rows": int(df.shape[0]), "columns": cols}
+
+
+def arrays_to_frame(arrays: dict, spec: dict) -> pd.DataFrame:
+    data = {}
+    for col in spec["columns"]:
+        key = col["key"]
+        if col["kind"] == "numeric":
+            data[col["name"]] = arrays[key]
+        elif col["kind"] == "datetime":
+            data[col["name"]] = pd.to_datetime(arrays[key], utc=True)
+        elif col["kind"] == "category":
+            cats = _str_values(arrays, key + ".cat", col["n_categories"])
+            data[col["name"]] = pd.Categorical.from_codes(arrays[key + ".codes"], categories=cats)
+        else:
+            data[col["name"]] = _str_values(arrays, key, spec["rows"])
+    return pd.DataFrame(data)
+
+
+# ---------- segments ----------
+def _layout(arrays: dict):
+    specs, off = {}, 0
+    for k, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        specs[k] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": off, "nbytes": int(a.nbytes)}
+        off += (int(a.nbytes) + _ALIGN - 1) // _ALIGN * _ALIGN
+    return specs, off
+
+
+class ShmPublisher:
+    """Ghi một generation mới của channel; giữ generation trước một lượt cho worker đang đọc."""
+
+    def __init__(self, channel: str, prefix: str = SHM_PREFIX):
+        self.channel = channel
+        self.ctl_name = f"{prefix}_{channel}"
+        self.generation = 0
+        self._live = []                   # segments còn giữ (mới nhất cuối)
+        try:
+            self.ctl = shared_memory.SharedMemory(name=self.ctl_name, create=True, size=_CTL_SIZE)
+        except FileExistsError:           # loader cũ chết không dọn: dùng lại, tiếp generation
+            self.ctl = shared_memory.SharedMemory(name=self.ctl_name)
+            magic, gen, _ = struct.unpack_from(_CTL_FMT, self.ctl.buf, 0)
+            self.generation = gen if magic == MAGIC else 0
+
+    def publish(self, arrays: dict, meta: dict = None) -> int:
+        gen = self.generation + 1
+        specs, data_size = _layout(arrays)
+        header = json.dumps({
+            "format_version": SHM_FORMAT_VERSION,
+            "channel": self.channel,
+            "generation": gen,
+            "created_at": time.time(),
+            "arrays": specs,
+            "meta": meta or {},
+        }).encode("utf-8")
+        base = (len(MAGIC) + 4 + len(header) + _ALIGN - 1) // _ALIGN * _ALIGN
+        name = f"{self.ctl_name}_{gen}"
+        seg = shared_memory.SharedMemory(name=name, create=True, size=max(base + data_size, 1))
+        seg.buf[:len(MAGIC)] = MAGIC
+        struct.pack_into("<I", seg.buf, len(MAGIC), len(header))
+        seg.buf[len(MAGIC) + 4:len(MAGIC) + 4 + len(header)] = header
+        for k, a in arrays.items():
+            sp = specs[k]
+            dst = np.ndarray(a.shape, dtype=np.dtype(sp["dtype"]), buffer=seg.buf, offset=base + sp["offset"])
+            dst[...] = a
+
+        # data xong mới đổi control -> worker không bao giờ thấy segment dở dang;
+        # tên trước, generation sau (xem ShmReader._read_ctl)
+        struct.pack_into("<48s", self.ctl.buf, _CTL_NAME_OFF, name.encode("ascii"))
+        struct.pack_into("<Q", self.ctl.buf, _CTL_GEN_OFF, gen)
+        self.ctl.buf[:len(MAGIC)] = MAGIC
+        self.generation = gen
+        self._live.append(seg)
+        while len(self._live) > 2:
+            old = self._live.pop(0)
+            old.close(); old.unlink()
+        return gen
+
+    def close(self, unlink: bool = True):
+        for seg in self._live:
+            seg.close()
+            if unlink:
+                seg.unlink()
+        self._live = []
+        self.ctl.close()
+        if unlink:
+            self.ctl.unlink()
+
+
+class ShmSnapshot:
+    """Một generation đã attach: `arrays` là view read-only trên shared memory."""
+
+    def __init__(self, name: str):
+        self._seg = _attach(name)
+        buf = self._seg.buf
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"segment {name}: sai magic")
+        hlen = struct.unpack_from("<I", buf, len(MAGIC))[0]
+        self.header = json.loads(bytes(buf[len(MAGIC) + 4:len(MAGIC) + 4 + hlen]).decode("utf-8"))
+        if self.header.get("format_version") != SHM_FORMAT_VERSION:
+            raise ValueError(f"segment {name}: format_version {self.header.get('format_version')} không hỗ trợ")
+        base = (len(MAGIC) + 4 + hlen + _ALIGN - 1) // _ALIGN * _ALIGN
+        self.arrays = {}
+        for k, sp in self.header["arrays"].items():
+            a = np.ndarray(tuple(sp["shape"]), dtype=np.dtype(sp["dtype"]), buffer=buf, offset=base + sp["offset"])
+            a.flags.writeable = False
+            self.arrays[k] = a
+
+    @property
+    def generation(self) -> int:
+        return int(self.header["generation"])
+
+    @property
+    def meta(self) -> dict:
+        return self.header.get("meta", {})
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._seg.size)
+
+
+class ShmReader:
+    """Đọc control segment của một channel; `current()` attach lại khi generation đổi."""
+
+    def __init__(self, channel: str, prefix: str = SHM_PREFIX):
+        self.ctl_name = f"{prefix}_{channel}"
+        self.ctl = _attach(self.ctl_name)
+        self.snapshot = None
+        self.stale_reads = 0              # lần không attach được generation mới, dùng snapshot cũ
+        self._lock = threading.Lock()
+
+    def _read_ctl(self):
+        """(generation, tên segment) nhất quán: gen, tên, gen lại; lệch thì đọc lại."""
+        for _ in range(_CTL_RETRIES):
+            magic, gen, raw = struct.unpack_from(_CTL_FMT, self.ctl.buf, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{self.ctl_name}: chưa được publish")
+            name = raw.rstrip(b"\0").decode("ascii", "replace")
+            if struct.unpack_from("<Q", self.ctl.buf, _CTL_GEN_OFF)[0] == gen and name == f"{self.ctl_name}_{gen}":
+                return int(gen), name
+            time.sleep(0)
+        raise ValueError(f"{self.ctl_name}: control đang được ghi")
+
+    def generation(self) -> int:
+        return self._read_ctl()[0]
+
+    def current(self) -> ShmSnapshot:
+        """
+        Snapshot mới nhất. Segment vừa bị publisher unlink (đã qua 2 generation) ->
+        đọc lại control và thử lại; vẫn lỗi thì phục vụ tiếp snapshot cũ thay vì
+        ném lỗi trong request (chỉ ném khi chưa có snapshot nào).
+        """
+        err = None
+        for _ in range(_ATTACH_RETRIES):
+            try:
+                gen, name = self._read_ctl()
+                snap = self.snapshot
+                if snap is not None and snap.generation == gen:
+                    return snap
+                with self._lock:
+                    if self.snapshot is None or self.snapshot.generation != gen:
+                        # giữ tham chiếu snapshot cũ: view numpy trên nó có thể còn đang được dùng
+                        self.snapshot = ShmSnapshot(name)
+                    return self.snapshot
+            except (FileNotFoundError, ValueError) as e:
+                err = e
+        if self.snapshot is None:
+            raise err
+        self.stale_reads += 1
+        return self.snapshot
+
+
+def wait_for_channel(channel: str, timeout: float = SHM_ATTACH_TIMEOUT, prefix: str = SHM_PREFIX) -> ShmReader:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            r = ShmReader(channel, prefix)
+            r.current()
+            return r
+        except (FileNotFoundError, ValueError):
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.5)
+
+
+# ---------- index / fresh payloads ----------
+def index_arrays(df: pd.DataFrame, X_all: np.ndarray, var_ids: np.ndarray) -> dict:
+    arrays, spec = frame_to_arrays(df, "df")
+    arrays["X_ALL"] = np.ascontiguousarray(X_all, dtype=np.float64)
+    arrays["VAR_IDS"] = np.ascontiguousarray(var_ids, dtype=np.int64)
+    return arrays, {"df": spec}
+
+
+def fresh_arrays(fresh_df: pd.DataFrame, meta: dict, version: int, tag: str = None):
+    arrays, spec = frame_to_arrays(fresh_df, "fresh")
+    mdf = pd.DataFrame([{"product_id": pid, **m} for pid, m in meta.items()])
+    m_arrays, m_spec = frame_to_arrays(mdf, "meta")
+    arrays.update(m_arrays)
+    return arrays, {"fresh": spec, "product_meta": m_spec, "pool_version": int(version), "pool_tag": tag}
+
+
+def attach_index(timeout: float = SHM_ATTACH_TIMEOUT):
+    """(DF, X_ALL, VAR_IDS, snapshot) từ channel "index"; X_ALL / VAR_IDS là view trên shm."""
+    snap = wait_for_channel("index", timeout).current()
+    df = arrays_to_frame(snap.arrays, snap.meta["df"])
+    return df, snap.arrays["X_ALL"], snap.arrays["VAR_IDS"], snap
+
+
+class ShmFreshPool:
+    """Thay FreshPool trong worker: đọc pool + meta đã chấm điểm từ channel "fresh"."""
+
+    def __init__(self, timeout: float = SHM_ATTACH_TIMEOUT):
+        self.reader = wait_for_channel("fresh", timeout)
+        self._gen = None
+        self.df = pd.DataFrame()
+        self.meta = {}
+        self.version = 0
+        self.tag = None
+        self.refreshes = 0
+        self._sync()
+
+    def _sync(self):
+        snap = self.reader.current()
+        if snap.generation == self._gen:
+            return
+        df = arrays_to_frame(snap.arrays, snap.meta["fresh"])
+        mdf = arrays_to_frame(snap.arrays, snap.meta["product_meta"])
+        mdf = mdf.astype(object).where(mdf.notna(), None)          # NaN -> null trong JSON
+        meta = {int(r.pop("product_id")): r for r in mdf.to_dict("records")} if not mdf.empty else {}
+        self.df, self.meta, self.version = df, meta, snap.generation
+        self.tag = snap.meta.get("pool_tag") or f"gen-{snap.generation}"
+        self._gen = snap.generation
+        self.refreshes += 1
+
+    def get(self) -> pd.DataFrame:
+        self._sync()
+        return self.df
+
+    def candidates_for(self, base_variation_id: int) -> pd.DataFrame:
+        df = self.get()
+        if df.empty:
+            return df
+        df = df.loc[df["variation_id"] != int(base_variation_id)]
+        return df.iloc[:FRESH_LIMIT].reset_index(drop=True)
+
+    def meta_for(self, product_id: int):
+        return self.meta.get(int(product_id))
+
+    def stats(self) -> dict:
+        return {
+            "mode": "shm",
+            "version": self.version,
+            "items": int(self.df.shape[0]),
+            "meta_products": len(self.meta),
+            "refreshes": self.refreshes,
+            "segment_bytes": self.reader.snapshot.nbytes if self.reader.snapshot else 0,
+            "stale_reads": self.reader.stale_reads,
+        }
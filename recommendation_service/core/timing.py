@@ -0,0 +1,84 @@
+"""
+Thời gian từng stage của một request -> header `Server-Timing`
+(ví dụ `base;dur=0.05, knn;dur=0.41, fresh;dur=0.20, merge;dur=0.08, total;dur=1.1`, đơn vị ms).
+
+app.py gọi `begin()` đầu mỗi request; recommend_core đánh dấu stage bằng
+`laps().lap(name)`. Ngoài request (warmup, loadtest in-process) không có dict
+nên lap() không ghi gì.
+
+`note(**kw)` ghi thuộc tính của request (nhánh đã đi, số ứng viên, ...) cho
+trace log request chậm (core/tracelog.py).
+"""
+import time
+from contextvars import ContextVar
+
+_STAGES = ContextVar("recs_stages", default=None)
+_NOTES = ContextVar("recs_notes", default=None)
+
+
+def begin() -> dict:
+    d = {}
+    _STAGES.set(d)
+    _NOTES.set({})
+    return d
+
+
+def current():
+    return _STAGES.get()
+
+
+def notes():
+    return _NOTES.get()
+
+
+def note(**kw):
+    n = _NOTES.get()
+    if n is not None:
+        n.update(kw)
+
+
+def note_default(key: str, value):
+    """Chỉ ghi nếu chưa có (vd. request chờ chung kết quả: recommend_core chạy ở thread khác)."""
+    n = _NOTES.get()
+    if n is not None:
+        n.setdefault(key, value)
+
+
+def mark(name: str, seconds: float = 0.0):
+    d = _STAGES.get()
+    if d is not None:
+        d[name] = d.get(name, 0.0) + seconds
+
+
+class laps:
+    """Đồng hồ bấm giờ: mỗi lap(name) cộng thời gian từ lap trước vào stage `name`."""
+    __slots__ = ("d", "t")
+
+    def __init__(self):
+        self.d = _STAGES.get()
+        self.t = time.perf_counter()
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        if self.d is not None:
+            self.d[name] = self.d.get(name, 0.0) + (now - self.t)
+        self.t = now
+
+
+def header(d: dict) -> str:
+    return ", ".join(f"{k};dur={v * 1e3:.3f}" for k, v in d.items())
+
+
+def parse_header(value: str) -> dict:
+    """Server-Timing -> {stage: ms} (loadtest.py dùng)."""
+    out = {}
+    for part in (value or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        for p in rest.split(";"):
+            k, _, v = p.strip().partition("=")
+            if name and k == "dur":
+                try:
+                    out[name] = float(v)
+                except ValueError:
+                    pass
+    return out
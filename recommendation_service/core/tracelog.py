@@ -0,0 +1,115 @@
+"""
+Trace log cho request chậm (RECS_SLOW_LOG_MS, 0 = tắt).
+
+Request có tổng thời gian vượt ngưỡng được ghi một dòng JSON vào
+RECS_SLOW_LOG_PATH: endpoint, status, variation_id, nhánh đã đi (indexed /
+delta / db-miss / spec / cache / coalesced), kích thước fresh pool, số ứng viên
+(knn / delta / fresh), thời gian từng stage (ms, như Server-Timing) và cờ degraded.
+
+Thread request chỉ đưa record vào queue (`put_nowait`, không encode, không I/O);
+QueueListener ở thread nền encode JSON và ghi qua RotatingFileHandler
+(RECS_SLOW_LOG_MAX_BYTES mỗi file, giữ RECS_SLOW_LOG_BACKUPS file). Queue đầy
+thì bỏ record và đếm vào "dropped" thay vì chặn request.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from .config import SLOW_LOG_MS, SLOW_LOG_PATH, SLOW_LOG_MAX_BYTES, SLOW_LOG_BACKUPS, SLOW_LOG_QUEUE
+
+ENABLED = SLOW_LOG_MS > 0
+_THRESHOLD = SLOW_LOG_MS / 1e3
+_LOGGER = logging.getLogger("recs.slow")
+_LOGGER.propagate = False
+_lock = threading.Lock()
+_handler = None
+_listener = None
+_error = None                           # lỗi mở file log (trace log bị tắt), báo qua stats()
+
+
+class _DropQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.recorded = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record                   # encode ở thread listener
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.recorded += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        # RotatingFileHandler gọi format() hai lần (kiểm tra rollover + ghi): không sửa record.msg
+        r = dict(record.msg)
+        r["stages_ms"] = {k: round(v * 1e3, 3) for k, v in r["stages_ms"].items()}
+        r["ts"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        return json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def start():
+    """Mở file log + thread ghi (idempotent). Lỗi mở file -> tắt trace log, không làm hỏng app."""
+    global _handler, _listener, _error
+    if not ENABLED:
+        return
+    with _lock:
+        if _listener is not None:
+            return
+        try:
+            if os.path.dirname(SLOW_LOG_PATH):
+                os.makedirs(os.path.dirname(SLOW_LOG_PATH), exist_ok=True)
+            fh = logging.handlers.RotatingFileHandler(SLOW_LOG_PATH, maxBytes=SLOW_LOG_MAX_BYTES,
+                                                      backupCount=SLOW_LOG_BACKUPS, encoding="utf-8", delay=True)
+        except OSError as e:
+            _error = f"{type(e).__name__}: {e}"
+            return
+        fh.setFormatter(_JsonFormatter())
+        _handler = _DropQueueHandler(queue.Queue(maxsize=SLOW_LOG_QUEUE))
+        _listener = logging.handlers.QueueListener(_handler.queue, fh)
+        _listener.start()
+        atexit.register(stop)
+
+
+def stop():
+    """Ghi nốt các record còn trong queue rồi dừng thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for h in _listener.handlers:
+                h.close()
+            _listener = None
+
+
+def record(endpoint: str, status: int, total: float, stages: dict, notes: dict, degraded=()) -> bool:
+    """Đưa request vào trace log nếu total (giây) vượt ngưỡng. True nếu đã ghi."""
+    h = _handler
+    if h is None or total < _THRESHOLD:
+        return False
+    msg = {"endpoint": endpoint, "status": status, "total_ms": round(total * 1e3, 3),
+           **(notes or {}), "stages_ms": stages, "degraded": list(degraded)}
+    h.handle(_LOGGER.makeRecord(_LOGGER.name, logging.WARNING, "", 0, msg, None, None))
+    return True
+
+
+def stats() -> dict:
+    h = _handler
+    return {
+        "enabled": h is not None,
+        "threshold_ms": SLOW_LOG_MS,
+        "path": SLOW_LOG_PATH,
+        "recorded": h.recorded if h else 0,
+        "dropped": h.dropped if h else 0,
+        "queued": h.queue.qsize() if h else 0,
+        "error": _error,
+    }
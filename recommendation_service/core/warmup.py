@@ -0,0 +1,150 @@
+"""
+Warmup trước khi service báo ready:
+  1) mở connection DB (pool); DB chưa lên thì thử lại mỗi RECS_READY_DB_RETRY_SEC,
+  2) pre-touch lookup_cpu_raw / lookup_gpu_raw cho mọi processor / GPU trong catalog,
+  3) fetch + chấm điểm fresh pool / meta sản phẩm,
+  4) replay top-N variation_id hay được hỏi nhất (từ access_freq.json) vào result cache.
+
+Ready (`readiness()`, GET /readyz) = artifact đã load + kiểm tra nhất quán,
+DB đã kết nối (hoặc không cấu hình DATABASE_URL) và warmup đã chạy xong.
+Bước 1 chạy cả khi RECS_WARMUP=false.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+from .config import WARMUP, WARMUP_TOP_N, ACCESS_FREQ_PATH, ACCESS_FLUSH_SEC, READY_DB_RETRY_SEC, ENGINE
+from .bench import lookup_cpu_raw, lookup_gpu_raw
+from .db import ping_db
+
+
+class AccessLog:
+    """Đếm tần suất variation_id, ghi định kỳ ra file JSON (atomic) để lần khởi động sau dùng."""
+
+    def __init__(self, path: str = ACCESS_FREQ_PATH, flush_sec: float = ACCESS_FLUSH_SEC):
+        self.path = path
+        self.flush_sec = flush_sec
+        self.counts = Counter(self._load())
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f).get("counts", {})
+            return {int(k): int(v) for k, v in raw.items()}
+        except Exception:
+            return {}
+
+    def record(self, var_id: int):
+        with self._lock:
+            self.counts[int(var_id)] += 1
+            self._dirty = True
+
+    def top(self, n: int) -> list:
+        with self._lock:
+            return [vid for vid, _ in self.counts.most_common(n)]
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {"updated_at": int(time.time()), "counts": {str(k): v for k, v in self.counts.items()}}
+            self._dirty = False
+        try:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_sec)
+            self.flush()
+
+    def start(self):
+        if self._thread is None and self.flush_sec > 0:
+            self._thread = threading.Thread(target=self._loop, name="access-log-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+
+ACCESS_LOG = AccessLog()
+
+WARMUP_STATE = {"state": "pending" if WARMUP else "skipped", "db": "pending" if ENGINE is not None else "disabled"}
+
+
+def _lookup_keys(col) -> set:
+    # cùng key với calculate_perf_from_mapping_or_rule: str(row.get(...)) trên dòng DB, NULL -> "None"
+    # (cột category của DF trả NaN cho giá trị thiếu, kể cả sau astype(object))
+    return {"None" if v is None or v != v else str(v) for v in col.astype(object).unique()}
+
+
+def warm_bench_lookups(df) -> int:
+    names = 0
+    for name in _lookup_keys(df["processor"]):
+        lookup_cpu_raw(name); names += 1
+    for name in _lookup_keys(df["graphics_card"]):
+        lookup_gpu_raw(name); names += 1
+    return names
+
+
+def connect_db(retry_sec: float = READY_DB_RETRY_SEC) -> bool:
+    """Chờ tới khi mở được connection DB (pool sẵn sàng cho request đầu tiên)."""
+    if ENGINE is None:
+        return False
+    attempts = 0
+    WARMUP_STATE["db"] = "connecting"
+    while True:
+        attempts += 1
+        WARMUP_STATE["db_attempts"] = attempts
+        if ping_db():
+            WARMUP_STATE["db"] = "ok"
+            return True
+        time.sleep(retry_sec)
+
+
+def run_warmup(top_n: int = WARMUP_TOP_N):
+    from .recommend import DF, FRESH_POOL
+    from .service import recommend
+
+    t0 = time.perf_counter()
+    WARMUP_STATE.update(state="running")
+    try:
+        bench_names = warm_bench_lookups(DF)
+        connect_db()
+        FRESH_POOL.get()
+        replayed = 0
+        for vid in ACCESS_LOG.top(top_n):
+            recommend(vid, track=False)
+            replayed += 1
+        WARMUP_STATE.update(state="done", bench_names=bench_names, replayed=replayed)
+    except Exception as e:
+        WARMUP_STATE.update(state="failed", error=str(e))
+    WARMUP_STATE["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+def start_warmup():
+    ACCESS_LOG.start()
+    threading.Thread(target=run_warmup if WARMUP else connect_db, name="warmup", daemon=True).start()
+
+
+def readiness() -> dict:
+    """{tên check: True/False} cho /readyz."""
+    from .recommend import ARTIFACT_ERRORS
+    return {
+        "artifacts": not ARTIFACT_ERRORS,
+        "db": WARMUP_STATE["db"] in ("ok", "disabled"),
+        # warmup lỗi không chặn traffic vĩnh viễn: chỉ là chạy nguội
+        "warmup": WARMUP_STATE["state"] in ("done", "skipped", "failed"),
+    }
+
+
+def is_ready() -> bool:
+    return all(readiness().values())
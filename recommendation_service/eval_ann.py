@@ -0,0 +1,79 @@
+"""
+Đánh giá IVF so với exact: recall@K và latency theo từng nprobe.
+
+    python eval_ann.py                         # dùng artifacts hiện tại
+    python eval_ann.py --synthetic 1000000     # catalog giả lập
+    python eval_ann.py --nprobe 1,2,4,8,16 --k 25 --queries 500
+"""
+import argparse
+import time
+import numpy as np
+from core.config import XALL_PATH, IVF_PATH, IVF_NLIST
+from core.index import ExactIndex
+from core.ivf import IVFIndex, build_ivf, load_ivf
+
+
+def _timed(fn, queries, k):
+    res, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, idx = fn(q, k)
+        lat.append(time.perf_counter() - t0)
+        res.append(idx[0])
+    return res, np.array(lat) * 1e3
+
+
+def _fmt(lat):
+    return f"{lat.mean():8.3f} {np.percentile(lat, 50):8.3f} {np.percentile(lat, 99):8.3f}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--xall", default=XALL_PATH)
+    ap.add_argument("--ivf", default=IVF_PATH, help="artifact IVF; không có thì build trong bộ nhớ")
+    ap.add_argument("--synthetic", type=int, default=0, help="N item ngẫu nhiên thay cho artifacts")
+    ap.add_argument("--nlist", type=int, default=IVF_NLIST)
+    ap.add_argument("--nprobe", default="1,2,4,8,16,32")
+    ap.add_argument("--k", type=int, default=25)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        # giá lệch phải (log-normal), perf gần chuẩn — gần với phân bố catalog thật
+        price = rng.lognormal(0.0, 0.5, args.synthetic)
+        perf = np.clip(rng.normal(0.5, 0.18, args.synthetic), 0, 1)
+        X = np.column_stack([(price - price.min()) / np.ptp(price), perf])
+        art = None
+    else:
+        X = np.load(args.xall)
+        art = load_ivf(args.ivf)
+
+    t0 = time.perf_counter()
+    if art is None or args.synthetic or args.nlist:
+        art = build_ivf(X, nlist=args.nlist, seed=args.seed)
+    build_s = time.perf_counter() - t0
+
+    # query = các item trong catalog, có jitter nhỏ
+    qi = rng.choice(X.shape[0], size=min(args.queries, X.shape[0]), replace=False)
+    queries = X[qi] + rng.normal(0, 0.01, (qi.shape[0], 2))
+
+    exact = ExactIndex(X)
+    truth, lat_exact = _timed(exact.kneighbors, queries, args.k)
+    ivf = IVFIndex(X, art)
+
+    print(f"N={X.shape[0]} nlist={ivf.nlist} K={args.k} queries={len(queries)} build={build_s:.2f}s")
+    print(f"{'engine':>12} {'recall@K':>9} {'mean_ms':>8} {'p50_ms':>8} {'p99_ms':>8}")
+    print(f"{'exact':>12} {1.0:9.4f} {_fmt(lat_exact)}")
+    for p in [int(x) for x in args.nprobe.split(",") if x.strip()]:
+        if p > ivf.nlist:
+            continue
+        got, lat = _timed(lambda q, k: ivf.kneighbors(q, k, nprobe=p), queries, args.k)
+        recall = np.mean([len(set(a.tolist()) & set(b.tolist())) / max(len(a), 1)
+                          for a, b in zip(truth, got)])
+        print(f"{'ivf/' + str(p):>12} {recall:9.4f} {_fmt(lat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Export gợi ý cho toàn catalog ra file (NDJSON hoặc bin, xem core/export.py).
+
+    python export_recs.py --out recs.ndjson
+    python export_recs.py --format bin --out recs.bin --shards 8 --workers 8   # recs.bin.part-00000 ...
+    python export_recs.py --shard 3 --shards 8 --out -                        # một shard ra stdout
+
+Mỗi worker là một process riêng (kNN + rerank tốn CPU, không chia được qua GIL);
+với RECS_SHM_MODE=attach các worker dùng chung index trên shared memory.
+"""
+import argparse
+import multiprocessing as mp
+import sys
+import time
+from core.config import EXPORT_BATCH
+
+
+def export_shard(fmt, out, shard=None, shards=None, batch=EXPORT_BATCH, min_id=None, max_id=None):
+    from core.export import export_stream
+    t0 = time.perf_counter()
+    nbytes = 0
+    f = sys.stdout.buffer if out == "-" else open(out, "wb")
+    try:
+        for chunk in export_stream(fmt, min_id=min_id, max_id=max_id, shard=shard, shards=shards, batch=batch):
+            f.write(chunk)
+            nbytes += len(chunk)
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+    return out, nbytes, time.perf_counter() - t0
+
+
+def _run(job):
+    return export_shard(**job)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--format", choices=["ndjson", "bin"], default="ndjson")
+    ap.add_argument("--out", required=True, help="file đích, '-' = stdout")
+    ap.add_argument("--shards", type=int, default=0, help="chia theo khoảng id; > 1 thì ghi <out>.part-NNNNN")
+    ap.add_argument("--shard", type=int, default=None, help="chỉ chạy shard này (các máy khác chạy shard còn lại)")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--batch", type=int, default=EXPORT_BATCH)
+    ap.add_argument("--min-id", type=int)
+    ap.add_argument("--max-id", type=int)
+    args = ap.parse_args()
+    if args.shards < 0:
+        ap.error("--shards phải >= 0")
+    if args.shard is not None:
+        if args.shards < 1:
+            ap.error("--shard cần --shards N")
+        if not 0 <= args.shard < args.shards:
+            ap.error(f"--shard phải trong [0, {args.shards - 1}]")
+
+    base = {"fmt": args.format, "batch": args.batch, "min_id": args.min_id, "max_id": args.max_id}
+    if args.shard is not None or args.shards <= 1:
+        shards = args.shards or None
+        jobs = [{**base, "out": args.out, "shard": (args.shard or 0) if shards else None, "shards": shards}]
+    else:
+        jobs = [{**base, "out": f"{args.out}.part-{i:05d}", "shard": i, "shards": args.shards}
+                for i in range(args.shards)]
+
+    t0 = time.perf_counter()
+    if args.workers > 1 and len(jobs) > 1:
+        with mp.Pool(min(args.workers, len(jobs))) as pool:
+            results = pool.map(_run, jobs)
+    else:
+        results = [_run(j) for j in jobs]
+    for out, nbytes, secs in results:
+        print(f"{out}: {nbytes} bytes in {secs:.2f}s", file=sys.stderr)
+    print(f"==> {len(results)} file(s) in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
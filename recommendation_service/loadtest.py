@@ -0,0 +1,427 @@
+"""
+Load test cho /recommend: replay phân bố variation_id (ghi lại hoặc giả lập),
+trộn id có trong index, id chỉ có trong DB (DB-miss) và id không tồn tại (404).
+
+    # service đang chạy (Postgres local); DB-miss id tự cung cấp
+    python loadtest.py --url http://localhost:8000 --requests 5000 --concurrency 16 --miss-ids @miss.txt
+
+    # app + DB giả lập chạy ở process con (không cần Postgres)
+    python loadtest.py --standin --requests 5000 --concurrency 16
+    python loadtest.py --standin --ids artifacts/access_freq.json --rate 300 --duration 30
+
+    # so sánh hai build: chạy app của một checkout khác, lưu report rồi so
+    python loadtest.py --standin --app-dir ../build_a/recommendation_service --out a.json
+    python loadtest.py --standin --out b.json
+    python loadtest.py --compare a.json b.json
+
+--rate > 0: open loop, request thứ i được lên lịch ở t0 + i/rate và latency
+tính từ thời điểm lên lịch (không bị coordinated omission); --rate 0: closed
+loop, mỗi worker gửi liên tục. Stage timing phía server đọc từ header
+Server-Timing (RECS_SERVER_TIMING=true).
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+import numpy as np
+
+NOTFOUND_BASE = 900_000_000
+EXPECTED = {"indexed": 200, "miss": 200, "notfound": 404}
+
+
+# ---------------------------------------------------------------- stand-in DB
+class StandInDB:
+    """
+    Thay các hàm của core/db.py bằng bảng trong bộ nhớ dựng từ artifacts:
+    catalog đã index + `n_miss` biến thể "mới" (chưa có trong index, đồng thời
+    là fresh pool). Mỗi lần gọi ngủ `latency_ms` để giả lập round trip DB.
+    """
+
+    COLUMNS = ["variation_id", "product_id", "product_name", "processor", "ram",
+               "storage", "graphics_card", "price"]
+
+    def __init__(self, df, n_miss: int = 200, latency_ms: float = 2.0, seed: int = 0):
+        import pandas as pd
+        rng = np.random.default_rng(seed)
+        base = df[[c for c in self.COLUMNS if c in df.columns]].copy()
+        extra = base.iloc[rng.integers(0, len(base), n_miss)].copy()
+        extra["variation_id"] = int(base["variation_id"].max()) + 1 + np.arange(n_miss)
+        extra["price"] = (extra["price"].astype(float) * rng.uniform(0.9, 1.1, n_miss)).round(-3)
+        now = pd.Timestamp.now(tz="UTC")
+        base["ts"] = now - pd.Timedelta(days=365)
+        extra["ts"] = now - pd.to_timedelta(rng.uniform(0, 30, n_miss), unit="D")
+        self.rows = pd.concat([base, extra], ignore_index=True).set_index("variation_id", drop=False)
+        self.miss_ids = extra["variation_id"].astype(int).tolist()
+        self.latency = latency_ms / 1000.0
+        self.calls = Counter()
+
+    def _wait(self, name):
+        self.calls[name] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def ping_db(self):
+        self._wait("ping")
+        return True
+
+    def fetch_one_variation_from_db(self, variation_id):
+        self._wait("one")
+        r = self.rows[self.rows["variation_id"] == int(variation_id)]
+        return r[self.COLUMNS].reset_index(drop=True)
+
+    def fetch_variations_from_db(self, variation_ids):
+        self._wait("many")
+        r = self.rows[self.rows["variation_id"].isin([int(x) for x in variation_ids])]
+        return r[self.COLUMNS].reset_index(drop=True)
+
+    def fetch_fresh_items_from_db(self, exclude_variation_ids=None, limit=200):
+        self._wait("fresh")
+        r = self.rows
+        if exclude_variation_ids:
+            r = r[~r["variation_id"].isin(exclude_variation_ids)]
+        return r.sort_values("ts", ascending=False).head(int(limit)).reset_index(drop=True)
+
+    def fetch_product_meta_from_db(self, product_ids):
+        import pandas as pd
+        self._wait("meta")
+        r = self.rows[self.rows["product_id"].isin([int(x) for x in product_ids])]
+        r = r.drop_duplicates("product_id")
+        return pd.DataFrame({
+            "product_id": r["product_id"].to_numpy(),
+            "product_name": r["product_name"].to_numpy(),
+            "slug": [f"p-{int(p)}" for p in r["product_id"]],
+            "rating_average": 4.5,
+            "thumbnail_url": None,
+            "image_url": [f"/img/{int(p)}.jpg" for p in r["product_id"]],
+        })
+
+    def install(self):
+        """Phải gọi trước khi import core.recommend / app (chúng import hàm theo tên)."""
+        import core.db as db
+        for name in ("ping_db", "fetch_one_variation_from_db", "fetch_variations_from_db",
+                     "fetch_fresh_items_from_db", "fetch_product_meta_from_db"):
+            setattr(db, name, getattr(self, name))
+
+
+def serve_standin(port: int, n_miss: int, latency_ms: float, seed: int):
+    """Process con: app.py của thư mục hiện tại + StandInDB, in `READY <port> <miss ids>`."""
+    sys.path.insert(0, os.getcwd())
+    os.environ["DATABASE_URL"] = ""
+    os.environ.setdefault("RECS_ACCESS_FREQ_PATH", os.path.join(tempfile.gettempdir(), "recs_loadtest_access.json"))
+    import pandas as pd
+    from core.config import DF_PATH
+    db = StandInDB(pd.read_pickle(DF_PATH), n_miss=n_miss, latency_ms=latency_ms, seed=seed)
+    db.install()
+    from werkzeug.serving import make_server
+    from app import app
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    srv = make_server("127.0.0.1", port, app, threaded=True)
+    print("READY", srv.server_port, ",".join(map(str, db.miss_ids)), flush=True)
+    sys.stdout = open(os.devnull, "w")          # parent chỉ đọc dòng READY, tránh đầy pipe
+    srv.serve_forever()
+
+
+def start_standin(args):
+    app_dir = os.path.abspath(args.app_dir)
+    cmd = [sys.executable, "-W", "ignore", os.path.abspath(__file__), "--serve-standin",
+           "--port", "0", "--standin-miss", str(args.standin_miss),
+           "--standin-latency-ms", str(args.standin_latency_ms), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, cwd=app_dir, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().split()
+    if not line or line[0] != "READY":
+        proc.kill()
+        raise SystemExit("stand-in server không khởi động được")
+    url = f"http://127.0.0.1:{line[1]}"
+    miss = [int(x) for x in line[2].split(",")] if len(line) > 2 and line[2] else []
+    return proc, url, miss
+
+
+def wait_ready(url: str, timeout: float = 120.0):
+    """Chờ /health 200 (và warmup xong nếu build có trường `ready`)."""
+    u = urlparse(url)
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        try:
+            c = http.client.HTTPConnection(u.hostname, u.port, timeout=5)
+            c.request("GET", "/health")
+            r = c.getresponse()
+            body = json.loads(r.read() or b"{}")
+            c.close()
+            if r.status == 200 and body.get("ready", True):
+                return
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} chưa sẵn sàng sau {timeout:.0f}s")
+
+
+# ---------------------------------------------------------------- workload
+def _id_list(spec: str):
+    if not spec:
+        return []
+    if spec.startswith("@"):
+        with open(spec[1:], encoding="utf-8") as f:
+            return [int(x) for x in f.read().split() if x.strip()]
+    return [int(x) for x in spec.split(",") if x.strip()]
+
+
+def _parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        k, _, v = part.partition("=")
+        if k.strip():
+            mix[k.strip()] = float(v)
+    unknown = set(mix) - set(EXPECTED)
+    if unknown:
+        raise SystemExit(f"--mix: loại không hợp lệ {sorted(unknown)} (indexed|miss|notfound)")
+    return mix
+
+
+def build_workload(args, indexed_ids, miss_ids, rng):
+    """-> list[(variation_id, class)] độ dài args.requests (duration mode thì lặp vòng)."""
+    indexed_set = set(indexed_ids)
+    miss_set = set(miss_ids)
+
+    def cls(v):
+        return "indexed" if v in indexed_set else "miss" if v in miss_set else "notfound"
+
+    n = args.requests
+    if args.ids:
+        if args.ids.endswith(".json"):                       # access log (core/warmup.py)
+            with open(args.ids, encoding="utf-8") as f:
+                counts = {int(k): int(v) for k, v in json.load(f).get("counts", {}).items()}
+            ids = np.array(list(counts), dtype=np.int64)
+            p = np.array([counts[i] for i in ids], dtype=float)
+            seq = rng.choice(ids, size=n, p=p / p.sum()).tolist()
+        else:                                                # một id mỗi dòng, replay theo thứ tự
+            rec = _id_list("@" + args.ids)
+            seq = [rec[i % len(rec)] for i in range(n)]
+        return [(v, cls(v)) for v in seq]
+
+    mix = _parse_mix(args.mix)
+    if mix.get("miss", 0) > 0 and not miss_ids:
+        raise SystemExit("mix có DB-miss nhưng không có id: dùng --standin hoặc --miss-ids")
+    kinds = list(mix)
+    p = np.array([mix[k] for k in kinds], dtype=float)
+    picks = rng.choice(len(kinds), size=n, p=p / p.sum())
+
+    idx_arr = np.asarray(indexed_ids, dtype=np.int64)
+    if args.zipf > 0:                                        # vài sản phẩm "hot" chiếm phần lớn traffic
+        w = 1.0 / np.arange(1, idx_arr.size + 1) ** args.zipf
+        idx_arr = idx_arr[rng.permutation(idx_arr.size)]
+        hot = rng.choice(idx_arr, size=n, p=w / w.sum())
+    else:
+        hot = rng.choice(idx_arr, size=n)
+    miss_arr = np.asarray(miss_ids or [0], dtype=np.int64)
+    out = []
+    for j, k in enumerate(picks):
+        kind = kinds[k]
+        if kind == "indexed":
+            out.append((int(hot[j]), kind))
+        elif kind == "miss":
+            out.append((int(rng.choice(miss_arr)), kind))
+        else:
+            out.append((NOTFOUND_BASE + int(rng.integers(0, 1_000_000)), kind))
+    return out
+
+
+# ---------------------------------------------------------------- runner
+def run_load(url, workload, concurrency, rate, duration, path, timeout):
+    u = urlparse(url)
+    results = []
+    lock = threading.Lock()
+    counter = itertools.count()
+    n = len(workload)
+    t0 = time.perf_counter()
+    t_stop = t0 + duration if duration > 0 else float("inf")
+
+    def worker():
+        conn = http.client.HTTPConnection(u.hostname, u.port, timeout=timeout)
+        local = []
+        while True:
+            i = next(counter)
+            if duration <= 0 and i >= n:
+                break
+            vid, kind = workload[i % n]
+            intended = t0 + i / rate if rate > 0 else None
+            now = time.perf_counter()
+            if intended is not None and intended > now:
+                time.sleep(intended - now)
+            if time.perf_counter() >= t_stop:
+                break
+            sent = time.perf_counter()
+            status, st, err = None, "", None
+            try:
+                conn.request("GET", path.format(id=vid))
+                r = conn.getresponse()
+                r.read()
+                status, st = r.status, r.getheader("Server-Timing", "")
+                if r.getheader("Connection", "").lower() == "close":
+                    conn.close()
+            except (OSError, http.client.HTTPException) as e:
+                err = type(e).__name__
+                conn.close()
+            done = time.perf_counter()
+            local.append((kind, status, err, (done - (intended or sent)) * 1e3, (done - sent) * 1e3, st))
+        conn.close()
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - t0
+
+
+def _pcts(a) -> dict:
+    a = np.asarray(a, dtype=float)
+    if a.size == 0:
+        return {}
+    return {"mean": float(a.mean()), "p50": float(np.percentile(a, 50)), "p90": float(np.percentile(a, 90)),
+            "p99": float(np.percentile(a, 99)), "p999": float(np.percentile(a, 99.9)), "max": float(a.max())}
+
+
+def summarize(results, wall: float) -> dict:
+    from core.timing import parse_header
+    by_kind = defaultdict(list)
+    for r in results:
+        by_kind[r[0]].append(r)
+
+    def block(rs):
+        status = Counter("error" if r[2] else str(r[1]) for r in rs)
+        bad = sum(1 for r in rs if r[2] or r[1] != EXPECTED[r[0]])
+        errors = sum(1 for r in rs if r[2] or (r[1] or 0) >= 500)
+        return {"requests": len(rs), "status": dict(status),
+                "error_rate": errors / max(len(rs), 1), "unexpected_rate": bad / max(len(rs), 1),
+                "latency_ms": _pcts([r[3] for r in rs]), "service_ms": _pcts([r[4] for r in rs])}
+
+    stages = defaultdict(list)
+    for r in results:
+        for k, v in parse_header(r[5]).items():
+            stages[k].append(v)
+    return {
+        "wall_s": wall,
+        "throughput_rps": len(results) / wall if wall > 0 else 0.0,
+        "all": block(results),
+        "by_class": {k: block(v) for k, v in sorted(by_kind.items())},
+        "server_stages_ms": {k: {**_pcts(v), "count": len(v)} for k, v in stages.items()},
+    }
+
+
+def print_report(s: dict):
+    a = s["all"]
+    print(f"requests={a['requests']} wall={s['wall_s']:.2f}s throughput={s['throughput_rps']:.1f} req/s "
+          f"errors={a['error_rate']:.2%} unexpected={a['unexpected_rate']:.2%}")
+    print(f"{'class':>10} {'n':>7} {'err%':>6} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  status")
+    for k, b in [("all", a)] + list(s["by_class"].items()):
+        lat = b["latency_ms"]
+        if not lat:
+            continue
+        print(f"{k:>10} {b['requests']:7d} {b['error_rate'] * 100:6.2f} {lat['mean']:8.2f} {lat['p50']:8.2f} "
+              f"{lat['p90']:8.2f} {lat['p99']:8.2f} {lat['max']:8.2f}  {b['status']}")
+    if s["server_stages_ms"]:
+        print(f"{'stage':>10} {'count':>7} {'mean':>8} {'p50':>8} {'p99':>8}   (Server-Timing, ms)")
+        for k, v in s["server_stages_ms"].items():
+            print(f"{k:>10} {v['count']:7d} {v['mean']:8.3f} {v['p50']:8.3f} {v['p99']:8.3f}")
+
+
+def compare(path_a: str, path_b: str):
+    with open(path_a, encoding="utf-8") as f:
+        A = json.load(f)["summary"]
+    with open(path_b, encoding="utf-8") as f:
+        B = json.load(f)["summary"]
+
+    rows = [("throughput_rps", A["throughput_rps"], B["throughput_rps"]),
+            ("error_rate", A["all"]["error_rate"], B["all"]["error_rate"])]
+    for k in ("mean", "p50", "p90", "p99", "max"):
+        rows.append((f"latency.{k}", A["all"]["latency_ms"].get(k), B["all"]["latency_ms"].get(k)))
+    for cls in sorted(set(A["by_class"]) | set(B["by_class"])):
+        a = A["by_class"].get(cls, {}).get("latency_ms", {})
+        b = B["by_class"].get(cls, {}).get("latency_ms", {})
+        rows.append((f"{cls}.p99", a.get("p99"), b.get("p99")))
+    for st in sorted(set(A["server_stages_ms"]) | set(B["server_stages_ms"])):
+        rows.append((f"stage.{st}.mean", A["server_stages_ms"].get(st, {}).get("mean"),
+                     B["server_stages_ms"].get(st, {}).get("mean")))
+
+    print(f"{'metric':>22} {'A':>12} {'B':>12} {'B/A':>8}")
+    for name, a, b in rows:
+        fa = f"{a:12.3f}" if a is not None else f"{'-':>12}"
+        fb = f"{b:12.3f}" if b is not None else f"{'-':>12}"
+        ratio = f"{b / a:8.3f}" if a and b is not None else f"{'-':>8}"
+        print(f"{name:>22} {fa} {fb} {ratio}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", help="service đang chạy, vd http://localhost:8000")
+    ap.add_argument("--standin", action="store_true", help="chạy app + DB giả lập ở process con")
+    ap.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                    help="thư mục recommendation_service của build cần đo (với --standin)")
+    ap.add_argument("--standin-miss", type=int, default=200, help="số biến thể chỉ có trong DB giả lập")
+    ap.add_argument("--standin-latency-ms", type=float, default=2.0)
+    ap.add_argument("--path", default="/recommend/{id}")
+    ap.add_argument("--ids", help="access_freq.json (lấy mẫu theo tần suất) hoặc file id mỗi dòng (replay)")
+    ap.add_argument("--mix", default="indexed=0.85,miss=0.1,notfound=0.05")
+    ap.add_argument("--zipf", type=float, default=1.1, help="độ lệch popularity của id indexed, 0 = đều")
+    ap.add_argument("--miss-ids", default="", help="DB-miss id: 1,2,3 hoặc @file (với --url)")
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--duration", type=float, default=0, help="giây; > 0 thì chạy theo thời gian")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--rate", type=float, default=0, help="req/s tổng (open loop), 0 = closed loop")
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="lưu report JSON (để --compare)")
+    ap.add_argument("--compare", nargs=2, metavar=("A", "B"))
+    ap.add_argument("--serve-standin", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve_standin:
+        return serve_standin(args.port, args.standin_miss, args.standin_latency_ms, args.seed)
+    if args.compare:
+        return compare(*args.compare)
+    if not (args.url or args.standin):
+        ap.error("cần --url hoặc --standin")
+
+    import pandas as pd
+    df_path = os.path.join(args.app_dir, "artifacts", "products_df_from_db.pkl")
+    indexed_ids = pd.read_pickle(df_path)["variation_id"].astype(int).tolist()
+
+    proc = None
+    try:
+        if args.standin:
+            proc, url, miss_ids = start_standin(args)
+        else:
+            url, miss_ids = args.url.rstrip("/"), _id_list(args.miss_ids)
+        wait_ready(url)
+        rng = np.random.default_rng(args.seed)
+        workload = build_workload(args, indexed_ids, miss_ids, rng)
+        results, wall = run_load(url, workload, args.concurrency, args.rate, args.duration, args.path, args.timeout)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    summary = summarize(results, wall)
+    print(f"target={url} concurrency={args.concurrency} rate={args.rate or 'closed-loop'}")
+    print_report(summary)
+    if args.out:
+        cfg = {k: v for k, v in vars(args).items() if k not in ("compare", "serve_standin", "port")}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"config": cfg, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+-- Change feed cho recommendation_service (core/changefeed.py).
+-- Mỗi thay đổi của product_variations (và tên sản phẩm) gửi NOTIFY trên kênh
+-- 'recs_variation_changes' với payload JSON:
+--   {"op": "INSERT|UPDATE|DELETE", "variation_id": 123}
+--   {"op": "PRODUCT", "product_id": 45}
+-- Áp dụng:  psql "$DATABASE_URL" -f migrations/001_recs_variation_notify.sql
+-- Tên kênh cố định, phải trùng CHANGEFEED_CHANNEL trong core/config.py.
+
+CREATE OR REPLACE FUNCTION recs_notify_variation_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.price         IS NOT DISTINCT FROM OLD.price
+       AND NEW.is_available  IS NOT DISTINCT FROM OLD.is_available
+       AND NEW.product_id    IS NOT DISTINCT FROM OLD.product_id
+       AND NEW.processor     IS NOT DISTINCT FROM OLD.processor
+       AND NEW.ram           IS NOT DISTINCT FROM OLD.ram
+       AND NEW.storage       IS NOT DISTINCT FROM OLD.storage
+       AND NEW.graphics_card IS NOT DISTINCT FROM OLD.graphics_card THEN
+        RETURN NULL;    -- cột không ảnh hưởng tới recommend (stock, updated_at, ...)
+    END IF;
+
+    PERFORM pg_notify('recs_variation_changes', json_build_object(
+        'op', TG_OP,
+        'variation_id', CASE WHEN TG_OP = 'DELETE' THEN OLD.variation_id ELSE NEW.variation_id END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS recs_variation_change ON product_variations;
+CREATE TRIGGER recs_variation_change
+    AFTER INSERT OR UPDATE OR DELETE ON product_variations
+    FOR EACH ROW EXECUTE FUNCTION recs_notify_variation_change();
+
+CREATE OR REPLACE FUNCTION recs_notify_product_change() RETURNS trigger AS $$
+BEGIN
+    IF NEW.product_name IS DISTINCT FROM OLD.product_name THEN
+        PERFORM pg_notify('recs_variation_changes', json_build_object(
+            'op', 'PRODUCT', 'product_id', NEW.product_id
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS recs_product_change ON products;
+CREATE TRIGGER recs_product_change
+    AFTER UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION recs_notify_product_change();
@@ -0,0 +1,110 @@
+"""
+Phục vụ một shard của index theo khoảng giá cho coordinator (RECS_SHARDS_MODE=remote).
+
+    python shard_server.py --shard 0 --port 8101 [--dir artifacts/shards]
+
+Endpoint (JSON):
+    GET  /health  -> {"shard", "items", "x_digest", "scaler", "tombstones"}
+    POST /knn     {"q": [x, y], "n": n, "exclude": product_id|null} -> {"d", "rows", "scaler", "tombstones"}
+    POST /dead    {"rows": [dòng X_ALL, ...]}   (tombstone từ change feed của coordinator)
+    POST /rescale {"data_min", "data_max", "scale", "min"}   (scaler mới của coordinator) -> {"x_min", "x_max"}
+    POST /reset   {"scaler": {...}|null, "rows": [...]}   (coordinator push lại toàn bộ state) -> {"x_min", "x_max"}
+
+"scaler" (digest, "artifact" = X gốc) + "tombstones" là state của shard; state
+chỉ nằm trong bộ nhớ, restart thì coordinator thấy lệch và gọi /reset.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.config import SHARDS_DIR
+from core.shards import ShardIndex, load_manifest, load_shard, scaler_from_payload
+
+
+class ShardState:
+    def __init__(self, i: int, shards_dir: str):
+        manifest = load_manifest(shards_dir)
+        if manifest is None:
+            raise SystemExit(f"không có manifest trong {shards_dir} (chạy build_shards.py)")
+        self.shard, self.x_digest = i, manifest["x_digest"]
+        self.index = ShardIndex(load_shard(i, shards_dir, manifest))
+        self.lock = threading.Lock()
+
+
+def make_handler(state: ShardState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"           # keep-alive cho coordinator
+
+        def _send(self, code: int, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"null")
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send(404, {"error": "not found"})
+            idx = state.index
+            self._send(200, {"shard": state.shard, "items": len(idx), "x_digest": state.x_digest, **idx.state})
+
+        def do_POST(self):
+            try:
+                body = self._body()
+                if self.path == "/knn":
+                    idx = state.index
+                    d, rows = idx.query(body["q"], int(body["n"]), body.get("exclude"))
+                    return self._send(200, {"d": d.tolist(), "rows": rows.tolist(), **idx.state})
+                if self.path == "/dead":
+                    with state.lock:
+                        state.index.set_dead(body["rows"])
+                    return self._send(200, {"ok": True})
+                if self.path == "/rescale":
+                    scaler = scaler_from_payload(body)
+                    if scaler is None:
+                        raise ValueError("thiếu scaler")
+                    with state.lock:
+                        state.index = state.index.rescaled(scaler)
+                    x_min, x_max = state.index.x_bounds
+                    return self._send(200, {"ok": True, "x_min": x_min, "x_max": x_max})
+                if self.path == "/reset":
+                    scaler = scaler_from_payload(body["scaler"])
+                    with state.lock:
+                        state.index = state.index.reset(scaler, body["rows"])
+                    x_min, x_max = state.index.x_bounds
+                    return self._send(200, {"ok": True, "x_min": x_min, "x_max": x_max})
+                self._send(404, {"error": "not found"})
+            except (KeyError, TypeError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shard", type=int, required=True)
+    ap.add_argument("--port", type=int, default=8101)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--dir", default=SHARDS_DIR)
+    args = ap.parse_args()
+
+    state = ShardState(args.shard, args.dir)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"shard {args.shard}: {len(state.index)} items on :{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Loader cho chế độ shared memory (RECS_SHM_MODE=attach ở các worker).
+
+Đọc artifacts một lần, publish channel "index" (DF + X_ALL + VAR_IDS), sau đó
+refresh fresh pool + meta sản phẩm từ DB mỗi RECS_FRESH_TTL_SEC và publish
+channel "fresh" khi nội dung đổi. Chạy một process / host:
+
+    python shm_loader.py
+"""
+import signal
+import sys
+import time
+import numpy as np
+from core.config import DF_PATH, XALL_PATH, VARIDS_PATH, FRESH_TTL_SEC
+from core.catalog import load_catalog
+from core.fresh import FreshPool
+from core.shm import ShmPublisher, index_arrays, fresh_arrays
+
+
+def main():
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    df = load_catalog(DF_PATH)
+    X = np.load(XALL_PATH)
+    var_ids = np.load(VARIDS_PATH)
+
+    index_pub = ShmPublisher("index")
+    fresh_pub = ShmPublisher("fresh")
+    try:
+        arrays, meta = index_arrays(df, X, var_ids)
+        gen = index_pub.publish(arrays, meta)
+        print(f"==> index: {df.shape[0]} items, generation {gen}")
+
+        pool = FreshPool(df["variation_id"].to_numpy(), df["product_id"].to_numpy())
+        published = None
+        while True:
+            pool.refresh()
+            if pool.version != published:
+                arrays, meta = fresh_arrays(pool.df, pool.meta, pool.version, pool.tag)
+                gen = fresh_pub.publish(arrays, meta)
+                published = pool.version
+                print(f"==> fresh: {pool.df.shape[0]} items, {len(pool.meta)} meta, generation {gen}")
+            time.sleep(max(FRESH_TTL_SEC, 1.0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        index_pub.close()
+        fresh_pub.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Sweep offline các tham số xếp hạng: RECS_ALPHA_PRICE, RECS_BETA_PERF,
+RECS_PRICE_JUMP_LAMBDA, RECS_RECENCY_GAMMA, RECS_RECENCY_HALFLIFE.
+
+    python sweep_params.py --alpha 0.4,0.5,0.6,0.7 --lam 0:1:0.2 --workers 8 --out sweep.csv
+    python sweep_params.py --fresh-db --gamma 0,0.12,0.3 --halflife 7,21,60
+    python sweep_params.py --synthetic 200000 --queries 5000 --alpha 0.5,0.6
+
+Artifacts (catalog, X_ALL, scaler) được load một lần; mỗi điểm của grid tính gợi
+ý cho toàn catalog (mỗi biến thể làm query, như /recommend nhánh indexed) theo
+batch: min d2 theo product bằng `np.minimum` qua từng lớp biến thể (lớp k =
+biến thể thứ k của mỗi product, product xếp theo số biến thể giảm dần), top
+TOPK+KNN_MARGIN product, sim có phạt nhảy giá + recency boost cho fresh pool,
+merge + dedup theo product — cùng công thức / thứ tự hoà với recommend_core.
+Các điểm của grid chạy song song trên nhiều process.
+
+Chỉ số (so với điểm baseline, mặc định = config hiện tại):
+    overlap@K   : tỉ lệ product trùng với top-K của baseline
+    top1        : tỉ lệ query có gợi ý đầu tiên giống baseline
+    drift       : (giá gợi ý - giá gốc) / giá gốc, trung bình có dấu / |.| / p90 |.|
+    up          : tỉ lệ gợi ý đắt hơn biến thể gốc
+    perf_gap    : |performance_score gợi ý - gốc| trung bình
+    coverage    : số product khác nhau được gợi ý / số product
+    fresh       : tỉ lệ item đến từ fresh pool
+Recency chỉ tác động lên fresh pool (--fresh-db hoặc --fresh FILE.pkl); không
+có fresh pool thì gamma / halflife không đổi kết quả.
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from core.config import (ALPHA, BETA, LAMBDA_PRICE_JUMP, RECENCY_GAMMA, RECENCY_HALFLIFE,
+                         TOPK, KNN_MARGIN, FRESH_LIMIT, DF_PATH, XALL_PATH)
+
+PARAMS = ("alpha", "beta", "lam", "gamma", "halflife")
+_DATA = None            # artifacts + kết quả baseline, load ở process cha (fork dùng chung)
+
+
+# ---------------------------------------------------------------- data
+def _synthetic(n: int, seed: int):
+    """Catalog giả lập như eval_ann.py: giá log-normal, perf gần chuẩn, ~3 biến thể / product."""
+    rng = np.random.default_rng(seed)
+    price = np.round(rng.lognormal(np.log(25e6), 0.5, n), -4)
+    perf = np.clip(rng.normal(55, 18, n), 1, 100).round(2)
+    return pd.DataFrame({"variation_id": np.arange(n, dtype=np.int64),
+                         "product_id": rng.integers(0, max(1, n // 3), n).astype(np.int64),
+                         "price": price, "performance_score": perf})
+
+
+def _fresh_frame(args, indexed_ids):
+    if args.fresh:
+        fdf = pd.read_pickle(args.fresh)
+    elif args.fresh_db:
+        from core.db import fetch_fresh_items_from_db
+        from core.fresh import score_fresh_pool
+        raw = fetch_fresh_items_from_db(limit=FRESH_LIMIT)
+        if raw is None:
+            raise SystemExit("--fresh-db: lỗi DB khi lấy fresh pool")
+        fdf = score_fresh_pool(raw, indexed_ids)
+    else:
+        return None
+    if fdf is None or fdf.empty:
+        return None
+    return fdf.iloc[:FRESH_LIMIT].reset_index(drop=True)
+
+
+def load_data(args) -> dict:
+    from core.scaler import load_scaler, MinMaxParams
+    if args.synthetic:
+        df = _synthetic(args.synthetic, args.seed)
+        scaler = MinMaxParams.from_bounds(df[["price", "performance_score"]].min().to_numpy(),
+                                          df[["price", "performance_score"]].max().to_numpy())
+        X = scaler.transform(df[["price", "performance_score"]].values)
+    else:
+        from core.catalog import load_catalog
+        df = load_catalog(DF_PATH)
+        scaler = load_scaler()
+        X = np.load(XALL_PATH)
+    fdf = _fresh_frame(args, df["variation_id"].to_numpy())
+
+    pids = df["product_id"].to_numpy(np.int64)
+    f_pids = fdf["product_id"].to_numpy(np.int64) if fdf is not None else np.empty(0, np.int64)
+    all_pids, codes = np.unique(np.concatenate([pids, f_pids]), return_inverse=True)
+    codes, f_codes = codes[:pids.shape[0]], codes[pids.shape[0]:]     # product (catalog + fresh), để dedup
+    # kNN: product của catalog xếp theo số biến thể giảm dần; lớp k = biến thể thứ k của mỗi
+    # product có > k biến thể (tiền tố liên tục) -> min theo product bằng np.minimum từng lớp
+    _, cat_codes = np.unique(pids, return_inverse=True)
+    counts = np.bincount(cat_codes)
+    by_count = np.argsort(-counts, kind="stable")
+    rank_of_code = np.empty_like(by_count)
+    rank_of_code[by_count] = np.arange(by_count.shape[0])
+    order = np.argsort(rank_of_code[cat_codes], kind="stable")    # giữ thứ tự dòng trong product
+    cs = counts[by_count]
+    starts = np.concatenate([[0], np.cumsum(cs)[:-1]])
+    k = np.arange(cs.max())
+    pad = np.where(k[None, :] < cs[:, None], order[np.minimum(starts[:, None] + k[None, :], order.shape[0] - 1)], -1)
+    X = np.asarray(X, dtype=np.float64)
+    layers = [np.ascontiguousarray(X[pad[:int((cs > j).sum()), j]]) for j in k]
+
+    q_rows = np.arange(df.shape[0])
+    if args.queries and args.queries < df.shape[0]:
+        q_rows = np.sort(np.random.default_rng(args.seed).choice(df.shape[0], args.queries, replace=False))
+    prices = df["price"].to_numpy(np.float64)
+    perfs = df["performance_score"].to_numpy(np.float64)
+    data = {
+        "X": X, "prices": prices, "perfs": perfs,
+        "codes": codes, "cat_codes": cat_codes, "n_codes": int(all_pids.shape[0]),
+        "layers": layers, "pad": pad, "rank_of_code": rank_of_code,
+        "Q": scaler.transform(np.column_stack([prices[q_rows], perfs[q_rows]])), "q_rows": q_rows,
+        "fresh": None, "block": args.block,
+    }
+    if fdf is not None:
+        ages = np.zeros(fdf.shape[0])
+        if "ts" in fdf.columns:
+            ages = (pd.Timestamp.utcnow() - pd.to_datetime(fdf["ts"], utc=True)).dt.total_seconds() / (3600 * 24)
+            ages = np.clip(ages.to_numpy(dtype=np.float64), 0, 3650)
+        data["fresh"] = {"X": scaler.transform(fdf[["price", "performance_score"]].values),
+                         "prices": fdf["price"].to_numpy(np.float64),
+                         "perfs": fdf["performance_score"].to_numpy(np.float64),
+                         "codes": f_codes, "ages": ages}
+    return data
+
+
+# ---------------------------------------------------------------- batched recommend
+def _knn_block(D, Q, rows_q, alpha, beta, n):
+    """Top-n product (khác product gốc) cho block query: (rows (B,n) dòng catalog, hợp lệ (B,n))."""
+    def d2(X):
+        dp = X[None, :, 0] - Q[:, 0:1]
+        df = X[None, :, 1] - Q[:, 1:2]
+        return alpha * dp * dp + beta * df * df
+
+    layers = D["layers"]
+    mins = d2(layers[0])
+    for L in layers[1:]:
+        m = L.shape[0]
+        np.minimum(mins[:, :m], d2(L), out=mins[:, :m])
+    mins = mins[:, D["rank_of_code"]]                      # cột theo product code như ProductGroupedIndex
+    B = Q.shape[0]
+    mins[np.arange(B), D["cat_codes"][rows_q]] = np.inf     # bỏ product gốc
+    n = min(n, mins.shape[1] - 1)
+    if n <= 0:
+        return np.empty((B, 0), np.int64), np.empty((B, 0), bool)
+    top = np.argpartition(mins, n - 1, axis=1)[:, :n]
+    top = np.take_along_axis(top, np.argsort(np.take_along_axis(mins, top, 1), axis=1, kind="stable"), 1)
+    valid = np.isfinite(np.take_along_axis(mins, top, 1))
+    # biến thể gần nhất của mỗi product được chọn (hoà: dòng đứng trước trong catalog)
+    cand = D["pad"][D["rank_of_code"][top]]                 # (B,n,G)
+    Xc = D["X"][np.maximum(cand, 0)]
+    dp = Xc[..., 0] - Q[:, None, 0:1]
+    df = Xc[..., 1] - Q[:, None, 1:2]
+    dc = np.where(cand >= 0, alpha * dp * dp + beta * df * df, np.inf)
+    rows = np.take_along_axis(cand, dc.argmin(2)[..., None], 2)[..., 0]
+    return rows, valid
+
+
+def _sims(Q, q_price, X, prices, alpha, beta, lam, ages=None, gamma=0.0, halflife=1.0):
+    """core.recency.candidate_sims cho (B, C) ứng viên (X, prices: (B,C,...) hoặc (C,...))."""
+    dp = Q[:, 0:1] - X[..., 0]
+    df = Q[:, 1:2] - X[..., 1]
+    d = np.sqrt(alpha * dp * dp + beta * df * df)
+    qp = q_price[:, None]
+    pen = np.where((prices > qp) & (qp > 0), lam * ((prices - qp) / np.where(qp > 0, qp, 1.0)), 0.0)
+    sim = 1.0 / (1e-6 + d * (1.0 + pen))
+    if ages is not None and gamma > 0:
+        sim = sim * (1.0 + gamma * np.exp(-ages / max(halflife, 1e-6)))
+    return sim
+
+
+def recommend_all(D, p: dict, topk: int = TOPK):
+    """(codes (M,K) product gợi ý, -1 = thiếu; price (M,K); perf (M,K); fresh (M,K) bool) cho mọi query."""
+    Q, q_rows = D["Q"], D["q_rows"]
+    M, n = Q.shape[0], int(topk) + KNN_MARGIN
+    out_c = np.full((M, topk), -1, np.int64)
+    out_p = np.full((M, topk), np.nan)
+    out_f = np.full((M, topk), np.nan)
+    out_fr = np.zeros((M, topk), bool)
+    fr = D["fresh"]
+    kb = D["block"] or max(1, (1 << 19) // max(D["X"].shape[0], 1))
+    for s in range(0, M, kb):
+        Qb, rb = Q[s:s + kb], q_rows[s:s + kb]
+        B = Qb.shape[0]
+        qp = D["prices"][rb]
+        rows, valid = _knn_block(D, Qb, rb, p["alpha"], p["beta"], n)
+        sims = [np.where(valid, _sims(Qb, qp, D["X"][rows], D["prices"][rows], p["alpha"], p["beta"], p["lam"]), -np.inf)]
+        cand_c = [D["codes"][rows]]
+        cand_p, cand_f = [D["prices"][rows]], [D["perfs"][rows]]
+        if fr is not None:
+            sims.append(_sims(Qb, qp, fr["X"][None], fr["prices"][None], p["alpha"], p["beta"], p["lam"],
+                              fr["ages"][None], p["gamma"], p["halflife"]))
+            F = fr["codes"].shape[0]
+            cand_c.append(np.broadcast_to(fr["codes"], (B, F)))
+            cand_p.append(np.broadcast_to(fr["prices"], (B, F)))
+            cand_f.append(np.broadcast_to(fr["perfs"], (B, F)))
+        S = np.concatenate(sims, axis=1)
+        C = np.concatenate(cand_c, axis=1)
+        is_fresh = np.zeros(S.shape, bool)
+        is_fresh[:, rows.shape[1]:] = True
+        # heapq.merge(indexed, fresh) theo sim giảm dần: hoà thì indexed trước, trong stream giữ thứ tự
+        o = np.argsort(-S, axis=1, kind="stable")
+        S, C = np.take_along_axis(S, o, 1), np.take_along_axis(C, o, 1)
+        P = np.take_along_axis(np.concatenate(cand_p, axis=1), o, 1)
+        Fp = np.take_along_axis(np.concatenate(cand_f, axis=1), o, 1)
+        is_fresh = np.take_along_axis(is_fresh, o, 1)
+        # dedup theo product (lần xuất hiện đầu), bỏ product gốc, lấy TOPK đầu
+        keys = (np.arange(B)[:, None] * D["n_codes"] + C).ravel()
+        first = np.zeros(keys.shape[0], bool)
+        first[np.unique(keys, return_index=True)[1]] = True
+        keep = first.reshape(B, -1) & np.isfinite(S) & (C != D["codes"][rb][:, None])
+        rank = np.cumsum(keep, axis=1)
+        keep &= rank <= topk
+        bi, ci = np.nonzero(keep)
+        pos = rank[bi, ci] - 1
+        out_c[s + bi, pos] = C[bi, ci]
+        out_p[s + bi, pos] = P[bi, ci]
+        out_f[s + bi, pos] = Fp[bi, ci]
+        out_fr[s + bi, pos] = is_fresh[bi, ci]
+    return out_c, out_p, out_f, out_fr
+
+
+# ---------------------------------------------------------------- metrics
+def metrics(D, res, base) -> dict:
+    codes, price, perf, fresh = res
+    valid = codes >= 0
+    K = codes.shape[1]
+    q_price = D["prices"][D["q_rows"]][:, None]
+    q_perf = D["perfs"][D["q_rows"]][:, None]
+    drift = np.where(valid & (q_price > 0), (price - q_price) / np.where(q_price > 0, q_price, 1.0), np.nan)
+    b = base[0]
+    same = ((codes[:, :, None] == b[:, None, :]) & valid[:, :, None]).any(2)
+    n_valid = max(int(valid.sum()), 1)
+    return {
+        f"overlap@{K}": round(float(same.sum(1).mean() / K), 4),
+        "top1": round(float((codes[:, 0] == b[:, 0]).mean()), 4),
+        "drift_mean": round(float(np.nanmean(drift)), 4) if valid.any() else None,
+        "drift_abs": round(float(np.nanmean(np.abs(drift))), 4) if valid.any() else None,
+        "drift_p90": round(float(np.nanpercentile(np.abs(drift), 90)), 4) if valid.any() else None,
+        "up": round(float((valid & (price > q_price)).sum() / n_valid), 4),
+        "perf_gap": round(float(np.nanmean(np.where(valid, np.abs(perf - q_perf), np.nan))), 3) if valid.any() else None,
+        "coverage": round(float(np.unique(codes[valid]).shape[0] / D["n_codes"]), 4),
+        "fresh": round(float(fresh.sum() / n_valid), 4),
+    }
+
+
+# ---------------------------------------------------------------- sweep
+def _init(args):
+    global _DATA
+    if _DATA is None:               # spawn (không fork): mỗi worker load một lần
+        _DATA = load_data(args)
+        _DATA["base"] = recommend_all(_DATA, args.baseline)
+
+
+def run_point(p: dict) -> dict:
+    t0 = time.perf_counter()
+    res = recommend_all(_DATA, p)
+    secs = time.perf_counter() - t0
+    return {**p, **metrics(_DATA, res, _DATA["base"]), "seconds": round(secs, 3)}
+
+
+def _values(spec: str, default: float) -> list:
+    """"0.4,0.6" hoặc "start:stop:step" (gồm stop)."""
+    if not spec:
+        return [default]
+    if ":" in spec:
+        a, b, step = (float(x) for x in spec.split(":"))
+        return [round(v, 10) for v in np.arange(a, b + step / 2, step)]
+    return [float(x) for x in spec.split(",") if x.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--alpha", default="", help=f"RECS_ALPHA_PRICE (hiện tại {ALPHA})")
+    ap.add_argument("--beta", default="", help=f"RECS_BETA_PERF (hiện tại {BETA})")
+    ap.add_argument("--lam", default="", help=f"RECS_PRICE_JUMP_LAMBDA (hiện tại {LAMBDA_PRICE_JUMP})")
+    ap.add_argument("--gamma", default="", help=f"RECS_RECENCY_GAMMA (hiện tại {RECENCY_GAMMA})")
+    ap.add_argument("--halflife", default="", help=f"RECS_RECENCY_HALFLIFE (hiện tại {RECENCY_HALFLIFE})")
+    ap.add_argument("--baseline", default="", help="alpha,beta,lam,gamma,halflife để so sánh (mặc định: config)")
+    ap.add_argument("--fresh-db", action="store_true", help="lấy fresh pool từ DB (DATABASE_URL)")
+    ap.add_argument("--fresh", default="", help="fresh pool từ file pickle (price, performance_score, product_id, ts)")
+    ap.add_argument("--synthetic", type=int, default=0, help="N biến thể ngẫu nhiên thay cho artifacts")
+    ap.add_argument("--queries", type=int, default=0, help="chỉ lấy mẫu n query (0 = toàn catalog)")
+    ap.add_argument("--block", type=int, default=0, help="số query mỗi batch (0 = auto, ma trận d2 ~4MB)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="", help="ghi kết quả ra CSV")
+    args = ap.parse_args()
+
+    defaults = (ALPHA, BETA, LAMBDA_PRICE_JUMP, RECENCY_GAMMA, RECENCY_HALFLIFE)
+    base = [float(x) for x in args.baseline.split(",")] if args.baseline else list(defaults)
+    if len(base) != len(PARAMS):
+        raise SystemExit("--baseline cần 5 giá trị: alpha,beta,lam,gamma,halflife")
+    args.baseline = dict(zip(PARAMS, base))
+    axes = [_values(getattr(args, k), d) for k, d in zip(PARAMS, defaults)]
+    grid = [dict(zip(PARAMS, v)) for v in itertools.product(*axes)]
+
+    global _DATA
+    t0 = time.perf_counter()
+    _DATA = load_data(args)
+    _DATA["base"] = recommend_all(_DATA, args.baseline)
+    load_s = time.perf_counter() - t0
+    print(f"==> {_DATA['X'].shape[0]} items, {_DATA['q_rows'].shape[0]} queries, "
+          f"fresh pool {0 if _DATA['fresh'] is None else _DATA['fresh']['codes'].shape[0]}, "
+          f"{len(grid)} grid points, load + baseline {load_s:.2f}s", file=sys.stderr)
+    if _DATA["fresh"] is None and (len(axes[3]) > 1 or len(axes[4]) > 1):
+        print("    (không có fresh pool: gamma / halflife không đổi kết quả)", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    workers = max(1, min(args.workers, len(grid)))
+    if workers > 1:
+        # fork: worker dùng chung artifacts + baseline đã load; spawn: _init load lại một lần / worker
+        with mp.Pool(workers, initializer=_init, initargs=(args,)) as pool:
+            rows = pool.map(run_point, grid, chunksize=1)
+    else:
+        rows = [run_point(p) for p in grid]
+    total = time.perf_counter() - t0
+
+    cols = list(rows[0].keys())
+    print("  ".join(f"{c:>10}" for c in cols))
+    for r in rows:
+        print("  ".join(f"{'-' if r[c] is None else r[c]:>10}" for c in cols))
+    print(f"==> {len(grid)} points in {total:.2f}s ({workers} workers)", file=sys.stderr)
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=cols)
+            w.writeheader()
+            w.writerows(rows)
+        print(f"Saved {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# chạy `python -m pytest tests` từ recommendation_service/ hay từ root repo đều import được core.*
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# test không cần Postgres: core/db.py được thay bằng StandInDB (loadtest.py)
+os.environ["DATABASE_URL"] = ""
+os.environ.setdefault("RECS_WARMUP", "false")
+os.environ.setdefault("RECS_ACCESS_FREQ_PATH", os.path.join(tempfile.gettempdir(), "recs_test_access.json"))
+
+
+@pytest.fixture(autouse=True)
+def _no_budget():
+    """Test client chạy request trong thread test: bỏ ngân sách request trước để lại."""
+    from core import deadline
+    deadline.begin()
+
+
+@pytest.fixture(scope="session")
+def standin():
+    """StandInDB không có latency; core.recommend / app chỉ được import sau fixture này."""
+    import pandas as pd
+    from core.config import DF_PATH
+    from loadtest import StandInDB
+    db = StandInDB(pd.read_pickle(DF_PATH), n_miss=50, latency_ms=0)
+    db.install()
+    return db
+
+
+@pytest.fixture(scope="session")
+def R(standin):
+    from core import recommend
+    return recommend
+
+
+@pytest.fixture(scope="session")
+def client(R):
+    from app import app
+    return app.test_client()
@@ -0,0 +1,43 @@
+"""
+apply_variation_changes (đường change feed) trên StandInDB: dòng cũ trong
+X_ALL bị tombstone, recommend phục vụ bản mới từ DELTA.
+"""
+import numpy as np
+
+
+def _ids(out):
+    return [int(x["variation_id"]) for x in out or []]
+
+
+def _row(R, i):
+    vid = int(R.DF["variation_id"].iloc[i])
+    return vid, R.ROW_OF.get(vid)
+
+
+def test_update_tombstones_old_row_and_serves_delta(R, standin, monkeypatch):
+    vid, row = _row(R, 10)
+    before, code = R.recommend_core(vid)
+    assert code == 200
+    # giá ở đầu kia của catalog (trong bounds scaler) -> láng giềng chắc chắn đổi
+    lo, mid, hi = np.quantile(R.DF_PRICES, [0.1, 0.5, 0.9])
+    new_price = float(hi if float(R.DF_PRICES[row]) < mid else lo)
+    rows = standin.rows.copy()
+    rows.loc[vid, "price"] = new_price
+    monkeypatch.setattr(standin, "rows", rows)
+
+    assert R.apply_variation_changes([vid]) == {"upserts": 1, "deletes": 0}
+    assert R.KNN_INDEX.dead[row]
+    assert float(R.DELTA.get(vid)["price"]) == new_price
+    after, code = R.recommend_core(vid)
+    assert code == 200 and _ids(after) != _ids(before)
+    assert vid not in _ids(after)
+
+
+def test_delete_tombstones_without_delta(R, standin, monkeypatch):
+    vid, row = _row(R, 11)
+    monkeypatch.setattr(standin, "rows", standin.rows.drop(index=vid))
+
+    assert R.apply_variation_changes([vid]) == {"upserts": 0, "deletes": 1}
+    assert R.KNN_INDEX.dead[row]
+    assert R.DELTA.get(vid) is None
+    assert R.recommend_core(vid) == (None, 404)
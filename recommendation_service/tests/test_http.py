@@ -0,0 +1,63 @@
+"""
+/recommend qua HTTP trên StandInDB: ETag / 304 theo fresh pool + index, và
+response degraded khi chờ fresh pool quá ngân sách (core/deadline.py).
+"""
+import threading
+import time
+
+
+def _vid(R, i):
+    return int(R.DF["variation_id"].iloc[i])
+
+
+def test_etag_304_until_pool_or_index_changes(R, standin, client, monkeypatch):
+    vid = _vid(R, 20)
+    r = client.get(f"/recommend/{vid}")
+    assert r.status_code == 200
+    tag = r.headers["ETag"]
+    r = client.get(f"/recommend/{vid}", headers={"If-None-Match": tag})
+    assert r.status_code == 304 and r.headers["ETag"] == tag
+
+    # fresh pool đổi: biến thể mới nhất đổi giá
+    rows = standin.rows.copy()
+    newest = rows["ts"].idxmax()
+    rows.loc[newest, "price"] = float(rows.loc[newest, "price"]) + 1000
+    monkeypatch.setattr(standin, "rows", rows)
+    R.FRESH_POOL.refresh()
+    r = client.get(f"/recommend/{vid}", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and r.headers["ETag"] != tag
+    tag = r.headers["ETag"]
+
+    # index đổi: change feed tombstone một biến thể khác
+    assert R.apply_variation_changes([_vid(R, 21)]) == {"upserts": 1, "deletes": 0}
+    r = client.get(f"/recommend/{vid}", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and r.headers["ETag"] != tag
+
+
+def test_fresh_wait_past_deadline_is_degraded_and_not_cached(R, standin, client, monkeypatch):
+    import app
+    from core import fresh
+    from core.service import RESULT_CACHE
+    vid = _vid(R, 30)
+    R.FRESH_POOL.get()                   # đã có pool -> quá hạn là "fresh-stale"
+    release = threading.Event()
+
+    def slow_fetch(*args, **kwargs):
+        release.wait(10)
+        return standin.fetch_fresh_items_from_db(*args, **kwargs)
+
+    monkeypatch.setattr(fresh, "fetch_fresh_items_from_db", slow_fetch)
+    monkeypatch.setattr(R.FRESH_POOL, "ttl", 0.0)
+    monkeypatch.setattr(app, "DEADLINE_MS", 50.0)
+    key = (vid, R.FRESH_POOL.version, R.index_version())
+    try:
+        r = client.get(f"/recommend/{vid}")
+    finally:
+        release.set()
+        while R.FRESH_POOL._job is not None:
+            time.sleep(0.01)
+    assert r.status_code == 200
+    assert r.headers["X-Recs-Degraded"] == "fresh-stale"
+    assert r.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in r.headers
+    assert RESULT_CACHE.get(key) is None
@@ -0,0 +1,77 @@
+"""
+Index chia shard (RECS_SHARDS_MODE=local) phải trả đúng kết quả của index
+không chia, trên artifacts thật (X_ALL lệch scaler(giá) tới ~0.09).
+"""
+import numpy as np
+import pytest
+
+from core.catalog import load_catalog
+from core.config import DF_PATH, XALL_PATH, VARIDS_PATH, SHARDS_DIR
+from core.index import build_knn_index, ProductGroupedIndex
+from core.scaler import MinMaxParams, load_scaler
+from core.shards import build_sharded_index, load_manifest
+
+
+@pytest.fixture(scope="module")
+def artifacts():
+    df = load_catalog(DF_PATH)
+    return df, np.load(XALL_PATH), np.load(VARIDS_PATH), load_scaler()
+
+
+def _indexes(artifacts, tmp_path, scaler=None):
+    df, X, var_ids, sc = artifacts
+    pids = df["product_id"].to_numpy()
+    full = ProductGroupedIndex(build_knn_index(X, "exact"), pids)
+    sh = build_sharded_index(X, var_ids, df["price"].to_numpy(), df["performance_score"].to_numpy(),
+                             pids, sc, "local", shards_dir=str(tmp_path), n_shards=4)
+    return full, sh, pids
+
+
+def _grid(step=0.01):
+    g = np.arange(0.0, 1.0 + step / 2, step)
+    return np.array([[a, b] for a in g for b in g])
+
+
+def _assert_same(full, sh, pids, queries, ns=(1, 2, 5, 10)):
+    for q in queries:
+        for n in ns:
+            for ex in (None, int(pids[0])):
+                d1, r1 = full.kneighbors_products(q, n, exclude_product=ex)
+                d2, r2 = sh.kneighbors_products(q, n, exclude_product=ex)
+                assert np.allclose(d1, d2), (q.tolist(), n, ex)
+                assert set(pids[r1[0]]) == set(pids[r2[0]]), (q.tolist(), n, ex)
+
+
+def test_manifest_x_bounds_match_x_all(artifacts):
+    df, X, var_ids, sc = artifacts
+    m = load_manifest(SHARDS_DIR)
+    assert m is not None, "artifacts/shards thiếu hoặc format cũ (chạy build_shards.py)"
+    for e in m["shards"]:
+        assert e["x_min"] <= e["x_max"]
+    lo = min(e["x_min"] for e in m["shards"])
+    hi = max(e["x_max"] for e in m["shards"])
+    assert lo == pytest.approx(X[:, 0].min()) and hi == pytest.approx(X[:, 0].max())
+
+
+def test_sharded_matches_unsharded(artifacts, tmp_path):
+    full, sh, pids = _indexes(artifacts, tmp_path)
+    _assert_same(full, sh, pids, np.vstack([[[0.41, 0.68]], _grid()]))
+
+
+def test_sharded_matches_unsharded_with_tombstones(artifacts, tmp_path):
+    full, sh, pids = _indexes(artifacts, tmp_path)
+    dead = np.arange(0, pids.shape[0], 7)
+    full.set_dead(dead)
+    sh.set_dead(dead)
+    _assert_same(full, sh, pids, _grid(0.05))
+
+
+def test_sharded_matches_unsharded_after_rescale(artifacts, tmp_path):
+    df, X, var_ids, sc = artifacts
+    full, sh, pids = _indexes(artifacts, tmp_path)
+    raw = np.column_stack([df["price"].to_numpy(), df["performance_score"].to_numpy()])
+    new = MinMaxParams.from_bounds(raw.min(axis=0) * 0.5, raw.max(axis=0) * 1.5)
+    sh = sh.rescaled(new)
+    full = ProductGroupedIndex(build_knn_index(new.transform(raw), "exact"), pids)
+    assert sh.lo.min() == pytest.approx(new.transform(raw)[:, 0].min())
+    _assert_same(full, sh, pids, _grid(0.05))
@@ -5,6 +5,11 @@ from sklearn.preprocessing import MinMaxScaler
 import joblib
 import psycopg2
 from dotenv import load_dotenv
+from core.ivf import build_ivf, save_ivf
+from core.config import SHARDS
+from core.shards import build_shards, save_shards
+from core.scaler import MinMaxParams
+from core.rules import tier_table, classify_batch, map_unique
 
 load_dotenv()
 
@@ -144,31 +149,34 @@ def best_match_score(query_str: str, bench_df: pd.DataFrame, is_cpu=True):
     return (None, None)
 
 # ---------- fallbacks ----------
-def fallback_cpu_score(cpu: str) -> int:
-    s = (cpu or "").lower()
-    if any(x in s for x in ["m3 max","m4 max","i9","ryzen 9","ultra 9"]): return 100
-    if any(x in s for x in ["m3 pro","m4 pro","i7","ryzen 7","ultra 7"]): return 80
-    if any(x in s for x in ["m3","m4","i5","ryzen 5","ultra 5"]): return 60
-    return 40
-
-def fallback_gpu_score(gpu: str) -> int:
-    s = (gpu or "").lower()
-    if any(x in s for x in ['4080','4090','5070','5080','5090','30-core','40-core']): return 100
-    if '4070' in s: return 90
-    if '4060' in s: return 85
-    if '4050' in s: return 75
-    if any(x in s for x in ['3050','2050']): return 60
-    if any(x in s for x in ['arc','14-core','16-core','18-core']): return 40
-    return 20
+TRAIN_CPU_TIERS = tier_table([
+    (100, ["m3 max","m4 max","i9","ryzen 9","ultra 9"]),
+    (80,  ["m3 pro","m4 pro","i7","ryzen 7","ultra 7"]),
+    (60,  ["m3","m4","i5","ryzen 5","ultra 5"]),
+])
+TRAIN_GPU_TIERS = tier_table([
+    (100, ['4080','4090','5070','5080','5090','30-core','40-core']),
+    (90,  ['4070']),
+    (85,  ['4060']),
+    (75,  ['4050']),
+    (60,  ['3050','2050']),
+    (40,  ['arc','14-core','16-core','18-core']),
+])
+TRAIN_STO_TIERS = tier_table([(100, ["4tb"]), (90, ["2tb"]), (80, ["1tb"]), (60, ["512gb"])])
+
+def fallback_cpu_scores(cpus) -> np.ndarray:
+    return classify_batch(cpus, TRAIN_CPU_TIERS, 40)
+
+def fallback_gpu_scores(gpus) -> np.ndarray:
+    return classify_batch(gpus, TRAIN_GPU_TIERS, 20)
 
 def score_ram(ram_str: str) -> int:
     m = re.search(r"\d+", (ram_str or "").lower())
     gb = int(m.group()) if m else 8
     return 100 if gb>=32 else 80 if gb>=18 else 70 if gb>=16 else 40
 
-def score_storage(sto_str: str) -> int:
-    s = (sto_str or "").lower()
-    return 100 if "4tb" in s else 90 if "2tb" in s else 80 if "1tb" in s else 60 if "512gb" in s else 40
+def score_storage_batch(storages) -> np.ndarray:
+    return classify_batch(storages, TRAIN_STO_TIERS, 40)
 
 # ---------- scaling ----------
 def scale_bench_to_100(series: pd.Series, method="log_p99"):
@@ -206,8 +214,11 @@ def main():
     gpu_bench = load_benchmarks(GPU_JSON_PATH, is_cpu=False)
 
     cpu_raw, gpu_raw, cpu_src, gpu_src = [], [], [], []
+    # rule fallback tính theo cột (trên giá trị unique), vòng lặp chỉ lấy ra khi cần
+    cpu_rule = fallback_cpu_scores(df["processor"]).tolist()
+    gpu_rule = fallback_gpu_scores(df["graphics_card"]).tolist()
 
-    for _, row in df.iterrows():
+    for j, (_, row) in enumerate(df.iterrows()):
         c = row.get("processor", "")
         g = row.get("graphics_card", "")
 
@@ -216,7 +227,7 @@ def main():
 
         # CPU
         if c_score is None:
-            base = fallback_cpu_score(c)
+            base = cpu_rule[j]
             m_multi = re.search(r"\b(\d+)x\b", (c or "").lower())  # hỗ trợ 2x/4x...
             if m_multi:
                 try: base *= int(m_multi.group(1))
@@ -227,7 +238,7 @@ def main():
 
         # GPU
         if g_score is None:
-            gpu_raw.append(fallback_gpu_score(g)); gpu_src.append("rule")
+            gpu_raw.append(gpu_rule[j]); gpu_src.append("rule")
         else:
             gpu_raw.append(g_score); gpu_src.append(g_label or "json-exact")
 
@@ -239,8 +250,8 @@ def main():
     # scale về 0–100 (đồng nhất & robust)
     df["cpu_score_100"] = scale_bench_to_100(df["cpu_score_raw"], method=SCALE_METHOD)
     df["gpu_score_100"] = scale_bench_to_100(df["gpu_score_raw"], method=SCALE_METHOD)
-    df["ram_score"] = df["ram"].map(score_ram)
-    df["storage_score"] = df["storage"].map(score_storage)
+    df["ram_score"] = map_unique(df["ram"], score_ram)
+    df["storage_score"] = score_storage_batch(df["storage"])
     df["performance_score"] = (
         df["cpu_score_100"]*CPU_WEIGHT +
         df["gpu_score_100"]*GPU_WEIGHT +
@@ -258,11 +269,18 @@ def main():
 
     # Lưu ARTIfacts đúng thư mục
     joblib.dump(scaler, os.path.join(ARTIFACTS_DIR, "scaler.joblib"))
+    MinMaxParams.from_sklearn(scaler).save(os.path.join(ARTIFACTS_DIR, "scaler_params.npz"))   # serving đọc file này
     df.to_pickle(os.path.join(ARTIFACTS_DIR, "products_df_from_db.pkl"))
     np.save(os.path.join(ARTIFACTS_DIR, "knn_X_all.npy"), X)
     np.save(os.path.join(ARTIFACTS_DIR, "knn_variation_ids.npy"), df["variation_id"].to_numpy(np.int64))
 
-    print(f"Saved ARTIfacts to '{ARTIFACTS_DIR}': scaler.joblib, products_df_from_db.pkl, knn_X_all.npy, knn_variation_ids.npy")
+    # IVF coarse quantizer cho RECS_INDEX_MODE=ivf
+    save_ivf(build_ivf(X), os.path.join(ARTIFACTS_DIR, "knn_ivf.npz"))
+    # shard theo khoảng giá cho RECS_SHARDS_MODE=local|remote
+    save_shards(*build_shards(X, df["variation_id"].to_numpy(np.int64), df["price"].to_numpy(), df["performance_score"].to_numpy(),
+                              df["product_id"].to_numpy(), SHARDS), os.path.join(ARTIFACTS_DIR, "shards"))
+
+    print(f"Saved ARTIfacts to '{ARTIFACTS_DIR}': scaler.joblib, scaler_params.npz, products_df_from_db.pkl, knn_X_all.npy, knn_variation_ids.npy, knn_ivf.npz, shards/")
 
 if __name__ == "__main__":
     main()
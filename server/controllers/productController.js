@@ -17,6 +17,15 @@ const { Op, Sequelize } = require("sequelize");
 const axios = require("axios");
 const BASE = process.env.RECO_API_BASE || "http://127.0.0.1:8000";
 const TIMEOUT = +(process.env.RECO_TIMEOUT_MS || 7000);
+// msgpack cho /recommend (tuỳ chọn): RECO_MSGPACK=true và đã cài @msgpack/msgpack
+let mpDecode = null;
+if (process.env.RECO_MSGPACK === "true") {
+  try {
+    mpDecode = require("@msgpack/msgpack").decode;
+  } catch (_) {
+    console.warn("RECO_MSGPACK=true nhưng chưa cài @msgpack/msgpack -> dùng JSON");
+  }
+}
 
 // helper: nhận string CSV, array, hoặc single → trả về mảng số
 const parseIdList = (input) => {
@@ -658,10 +667,21 @@ exports.getRecommendedByVariation = async (req, res) => {
 
   try {
     const resp = await axios.get(`${BASE}/recommend`, {
-      params: { variation_id: variationId },
+      params: { variation_id: variationId, include: "meta" },
       timeout: TIMEOUT,
       validateStatus: () => true, // nhận cả 4xx/5xx để đọc body
+      ...(mpDecode && {
+        headers: { Accept: "application/msgpack" },
+        responseType: "arraybuffer",
+      }),
     });
+    if (mpDecode) {
+      // lỗi (404/406...) vẫn là JSON
+      const buf = Buffer.from(resp.data);
+      resp.data = String(resp.headers["content-type"] || "").startsWith("application/msgpack")
+        ? mpDecode(buf)
+        : JSON.parse(buf.toString("utf8") || "null");
+    }
 
     if (resp.status >= 400) {
       return res.status(502).json({
@@ -705,13 +725,16 @@ exports.getRecommendedByVariation = async (req, res) => {
     }
     raw = Array.from(bestByProduct.values());
 
-    // Lấy meta từ DB cho các product_id (ảnh, slug, name)
-    const productIds = raw.map((x) => x.product_id).filter(Boolean);
-    const metaMap = await fetchProductMeta(productIds);
+    // Meta (ảnh, slug, name): Flask trả inline khi include=meta;
+    // chỉ query DB cho những product_id mà service chưa có meta
+    const missingIds = raw
+      .filter((x) => x.product_id && !x.meta)
+      .map((x) => x.product_id);
+    const metaMap = missingIds.length ? await fetchProductMeta(missingIds) : {};
 
     // Map về shape FE cần
     const products = raw.map((it) => {
-      const meta = metaMap[it.product_id] || {};
+      const meta = it.meta || metaMap[it.product_id] || {};
       return {
         id: it.product_id,                    // FE card link theo product
         variation_id: it.variation_id,        // để deep-link ?v= nếu muốn
@@ -739,6 +762,8 @@ exports.getRecommendedByVariation = async (req, res) => {
       basedOn: { variationId },
       generated_at: payload.generated_at || new Date().toISOString(),
       source: "knn",
+      // Flask hết ngân sách thời gian: chỉ có kết quả từ index (thiếu fresh)
+      ...(resp.headers["x-recs-degraded"] && { degraded: resp.headers["x-recs-degraded"] }),
     });
   } catch (e) {
     console.error("getRecommendedByVariation EX:", e);